@@ -0,0 +1,261 @@
+# Per-stage micro-benchmarks of the gaze pipeline.
+#
+# Every stage is timed separately, both as single-frame latency (the stage function called for one frame)
+# and as batched throughput (the batched version of the stage called for batch_size frames).
+# The functions are the ones the pipeline calls, i.e. the compiled kernels if numba is available (see kernels.py).
+# The median of the repeated measurements is reported, which is less sensitive to noise of microsecond stages.
+# Results are compared with a baseline stored in a JSON file, a stage fails if it is slower than its baseline
+# by more than the threshold percentage.
+#
+# Usage:
+#   python -m src.benchmark                      # compare with benchmarks/baseline.json
+#   python -m src.benchmark --update-baseline    # store the current results as the baseline
+#   python -m src.benchmark --threshold 50 --batch-size 10000
+#
+# @author: Anna Eivazi
+
+import argparse
+from collections import OrderedDict
+import json
+import math
+import os
+import sys
+import timeit
+
+import numpy as np
+
+from src.camera_rig import CameraRig
+from src.coordinate_system_transformations import transform_2D_to_3D, transform_2D_to_3D_batch
+from src.calculate_cornea_center import calculate_cornea_center, calculate_cornea_center_batch
+from src.calculate_optic_axis import calculate_optic_axis_unit_vector_fast, calculate_optic_axis_unit_vector_batch_fast
+from src.calculate_visual_axis import calculate_visual_axis_unit_vector, calculate_visual_axis_unit_vector_batch
+from src.calculate_point_of_interest import rotate_to_screen_coordinate_system, calculate_point_of_interest, \
+    intersect_gaze_rays_with_screen, get_point_of_interest, get_points_of_interest
+from src.validity import VALID
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'benchmarks', 'baseline.json')
+
+# the setup of tests/integration_test.py
+DEFAULT_CONSTANTS = {
+    'light_1_wcs': np.array([-23, 0, 0]),
+    'light_2_wcs': np.array([23, 0, 0]),
+    'camera_position_wcs': np.array([0, 0, 0]),
+    'focal_length_cm': 1.2,
+    'pixel_size_cm': (0.00048, 0.00048),
+    'principal_point': (400, 300),
+    'z_shift': -18,
+    'alpha_right': math.radians(-5),
+    'beta': math.radians(1.5),
+    'R_cm': 0.78,
+    'K_cm': 0.42,
+    'n1': 1.3375,
+    'n2': 1,
+    'distance_to_camera_cm': 52,
+    'camera_rotation': np.array([math.radians(8), 0, 0])
+}
+
+
+def create_frames(batch_size, seed=0):
+    """
+    Creates glints and pupil centers of batch_size frames scattered around the integration test frames.
+
+    :return: glints_1_ics, glints_2_ics, pupil_centers_ics, arrays of shape (batch_size, 2)
+    """
+    shifts = np.random.RandomState(seed).uniform(-10, 10, size=(batch_size, 2))
+    glints_1_ics = np.array([332, 164]) + shifts
+    glints_2_ics = np.array([322, 169]) + shifts
+    pupil_centers_ics = np.array([323, 163]) + shifts
+    return glints_1_ics, glints_2_ics, pupil_centers_ics
+
+
+def create_stages(rig, glints_1_ics, glints_2_ics, pupil_centers_ics):
+    """
+    Prepares inputs of every stage and returns OrderedDict {stage name: (single-frame call, batched call)}.
+    """
+
+    pupils_wcs = transform_2D_to_3D_batch(pupil_centers_ics, *rig.intrinsics)
+    cornea_centers = calculate_cornea_center_batch(glints_1_ics, glints_2_ics, rig=rig)
+    optic_axes = calculate_optic_axis_unit_vector_batch_fast(pupils_wcs, rig.camera_position_wcs, cornea_centers,
+                                                             rig.eye.R_cm, rig.eye.K_cm, rig.eye.n1, rig.eye.n2)
+    visual_axes = calculate_visual_axis_unit_vector_batch(optic_axes, rig.eye.alpha, rig.eye.beta)
+    cornea_centers_scs, visual_axes_scs = \
+        rotate_to_screen_coordinate_system(cornea_centers, visual_axes, rig.camera_rotation_matrix)
+    reasons = np.full(len(cornea_centers), VALID, dtype=np.uint8)
+
+    return OrderedDict([
+        ('transform_2D_to_3D',
+         (lambda: transform_2D_to_3D(*pupil_centers_ics[0], *rig.intrinsics),
+          lambda: transform_2D_to_3D_batch(pupil_centers_ics, *rig.intrinsics))),
+        ('calculate_cornea_center',
+         (lambda: calculate_cornea_center(glints_1_ics[0], glints_2_ics[0], rig=rig),
+          lambda: calculate_cornea_center_batch(glints_1_ics, glints_2_ics, rig=rig))),
+        ('calculate_optic_axis_unit_vector',
+         (lambda: calculate_optic_axis_unit_vector_fast(pupils_wcs[0], rig.camera_position_wcs, cornea_centers[0],
+                                                        rig.eye.R_cm, rig.eye.K_cm, rig.eye.n1, rig.eye.n2),
+          lambda: calculate_optic_axis_unit_vector_batch_fast(pupils_wcs, rig.camera_position_wcs, cornea_centers,
+                                                              rig.eye.R_cm, rig.eye.K_cm, rig.eye.n1, rig.eye.n2))),
+        ('calculate_visual_axis_unit_vector',
+         (lambda: calculate_visual_axis_unit_vector(optic_axes[0], rig.eye.alpha, rig.eye.beta),
+          lambda: calculate_visual_axis_unit_vector_batch(optic_axes, rig.eye.alpha, rig.eye.beta))),
+        ('rotate_to_screen_coordinate_system',
+         (lambda: rotate_to_screen_coordinate_system(cornea_centers[0], visual_axes[0], rig.camera_rotation_matrix),
+          lambda: rotate_to_screen_coordinate_system(cornea_centers, visual_axes, rig.camera_rotation_matrix))),
+        ('calculate_point_of_interest',
+         (lambda: calculate_point_of_interest(cornea_centers_scs[0], visual_axes_scs[0], rig.z_shift),
+          lambda: intersect_gaze_rays_with_screen(cornea_centers_scs, visual_axes_scs, reasons, rig.z_shift))),
+        ('end_to_end',
+         (lambda: get_point_of_interest(glints_1_ics[0], glints_2_ics[0], pupil_centers_ics[0], rig=rig),
+          lambda: get_points_of_interest(glints_1_ics, glints_2_ics, pupil_centers_ics, rig=rig))),
+    ])
+
+
+def create_timer(function, min_time=0.05):
+    """
+    Returns timeit.Timer of function and the number of calls of one measurement, which takes at least min_time.
+    """
+    timer = timeit.Timer(function)
+    single_call_s = timer.timeit(number=1)
+    number = max(1, int(min_time / single_call_s)) if single_call_s > 0 else 1000
+    return timer, number
+
+
+def measure(function, repeat, min_time=0.05):
+    """
+    Returns the median time (seconds) of one call of function over repeat measurements.
+    Every measurement runs function as many times as needed to take at least min_time.
+    """
+    timer, number = create_timer(function, min_time)
+    return float(np.median(timer.repeat(repeat=repeat, number=number))) / number
+
+
+def run_benchmarks(batch_size=1000, repeat=15, min_time=0.05, stages=None, rig=None, **kwargs):
+    """
+    Measures single-frame latency and batched throughput of the stages.
+
+    Measurements of all stages are interleaved (every round measures every stage once), so a slow period
+    of the machine affects all stages a little instead of a few stages a lot.
+
+    :param batch_size: number of frames in the batched calls
+    :param repeat: number of measurements, the median is reported
+    :param min_time: minimal duration (seconds) of one measurement
+    :param stages: names of stages to measure, by default all of them
+    :param rig: CameraRig, if not given it is created from kwargs or DEFAULT_CONSTANTS
+    :param kwargs: constants dictionary (check in integration_test.constants for an example)
+    :return: {'batch_size': ..., 'stages': {stage name: {'latency_s': ..., 'throughput_fps': ...}}}
+    """
+
+    if rig is None:
+        rig = CameraRig.from_constants(kwargs if kwargs else DEFAULT_CONSTANTS)
+
+    all_stages = create_stages(rig, *create_frames(batch_size))
+
+    # {stage name: [(timer, number, times) of the single-frame call and of the batched call]}
+    timers = OrderedDict()
+    for name, calls in all_stages.items():
+        if stages is None or name in stages:
+            timers[name] = [create_timer(call, min_time) + ([],) for call in calls]
+
+    for _ in range(repeat):
+        for stage_timers in timers.values():
+            for timer, number, times in stage_timers:
+                times.append(timer.timeit(number=number) / number)
+
+    results = OrderedDict()
+    for name, ((_, _, latencies_s), (_, _, batch_times_s)) in timers.items():
+        results[name] = {'latency_s': float(np.median(latencies_s)),
+                         'throughput_fps': batch_size / float(np.median(batch_times_s))}
+
+    return {'batch_size': batch_size, 'stages': results}
+
+
+def find_regressions(results, baseline, threshold_percent=50.):
+    """
+    Compares results of run_benchmarks with a baseline of the same format.
+
+    A stage regresses if its latency is larger, or its throughput is smaller,
+    than the baseline by more than threshold_percent. Stages missing in the baseline are skipped,
+    throughput is only compared if the baseline was measured with the same batch size.
+
+    :return: list of messages, empty if there are no regressions
+    """
+
+    factor = 1 + threshold_percent / 100.
+    regressions = []
+
+    for name, result in results['stages'].items():
+        if name not in baseline['stages']:
+            continue
+        expected = baseline['stages'][name]
+
+        if result['latency_s'] > expected['latency_s'] * factor:
+            regressions.append('{}: latency {:.3g} s, baseline {:.3g} s (+{:.0f}%)'.format(
+                name, result['latency_s'], expected['latency_s'],
+                100 * (result['latency_s'] / expected['latency_s'] - 1)))
+
+        if results['batch_size'] == baseline['batch_size'] and \
+                result['throughput_fps'] * factor < expected['throughput_fps']:
+            regressions.append('{}: throughput {:.3g} frames/s, baseline {:.3g} frames/s (-{:.0f}%)'.format(
+                name, result['throughput_fps'], expected['throughput_fps'],
+                100 * (1 - result['throughput_fps'] / expected['throughput_fps'])))
+
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(results, path):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as baseline_file:
+        json.dump(results, baseline_file, indent=2)
+        baseline_file.write('\n')
+
+
+def format_results(results):
+    lines = ['{:<40} {:>16} {:>22}'.format('stage', 'latency, us', 'throughput, frames/s')]
+    for name, result in results['stages'].items():
+        lines.append('{:<40} {:>16.2f} {:>22.0f}'.format(name, result['latency_s'] * 1e6, result['throughput_fps']))
+    return '\n'.join(lines)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Per-stage benchmarks of the gaze pipeline.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='path to the JSON baseline')
+    parser.add_argument('--update-baseline', action='store_true', help='store results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=50., help='allowed regression, percent')
+    parser.add_argument('--batch-size', type=int, default=1000, help='number of frames in batched calls')
+    parser.add_argument('--repeat', type=int, default=15, help='number of measurements per stage')
+    parser.add_argument('--stage', action='append', dest='stages', help='stage to run, can be repeated')
+    arguments = parser.parse_args(arguments)
+
+    results = run_benchmarks(batch_size=arguments.batch_size, repeat=arguments.repeat, stages=arguments.stages)
+    print(format_results(results))
+
+    if arguments.update_baseline:
+        save_baseline(results, arguments.baseline)
+        print('Baseline saved to {}'.format(arguments.baseline))
+        return 0
+
+    if not os.path.exists(arguments.baseline):
+        print('No baseline at {}, run with --update-baseline to create it'.format(arguments.baseline))
+        return 0
+
+    baseline = load_baseline(arguments.baseline)
+    if baseline['batch_size'] != results['batch_size']:
+        print('Baseline was measured with batch size {}, throughput is not compared'.format(baseline['batch_size']))
+
+    regressions = find_regressions(results, baseline, arguments.threshold)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
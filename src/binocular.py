@@ -0,0 +1,76 @@
+# Binocular processing: points of interest of both eyes in one call.
+#
+# Frames of the left and the right eye are stacked into one batch, and the eye model becomes per-frame
+# (arrays of R_cm, K_cm, alpha, ... with the parameters of the eye of every frame), so both eyes are
+# calculated by a single pass of the batched pipeline.
+#
+# @author: Anna Eivazi
+
+from collections import namedtuple
+
+import numpy as np
+
+from src.camera_rig import CameraRig, EyeModel
+from src.calculate_point_of_interest import get_points_of_interest
+
+
+# left, right, fused: arrays of shape (N, 3) with points of interest
+BinocularPointsOfInterest = namedtuple('BinocularPointsOfInterest', ['left', 'right', 'fused'])
+
+
+def stack_eye_models(eye_models, frames_counts):
+    """
+    Creates an eye model with parameters of every frame, as arrays of shape (sum(frames_counts),).
+
+    :param eye_models: list of EyeModel
+    :param frames_counts: number of frames of every eye model
+    """
+    return EyeModel(*(np.repeat(values, frames_counts) for values in zip(*eye_models)))
+
+
+def get_points_of_interest_binocular(left_eye_frames, right_eye_frames, left_eye=None, rig=None, **kwargs):
+    """
+    End-to-end calculations of N frames of both eyes in one vectorized pass.
+
+    The right eye uses rig.eye, the left eye uses left_eye, by default rig.left_eye
+    (created from the 'alpha_left' constant and the other parameters of the eye).
+    The fused point of interest is the average of both eyes, or the point of one eye if the other one is NaN.
+
+    :param left_eye_frames: glints_1_ics, glints_2_ics, pupil_centers_ics of the left eye, arrays of shape (N, 2)
+    :param right_eye_frames: glints_1_ics, glints_2_ics, pupil_centers_ics of the right eye, arrays of shape (N, 2)
+    :param left_eye: EyeModel of the left eye
+    :param rig: CameraRig, if not given it is created from kwargs
+    :param kwargs: constants dictionary (check in integration_test.constants for an example)
+    :return: BinocularPointsOfInterest
+    """
+
+    if rig is None:
+        rig = CameraRig.from_constants(kwargs)
+
+    if left_eye is None:
+        left_eye = rig.left_eye
+    if left_eye is None:
+        raise ValueError('Left eye model is not given, add alpha_left to the constants or pass left_eye')
+
+    left_eye_frames = [np.asarray(values, dtype=float) for values in left_eye_frames]
+    right_eye_frames = [np.asarray(values, dtype=float) for values in right_eye_frames]
+    frames_count = len(left_eye_frames[0])
+    if len(right_eye_frames[0]) != frames_count:
+        raise ValueError('Both eyes should have the same number of frames, got {} and {}'.format(
+            frames_count, len(right_eye_frames[0])))
+
+    glints_1_ics, glints_2_ics, pupil_centers_ics = \
+        (np.concatenate([left_values, right_values]) for left_values, right_values in zip(left_eye_frames, right_eye_frames))
+
+    binocular_rig = rig._replace(eye=stack_eye_models([left_eye, rig.eye], [frames_count, frames_count]))
+
+    points_of_interest = get_points_of_interest(glints_1_ics, glints_2_ics, pupil_centers_ics, rig=binocular_rig)
+
+    left_points_of_interest = points_of_interest[:frames_count]
+    right_points_of_interest = points_of_interest[frames_count:]
+
+    fused_points_of_interest = np.where(np.isnan(left_points_of_interest), right_points_of_interest,
+                                        np.where(np.isnan(right_points_of_interest), left_points_of_interest,
+                                                 (left_points_of_interest + right_points_of_interest)/2))
+
+    return BinocularPointsOfInterest(left_points_of_interest, right_points_of_interest, fused_points_of_interest)
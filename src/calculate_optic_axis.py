@@ -8,6 +8,8 @@
 import numpy as np
 import math
 
+from src import kernels
+
 
 def squared_magnitude(vector):
     """
@@ -25,6 +27,14 @@ def normalized(vector):
     return vector/np.linalg.norm(vector)
 
 
+def sqrt_or_nan(value):
+    """
+    Returns square root of a discriminant, or NaN if it is negative (the equation has no solution,
+    e.g. for a bad detection of the pupil), so that the frame gets NaN results instead of an exception.
+    """
+    return math.sqrt(value) if value >= 0 else math.nan
+
+
 def calculate_kr(o, v, c, R):
     """
     Calculates Kr based on Formula 3.29
@@ -51,7 +61,7 @@ def calculate_kr(o, v, c, R):
     b = np.dot(o - v, o - c)
     c = squared_magnitude(o - c) - R**2
 
-    kr = (-b - math.sqrt(b**2 - a*c))/a
+    kr = (-b - sqrt_or_nan(b**2 - a*c))/a
 
     return kr
 
@@ -97,7 +107,7 @@ def calculate_iota(o, r, c, R, n1, n2):
 
     # Formula 3.33
     eta_dot_zeta = np.dot(eta, zeta)
-    a = eta_dot_zeta - math.sqrt((n1/n2)**2 - 1 + eta_dot_zeta**2)
+    a = eta_dot_zeta - sqrt_or_nan((n1/n2)**2 - 1 + eta_dot_zeta**2)
     iota = (n2/n1)*(a*eta - zeta)
 
     return iota
@@ -123,7 +133,7 @@ def calculate_p(o, r, c, R, K, n1, n2):
 
     # Formula 3.37
     rc_dot_iota = np.dot((r - c), iota)
-    kp = -1*rc_dot_iota - math.sqrt(rc_dot_iota**2 - (R**2 - K**2))
+    kp = -1*rc_dot_iota - sqrt_or_nan(rc_dot_iota**2 - (R**2 - K**2))
 
     # Formula 3.34
     p = r + kp*iota
@@ -155,3 +165,136 @@ def calculate_optic_axis_unit_vector(pupil_wcs, camera_wcs, cornea_wcs, R, K, n1
 
     return omega
 
+
+def dot_product_batch(vectors_a, vectors_b):
+    """
+    Returns dot products of corresponding rows of two arrays of shape (N, 3).
+    """
+    return np.einsum('...i,...i->...', vectors_a, vectors_b)
+
+
+def normalized_batch(vectors):
+    """
+    Returns array of shape (N, 3) with normalized rows.
+    """
+    return vectors/np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def calculate_kr_batch(o, v, c, R):
+    """
+    Batched version of calculate_kr (Formula 3.29).
+
+    :param o: camera nodal point
+    :param v: array of shape (N, 3) with pupil centers on image
+    :param c: array of shape (N, 3) with centers of cornea curvature
+    :param R: radius of cornea curvature (scalar or array of shape (N,))
+    :return: array of shape (N,) with kr
+    """
+
+    a = dot_product_batch(o - v, o - v)
+    b = dot_product_batch(o - v, o - c)
+    c = dot_product_batch(o - c, o - c) - np.square(R)
+
+    kr = (-b - np.sqrt(b**2 - a*c))/a
+
+    return kr
+
+
+def calculate_r_batch(o, v, c, R):
+    """
+    Batched version of calculate_r (Formula 2.42).
+
+    :param o: camera nodal point
+    :param v: array of shape (N, 3) with pupil centers on image
+    :param c: array of shape (N, 3) with centers of cornea curvature
+    :param R: radius of cornea curvature (scalar or array of shape (N,))
+    :return: array of shape (N, 3) with points of refraction of pupil center
+    """
+
+    kr = calculate_kr_batch(o, v, c, R)
+    r = o + kr[:, np.newaxis] * (o - v)
+    return r
+
+
+def calculate_iota_batch(o, r, c, R, n1, n2):
+    """
+    Batched version of calculate_iota (Formulas 3.31-3.33).
+
+    :param o: camera nodal point
+    :param r: array of shape (N, 3) with pupil points of refraction
+    :param c: array of shape (N, 3) with centers of cornea curvature
+    :param R: radius of cornea curvature (scalar or array of shape (N,))
+    :param n1: effective index of refraction of the aqueous humor and cornea combined (= 1.3375, scalar or array of shape (N,))
+    :param n2: the index of refraction of air ( ≅ 1, scalar or array of shape (N,))
+    :return: array of shape (N, 3) with unit vectors in the direction of the incident rays
+    """
+
+    R = np.asarray(R, dtype=float)[..., np.newaxis]
+    n1_n2_ratio = np.asarray(n1, dtype=float)/n2
+
+    zeta = normalized_batch(o - r)
+    eta = (r - c)/R
+
+    eta_dot_zeta = dot_product_batch(eta, zeta)
+    a = eta_dot_zeta - np.sqrt(n1_n2_ratio**2 - 1 + eta_dot_zeta**2)
+    iota = (a[:, np.newaxis]*eta - zeta)/n1_n2_ratio[..., np.newaxis]
+
+    return iota
+
+
+def calculate_p_batch(o, r, c, R, K, n1, n2):
+    """
+    Batched version of calculate_p (Formulas 3.37, 3.34).
+
+    :param o: camera nodal point
+    :param r: array of shape (N, 3) with pupil points of refraction
+    :param c: array of shape (N, 3) with centers of cornea curvature
+    :param R: radius of cornea curvature (scalar or array of shape (N,))
+    :param K: distance between the center of the pupil and the center of corneal curvature (scalar or array of shape (N,))
+    :param n1: effective index of refraction of the aqueous humor and cornea combined (= 1.3375)
+    :param n2: the index of refraction of air ( ≅ 1).
+    :return: array of shape (N, 3) with pupil centers
+    """
+
+    iota = calculate_iota_batch(o, r, c, R, n1, n2)
+
+    rc_dot_iota = dot_product_batch(r - c, iota)
+    kp = -1*rc_dot_iota - np.sqrt(rc_dot_iota**2 - (np.square(R) - np.square(K)))
+
+    p = r + kp[:, np.newaxis]*iota
+
+    return p
+
+
+def calculate_optic_axis_unit_vector_batch(pupil_wcs, camera_wcs, cornea_wcs, R, K, n1, n2):
+    """
+    Batched version of calculate_optic_axis_unit_vector.
+
+    :param pupil_wcs: array of shape (N, 3) with pupil centers on image
+    :param camera_wcs: camera nodal point
+    :param cornea_wcs: array of shape (N, 3) with centers of cornea curvature
+    :param R: radius of cornea curvature (scalar or array of shape (N,))
+    :param K: distance between the center of the pupil and the center of corneal curvature (scalar or array of shape (N,))
+    :param n1: effective index of refraction of the aqueous humor and cornea combined (= 1.3375)
+    :param n2: the index of refraction of air ( ≅ 1).
+    :return: array of shape (N, 3) with unit vectors in the direction of the optic axis
+    """
+
+    pupil_point_of_reflection_wcs = calculate_r_batch(camera_wcs, pupil_wcs, cornea_wcs, R)
+
+    pupil_center_wcs = calculate_p_batch(camera_wcs, pupil_point_of_reflection_wcs, cornea_wcs, R, K, n1, n2)
+
+    #Formula 3.38
+    omega = normalized_batch(pupil_center_wcs - cornea_wcs)
+
+    return omega
+
+
+# Implementations used by the pipeline: the compiled kernels if numba is available (see kernels.py),
+# otherwise the NumPy functions above, which stay the reference.
+if kernels.COMPILED:
+    calculate_optic_axis_unit_vector_fast = kernels.optic_axis_unit_vector
+    calculate_optic_axis_unit_vector_batch_fast = kernels.optic_axis_unit_vectors
+else:
+    calculate_optic_axis_unit_vector_fast = calculate_optic_axis_unit_vector
+    calculate_optic_axis_unit_vector_batch_fast = calculate_optic_axis_unit_vector_batch
@@ -5,13 +5,20 @@
 
 # @author: Anna Eivazi
 
+import time
+
 import numpy as np
 
-from src.coordinate_system_transformations import transform_2D_to_3D
-from src.calculate_cornea_center import calculate_cornea_center
-from src.calculate_optic_axis import calculate_optic_axis_unit_vector
-from src.calculate_visual_axis import calculate_visual_axis_unit_vector
-from src.coordinate_system_transformations import transform_3D_to_3D
+from src.camera_rig import CameraRig
+from src.coordinate_system_transformations import transform_2D_to_3D, transform_2D_to_3D_batch
+from src.calculate_cornea_center import calculate_cornea_center, solve_cornea_centers_lights_wcs, \
+    solve_cornea_centers_wcs_batch_fast
+from src.calculate_optic_axis import calculate_optic_axis_unit_vector_fast, calculate_optic_axis_unit_vector_batch_fast, \
+    calculate_r_batch
+from src.calculate_visual_axis import calculate_visual_axis_unit_vector, calculate_visual_axis_unit_vector_batch
+from src.coordinate_system_transformations import transform_3D_to_3D, transform_3D_to_3D_batch
+from src.validity import VALID, MISSING_INPUT, CORNEA_NOT_CONVERGED, PUPIL_RAY_MISSES_CORNEA, PUPIL_NOT_REACHED, \
+    VISUAL_AXIS_MISSES_SCREEN
 
 
 def transform_to_screen_coordinate_system(center_of_cornea_curvature, visual_axis_unit_vector, angles_rad):
@@ -31,6 +38,23 @@ def transform_to_screen_coordinate_system(center_of_cornea_curvature, visual_axi
     return center_of_cornea_curvature_scs, visual_axis_unit_vector_scs
 
 
+def rotate_to_screen_coordinate_system(center_of_cornea_curvature, visual_axis_unit_vector, rotation_matrix):
+    """
+    Same as transform_to_screen_coordinate_system, but with a precomputed rotation matrix of the camera
+    (e.g. CameraRig.camera_rotation_matrix).
+    Works for single vectors and for arrays of shape (N, 3).
+
+    :param center_of_cornea_curvature: center of cornea curvature
+    :param visual_axis_unit_vector: unit vector of visual axis
+    :param rotation_matrix: 3x3 extrinsic rotation matrix of the camera
+    """
+
+    center_of_cornea_curvature_scs = np.dot(center_of_cornea_curvature, rotation_matrix.T)
+    visual_axis_unit_vector_scs = np.dot(visual_axis_unit_vector, rotation_matrix.T)
+
+    return center_of_cornea_curvature_scs, visual_axis_unit_vector_scs
+
+
 def calculate_point_of_interest(center_of_cornea_curvature, visual_axis_unit_vector, z_shift):
     """
     Calculates point of interest.
@@ -50,42 +74,471 @@ def calculate_point_of_interest(center_of_cornea_curvature, visual_axis_unit_vec
     return point_of_interest
 
 
-def get_point_of_interest(glint_1_ics, glint_2_ics, pupil_center_ics, **kwargs):
+def get_point_of_interest(glint_1_ics, glint_2_ics, pupil_center_ics, rig=None, stats=None, **kwargs):
     """
     End-to-end calculations.
 
     :param glint_1_ics: glint 1 coordinates in Image Coordinate System
     :param glint_2_ics: glint 2 coordinates in Image Coordinate System
     :param pupil_center_ics: glint 2 coordinates in Image Coordinate System
+    :param rig: CameraRig, if not given it is created from kwargs
+    :param stats: optional PipelineStats, see get_point_of_interest_instrumented
     :param kwargs: constants dictionary (check in integration_test.constants for an example)
     """
 
-    center_of_cornea_curvature =  calculate_cornea_center(glint_1_ics, glint_2_ics, **kwargs)
+    if rig is None:
+        rig = CameraRig.from_constants(kwargs)
+
+    if stats is not None:
+        return get_point_of_interest_instrumented(glint_1_ics, glint_2_ics, pupil_center_ics, rig, stats)
+
+    center_of_cornea_curvature = calculate_cornea_center(glint_1_ics, glint_2_ics, rig=rig)
 
-    pupil_on_image_wgs = \
-        transform_2D_to_3D(*pupil_center_ics, kwargs['focal_length_cm'], *kwargs['pixel_size_cm'], *kwargs['principal_point'])
+    pupil_on_image_wgs = transform_2D_to_3D(*rig.undistort_points(pupil_center_ics), *rig.intrinsics)
 
-    optic_axis_unit_vector = calculate_optic_axis_unit_vector(pupil_on_image_wgs,
-                                                              kwargs['camera_position_wcs'],
-                                                              center_of_cornea_curvature,
-                                                              kwargs['R_cm'],
-                                                              kwargs['K_cm'],
-                                                              kwargs['n1'],
-                                                              kwargs['n2'])
+    optic_axis_unit_vector = calculate_optic_axis_unit_vector_fast(pupil_on_image_wgs,
+                                                                   rig.camera_position_wcs,
+                                                                   center_of_cornea_curvature,
+                                                                   rig.eye.R_cm,
+                                                                   rig.eye.K_cm,
+                                                                   rig.eye.n1,
+                                                                   rig.eye.n2)
 
     visual_axis_unit_vector =\
         calculate_visual_axis_unit_vector(optic_axis_unit_vector,
-                                          kwargs['alpha_right'],
-                                          kwargs['beta'])
+                                          rig.eye.alpha,
+                                          rig.eye.beta)
 
     # transform to coordinate system aligned with screen
     center_of_cornea_curvature_scs, visual_axis_unit_vector_scs = \
-        transform_to_screen_coordinate_system(center_of_cornea_curvature, visual_axis_unit_vector, kwargs['camera_rotation'])
+        rotate_to_screen_coordinate_system(center_of_cornea_curvature, visual_axis_unit_vector, rig.camera_rotation_matrix)
 
     point_of_interest = \
         calculate_point_of_interest(center_of_cornea_curvature_scs,
                                     visual_axis_unit_vector_scs,
-                                    kwargs['z_shift'])
+                                    rig.z_shift)
+
+    return point_of_interest
+
+
+def get_point_of_interest_instrumented(glint_1_ics, glint_2_ics, pupil_center_ics, rig, stats):
+    """
+    Same calculations as get_point_of_interest, but every stage is measured.
+
+    Wall time of the stages is recorded in stats under the names 'cornea_center', 'pupil_transform_2D_to_3D',
+    'optic_axis', 'visual_axis', 'screen_transform', 'point_of_interest' and 'end_to_end',
+    together with iterations and function evaluations of the cornea center solver.
+    A failure is recorded once, for the stage that raised an exception (which is re-raised)
+    or that first gave a NaN result, and then 'end_to_end' is not recorded.
+
+    :param rig: CameraRig
+    :param stats: PipelineStats
+    """
+
+    start = time.perf_counter()
+    failed_stages = []
+
+    def time_stage(stage, function, *args, **kwargs):
+        result = stats.time_stage(stage, function, *args, **kwargs)
+        if not failed_stages and not np.all(np.isfinite(result)):
+            failed_stages.append(stage)
+            stats.record_failure(stage, ValueError('{} is not finite'.format(stage)))
+        return result
+
+    center_of_cornea_curvature = time_stage('cornea_center', calculate_cornea_center,
+                                            glint_1_ics, glint_2_ics, rig=rig, stats=stats)
+
+    pupil_on_image_wgs = time_stage('pupil_transform_2D_to_3D', transform_2D_to_3D,
+                                    *rig.undistort_points(pupil_center_ics), *rig.intrinsics)
+
+    optic_axis_unit_vector = time_stage('optic_axis', calculate_optic_axis_unit_vector_fast,
+                                        pupil_on_image_wgs,
+                                        rig.camera_position_wcs,
+                                        center_of_cornea_curvature,
+                                        rig.eye.R_cm,
+                                        rig.eye.K_cm,
+                                        rig.eye.n1,
+                                        rig.eye.n2)
+
+    visual_axis_unit_vector = time_stage('visual_axis', calculate_visual_axis_unit_vector,
+                                         optic_axis_unit_vector, rig.eye.alpha, rig.eye.beta)
+
+    center_of_cornea_curvature_scs, visual_axis_unit_vector_scs = \
+        time_stage('screen_transform', rotate_to_screen_coordinate_system,
+                   center_of_cornea_curvature, visual_axis_unit_vector, rig.camera_rotation_matrix)
+
+    point_of_interest = time_stage('point_of_interest', calculate_point_of_interest,
+                                   center_of_cornea_curvature_scs, visual_axis_unit_vector_scs, rig.z_shift)
+
+    if not failed_stages:
+        stats.record_stage('end_to_end', time.perf_counter() - start)
 
     return point_of_interest
 
+
+def transform_to_screen_coordinate_system_batch(centers_of_cornea_curvature, visual_axis_unit_vectors, angles_rad):
+    """
+    Batched version of transform_to_screen_coordinate_system.
+
+    :param centers_of_cornea_curvature: array of shape (N, 3) with centers of cornea curvature
+    :param visual_axis_unit_vectors: array of shape (N, 3) with unit vectors of visual axis
+    :param angles: rotations angles of the camera (units are radians)
+    """
+
+    centers_of_cornea_curvature_scs = \
+        transform_3D_to_3D_batch(centers_of_cornea_curvature, *angles_rad, np.array([0, 0, 0]))
+    visual_axis_unit_vectors_scs = \
+        transform_3D_to_3D_batch(visual_axis_unit_vectors, *angles_rad, np.array([0, 0, 0]))
+
+    return centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs
+
+
+def calculate_point_of_interest_batch(centers_of_cornea_curvature, visual_axis_unit_vectors, z_shift):
+    """
+    Batched version of calculate_point_of_interest (formulas 2.31 and 3.61).
+
+    :param centers_of_cornea_curvature: array of shape (N, 3) with centers of cornea curvature
+    :param visual_axis_unit_vectors: array of shape (N, 3) with unit vectors of visual axis
+    :param z_shift: z offset of the screen
+    """
+
+    # Formula 3.61
+    kg = (z_shift - centers_of_cornea_curvature[:, 2]) / visual_axis_unit_vectors[:, 2]
+
+    # Formula 2.31
+    points_of_interest = centers_of_cornea_curvature + kg[:, np.newaxis] * visual_axis_unit_vectors
+
+    return points_of_interest
+
+
+def get_points_of_interest(glints_1_ics, glints_2_ics, pupil_centers_ics, rig=None, **kwargs):
+    """
+    End-to-end calculations for N frames at once.
+
+    All stages are vectorized over frames. The cornea centers are found with Gauss-Newton iterations
+    (see calculate_cornea_center_wcs_batch) instead of opt.minimize, which converges to the exact minimum.
+    The results agree with get_point_of_interest to within 1e-3 cm on the screen.
+    Frames which can not be calculated get NaN, see get_points_of_interest_and_reasons.
+
+    :param glints_1_ics: array of shape (N, 2) with glint 1 coordinates in Image Coordinate System
+    :param glints_2_ics: array of shape (N, 2) with glint 2 coordinates in Image Coordinate System
+    :param pupil_centers_ics: array of shape (N, 2) with pupil center coordinates in Image Coordinate System
+    :param rig: CameraRig, if not given it is created from kwargs
+    :param kwargs: constants dictionary (check in integration_test.constants for an example)
+    :return: array of shape (N, 3) with points of interest
+    """
+
+    points_of_interest, _ = get_points_of_interest_and_reasons(glints_1_ics, glints_2_ics, pupil_centers_ics, rig,
+                                                               **kwargs)
+
+    return points_of_interest
+
+
+def get_points_of_interest_and_reasons(glints_1_ics, glints_2_ics, pupil_centers_ics, rig=None, **kwargs):
+    """
+    Same as get_points_of_interest, with a reason code of every frame (see validity.py).
+
+    Invalid frames get NaN points of interest and the reason of the first stage which failed,
+    see get_gaze_rays_and_reasons. Frames whose visual axis does not hit the screen get VISUAL_AXIS_MISSES_SCREEN.
+
+    :return: array of shape (N, 3) with points of interest, array of shape (N,) with reason codes
+    """
+
+    if rig is None:
+        rig = CameraRig.from_constants(kwargs)
+
+    centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, reasons = \
+        get_gaze_rays_and_reasons(glints_1_ics, glints_2_ics, pupil_centers_ics, rig)
+
+    points_of_interest = intersect_gaze_rays_with_screen(centers_of_cornea_curvature_scs,
+                                                         visual_axis_unit_vectors_scs,
+                                                         reasons,
+                                                         rig.z_shift)
+
+    return points_of_interest, reasons
+
+
+def intersect_gaze_rays_with_screen(centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, reasons, z_shift):
+    """
+    Same as calculate_point_of_interest_batch, but valid frames whose visual axis does not hit the screen
+    get NaN and VISUAL_AXIS_MISSES_SCREEN in reasons (changed in place).
+
+    :param reasons: array of shape (N,) with reason codes of the gaze rays
+    :return: array of shape (N, 3) with points of interest
+    """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Formula 3.61, the screen should be in front of the eye
+        kg = (z_shift - centers_of_cornea_curvature_scs[:, 2]) / visual_axis_unit_vectors_scs[:, 2]
+        points_of_interest = \
+            calculate_point_of_interest_batch(centers_of_cornea_curvature_scs,
+                                              visual_axis_unit_vectors_scs,
+                                              z_shift)
+
+    misses_screen = (reasons == VALID) & ~(np.isfinite(kg) & (kg > 0))
+    if np.any(misses_screen):
+        points_of_interest[misses_screen] = np.nan
+        reasons[misses_screen] = VISUAL_AXIS_MISSES_SCREEN
+
+    return points_of_interest
+
+
+def get_points_of_interest_multiple_lights(glints_ics, pupil_centers_ics, rig=None, **kwargs):
+    """
+    End-to-end calculations for N frames with glints of all lights of the rig
+    (light_1_wcs, light_2_wcs, light_3_wcs, ...), see calculate_cornea_center_multiple_lights.
+    Frames which can not be calculated get NaN, see get_points_of_interest_multiple_lights_and_reasons.
+
+    :param glints_ics: array of shape (N, L, 2) with glints in Image Coordinate System in the order of the lights
+    :param pupil_centers_ics: array of shape (N, 2) with pupil center coordinates in Image Coordinate System
+    :param rig: CameraRig, if not given it is created from kwargs
+    :param kwargs: constants dictionary (check in integration_test.constants for an example)
+    :return: array of shape (N, 3) with points of interest
+    """
+
+    points_of_interest, _ = get_points_of_interest_multiple_lights_and_reasons(glints_ics, pupil_centers_ics, rig,
+                                                                               **kwargs)
+
+    return points_of_interest
+
+
+def get_points_of_interest_multiple_lights_and_reasons(glints_ics, pupil_centers_ics, rig=None, **kwargs):
+    """
+    Same as get_points_of_interest_multiple_lights, with a reason code of every frame (see validity.py),
+    checked at the same stages as in get_gaze_rays_and_reasons.
+
+    :return: array of shape (N, 3) with points of interest, array of shape (N,) with reason codes
+    """
+
+    if rig is None:
+        rig = CameraRig.from_constants(kwargs)
+
+    glints_ics, pupil_centers_ics = (np.asarray(values, dtype=float) for values in (glints_ics, pupil_centers_ics))
+    selection = _FrameSelection(len(pupil_centers_ics), rig.eye)
+
+    glints_ics, pupil_centers_ics = \
+        selection.keep(np.all(np.isfinite(glints_ics), axis=(-2, -1)) & np.all(np.isfinite(pupil_centers_ics), axis=-1),
+                       MISSING_INPUT, glints_ics, pupil_centers_ics)
+
+    glints_wcs = transform_2D_to_3D_batch(rig.undistort_points(glints_ics.reshape(-1, 2)),
+                                          *rig.intrinsics).reshape(glints_ics.shape[:-1] + (3,))
+
+    centers_of_cornea_curvature, _, _, converged = solve_cornea_centers_lights_wcs(glints_wcs,
+                                                                                   rig.camera_position_wcs,
+                                                                                   rig.lights_wcs,
+                                                                                   selection.eye.R_cm,
+                                                                                   rig.distance_to_camera_cm)
+
+    centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, reasons = \
+        _get_gaze_rays_from_cornea_centers_and_reasons(selection, centers_of_cornea_curvature, converged,
+                                                       pupil_centers_ics, rig)
+
+    points_of_interest = intersect_gaze_rays_with_screen(centers_of_cornea_curvature_scs,
+                                                         visual_axis_unit_vectors_scs,
+                                                         reasons,
+                                                         rig.z_shift)
+
+    return points_of_interest, reasons
+
+
+def get_points_of_interest_from_cornea_centers(centers_of_cornea_curvature, pupil_centers_ics, rig):
+    """
+    Calculates points of interest of N frames with known centers of cornea curvature.
+
+    :param centers_of_cornea_curvature: array of shape (N, 3) with centers of cornea curvature
+    :param pupil_centers_ics: array of shape (N, 2) with pupil center coordinates in Image Coordinate System
+    :param rig: CameraRig
+    :return: array of shape (N, 3) with points of interest
+    """
+
+    centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs = \
+        get_gaze_rays_from_cornea_centers(centers_of_cornea_curvature, pupil_centers_ics, rig)
+
+    points_of_interest = \
+        calculate_point_of_interest_batch(centers_of_cornea_curvature_scs,
+                                          visual_axis_unit_vectors_scs,
+                                          rig.z_shift)
+
+    return points_of_interest
+
+
+def get_gaze_rays_from_cornea_centers(centers_of_cornea_curvature, pupil_centers_ics, rig):
+    """
+    Calculates gaze rays (the visual axes starting in the centers of cornea curvature)
+    of N frames with known centers of cornea curvature.
+
+    :param centers_of_cornea_curvature: array of shape (N, 3) with centers of cornea curvature
+    :param pupil_centers_ics: array of shape (N, 2) with pupil center coordinates in Image Coordinate System
+    :param rig: CameraRig
+    :return: arrays of shape (N, 3) with centers of cornea curvature and visual axis unit vectors
+             in coordinate system aligned with screen
+    """
+
+    pupils_on_image_wcs = transform_2D_to_3D_batch(rig.undistort_points(pupil_centers_ics), *rig.intrinsics)
+
+    optic_axis_unit_vectors = calculate_optic_axis_unit_vector_batch_fast(pupils_on_image_wcs,
+                                                                          rig.camera_position_wcs,
+                                                                          centers_of_cornea_curvature,
+                                                                          rig.eye.R_cm,
+                                                                          rig.eye.K_cm,
+                                                                          rig.eye.n1,
+                                                                          rig.eye.n2)
+
+    visual_axis_unit_vectors = \
+        calculate_visual_axis_unit_vector_batch(optic_axis_unit_vectors,
+                                                rig.eye.alpha,
+                                                rig.eye.beta)
+
+    # transform to coordinate system aligned with screen
+    return rotate_to_screen_coordinate_system(centers_of_cornea_curvature,
+                                              visual_axis_unit_vectors,
+                                              rig.camera_rotation_matrix)
+
+
+def get_gaze_rays(glints_1_ics, glints_2_ics, pupil_centers_ics, rig=None, **kwargs):
+    """
+    Same as get_points_of_interest, but returns the gaze rays instead of their points on the screen.
+
+    :param glints_1_ics: array of shape (N, 2) with glint 1 coordinates in Image Coordinate System
+    :param glints_2_ics: array of shape (N, 2) with glint 2 coordinates in Image Coordinate System
+    :param pupil_centers_ics: array of shape (N, 2) with pupil center coordinates in Image Coordinate System
+    :param rig: CameraRig, if not given it is created from kwargs
+    :param kwargs: constants dictionary (check in integration_test.constants for an example)
+    :return: arrays of shape (N, 3) with centers of cornea curvature and visual axis unit vectors
+             in coordinate system aligned with screen
+    """
+
+    centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, _ = \
+        get_gaze_rays_and_reasons(glints_1_ics, glints_2_ics, pupil_centers_ics, rig, **kwargs)
+
+    return centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs
+
+
+def select_eye_frames(eye, frames):
+    """
+    Selects parameters of the given frames from an eye model with per-frame parameters (see binocular.py).
+
+    :param eye: EyeModel with scalars or arrays of shape (N,)
+    :param frames: indices or boolean mask of frames
+    """
+    return eye._replace(**{name: value[frames] for name, value in eye._asdict().items() if np.ndim(value)})
+
+
+class _FrameSelection(object):
+    """
+    Frames of a batch which are still valid, the eye model of these frames and reason codes of all frames,
+    see get_gaze_rays_and_reasons.
+    """
+
+    def __init__(self, frames_count, eye):
+        self.frames = np.arange(frames_count)
+        self.eye = eye
+        self.reasons = np.full(frames_count, VALID, dtype=np.uint8)
+
+    def keep(self, valid, reason, *values):
+        """
+        Marks the other frames with the reason (one or one per frame) and removes them from the frames and the values.
+        """
+        if np.all(valid):
+            return values
+        self.reasons[self.frames[~valid]] = reason
+        self.frames = self.frames[valid]
+        self.eye = select_eye_frames(self.eye, valid)
+        return tuple(value[valid] for value in values)
+
+
+def get_gaze_rays_and_reasons(glints_1_ics, glints_2_ics, pupil_centers_ics, rig=None, **kwargs):
+    """
+    Same as get_gaze_rays, with a reason code of every frame (see validity.py).
+
+    Frames are checked after every stage, and the invalid ones are removed from the next stages:
+    MISSING_INPUT - glint or pupil coordinates are not finite,
+    CORNEA_NOT_CONVERGED - Gauss-Newton iterations of solve_cornea_centers_wcs_batch did not converge,
+    PUPIL_RAY_MISSES_CORNEA, PUPIL_NOT_REACHED - negative discriminant of formula 3.29 or 3.37.
+
+    :return: arrays of shape (N, 3) with centers of cornea curvature and visual axis unit vectors
+             in coordinate system aligned with screen (NaN for invalid frames), array of shape (N,) with reason codes
+    """
+
+    if rig is None:
+        rig = CameraRig.from_constants(kwargs)
+
+    glints_1_ics, glints_2_ics, pupil_centers_ics = \
+        (np.asarray(values, dtype=float) for values in (glints_1_ics, glints_2_ics, pupil_centers_ics))
+    selection = _FrameSelection(len(pupil_centers_ics), rig.eye)
+
+    glints_1_ics, glints_2_ics, pupil_centers_ics = \
+        selection.keep(np.all(np.isfinite(glints_1_ics) & np.isfinite(glints_2_ics) & np.isfinite(pupil_centers_ics),
+                              axis=-1),
+                       MISSING_INPUT, glints_1_ics, glints_2_ics, pupil_centers_ics)
+
+    glints_1_wcs = transform_2D_to_3D_batch(rig.undistort_points(glints_1_ics), *rig.intrinsics)
+    glints_2_wcs = transform_2D_to_3D_batch(rig.undistort_points(glints_2_ics), *rig.intrinsics)
+
+    centers_of_cornea_curvature, _, converged = \
+        solve_cornea_centers_wcs_batch_fast(glints_1_wcs,
+                                            glints_2_wcs,
+                                            rig.camera_position_wcs,
+                                            rig.light_1_wcs,
+                                            rig.light_2_wcs,
+                                            selection.eye.R_cm,
+                                            (rig.distance_to_camera_cm, rig.distance_to_camera_cm))
+
+    return _get_gaze_rays_from_cornea_centers_and_reasons(selection, centers_of_cornea_curvature, converged,
+                                                          pupil_centers_ics, rig)
+
+
+def _get_gaze_rays_from_cornea_centers_and_reasons(selection, centers_of_cornea_curvature, converged,
+                                                   pupil_centers_ics, rig):
+    """
+    Stages of get_gaze_rays_and_reasons after the cornea centers of the selected frames are solved.
+
+    :return: arrays of shape (N, 3) with centers of cornea curvature and visual axis unit vectors
+             in coordinate system aligned with screen (NaN for invalid frames), array of shape (N,) with reason codes
+    """
+
+    frames_count = len(selection.reasons)
+    centers_of_cornea_curvature_scs = np.full((frames_count, 3), np.nan)
+    visual_axis_unit_vectors_scs = np.full((frames_count, 3), np.nan)
+
+    centers_of_cornea_curvature, pupil_centers_ics = \
+        selection.keep(converged & np.all(np.isfinite(centers_of_cornea_curvature), axis=-1), CORNEA_NOT_CONVERGED,
+                       centers_of_cornea_curvature, pupil_centers_ics)
+
+    pupils_on_image_wcs = transform_2D_to_3D_batch(rig.undistort_points(pupil_centers_ics), *rig.intrinsics)
+
+    eye = selection.eye
+    with np.errstate(invalid='ignore'):
+        optic_axis_unit_vectors = calculate_optic_axis_unit_vector_batch_fast(pupils_on_image_wcs,
+                                                                              rig.camera_position_wcs,
+                                                                              centers_of_cornea_curvature,
+                                                                              eye.R_cm,
+                                                                              eye.K_cm,
+                                                                              eye.n1,
+                                                                              eye.n2)
+
+    refracted = np.all(np.isfinite(optic_axis_unit_vectors), axis=-1)
+    if not np.all(refracted):
+        # the fused calculation does not tell which discriminant was negative, so it is checked for the failed frames
+        with np.errstate(invalid='ignore'):
+            points_of_refraction = calculate_r_batch(rig.camera_position_wcs,
+                                                     pupils_on_image_wcs[~refracted],
+                                                     centers_of_cornea_curvature[~refracted],
+                                                     select_eye_frames(eye, ~refracted).R_cm)
+        centers_of_cornea_curvature, optic_axis_unit_vectors = \
+            selection.keep(refracted, np.where(np.all(np.isfinite(points_of_refraction), axis=-1),
+                                               PUPIL_NOT_REACHED, PUPIL_RAY_MISSES_CORNEA),
+                           centers_of_cornea_curvature, optic_axis_unit_vectors)
+
+    visual_axis_unit_vectors = \
+        calculate_visual_axis_unit_vector_batch(optic_axis_unit_vectors,
+                                                selection.eye.alpha,
+                                                selection.eye.beta)
+
+    # transform to coordinate system aligned with screen
+    centers_of_cornea_curvature_scs[selection.frames], visual_axis_unit_vectors_scs[selection.frames] = \
+        rotate_to_screen_coordinate_system(centers_of_cornea_curvature,
+                                           visual_axis_unit_vectors,
+                                           rig.camera_rotation_matrix)
+
+    return centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, selection.reasons
@@ -7,6 +7,8 @@
 
 import numpy as np
 
+from src.rotation_matrix import memoize_rotation
+
 
 def calculate_eye_angles(optic_axis_unit_vector):
     """
@@ -29,39 +31,42 @@ def calculate_rotation_matrix(theta, phi, kappa):
     """
     Calculations based on A.6 and A.2-A.5
 
+    R_eye = R_flip * R_theta * R_phi * R_kappa, where
+
+             -1 0  0             cos(theta) 0 -sin(theta)
+    R_flip =  0 1  0   R_theta =     0      1      0
+              0 0 -1             sin(theta) 0  cos(theta)
+
+            1     0        0                cos(kappa) -sin(kappa) 0
+    R_phi = 0  cos(phi) sin(phi)  R_kappa = sin(kappa)  cos(kappa) 0
+            0 -sin(phi) cos(phi)                0           0      1
+
+    The product R_flip * R_theta * R_phi is built directly in its expanded form,
+    and R_kappa is only applied when kappa is not zero.
 
     :param theta, phi, kappa angles in radians
     :return: 3x3 rotation matrix
     """
 
-    R_flip = \
-        np.array([[-1, 0, 0],
-                  [ 0, 1, 0],
-                  [ 0, 0, -1]])
+    cos_theta, sin_theta = np.cos(theta), np.sin(theta)
+    cos_phi, sin_phi = np.cos(phi), np.sin(phi)
 
-    R_theta = \
-        np.array([[ np.cos(theta), 0, -np.sin(theta)],
-                  [      0,        1,    0          ],
-                  [ np.sin(theta), 0, np.cos(theta)]])
+    R_eye = \
+        np.array([[-cos_theta, -sin_theta*sin_phi,  sin_theta*cos_phi],
+                  [     0,            cos_phi,            sin_phi      ],
+                  [-sin_theta,  cos_theta*sin_phi, -cos_theta*cos_phi]])
 
-    R_phi = \
-        np.array([[ 1,      0,           0      ],
-                  [ 0,  np.cos(phi), np.sin(phi)],
-                  [ 0, -np.sin(phi), np.cos(phi)]])
-
-    R_kappa = \
-        np.array([[np.cos(kappa), -np.sin(kappa), 0],
-                  [np.sin(kappa),  np.cos(kappa), 0],
-                  [     0,             0,         1]])
-
-    # R_eye = R_flip * R_theta * R_phi * R_kappa
-    flip_theta = np.dot(R_flip, R_theta)
-    flip_theta_phi = np.dot(flip_theta, R_phi)
-    R_eye = np.dot(flip_theta_phi, R_kappa)
+    if kappa != 0:
+        R_kappa = \
+            np.array([[np.cos(kappa), -np.sin(kappa), 0],
+                      [np.sin(kappa),  np.cos(kappa), 0],
+                      [     0,             0,         1]])
+        R_eye = np.dot(R_eye, R_kappa)
 
     return R_eye
 
 
+@memoize_rotation(maxsize=16)
 def calculate_nu_ecs(alpha, beta):
     """
 
@@ -69,7 +74,7 @@ def calculate_nu_ecs(alpha, beta):
 
     :param alpha (radians): horizontal angle of visial axis compare to optical
     :param beta (radians): vertical angle of visial axis compare to optical
-    :return: 3x1 rotation matrix
+    :return: 3x1 rotation matrix (read-only, memoized as alpha and beta are the same for every frame)
     """
 
     nu_ecs = \
@@ -100,3 +105,122 @@ def calculate_visual_axis_unit_vector(optic_axis_unit_vector, alpha, beta):
 
     return visual_axis_unit_vector
 
+
+def calculate_eye_angles_batch(optic_axis_unit_vectors):
+    """
+    Batched version of calculate_eye_angles (A.19, A.20).
+
+    :param optic_axis_unit_vectors: array of shape (N, 3) with unit vectors of optic axis
+    :return: arrays of shape (N,) with theta, phi, kappa in radians
+    """
+
+    theta = -1 * np.arctan(optic_axis_unit_vectors[:, 0]/optic_axis_unit_vectors[:, 2])
+    phi = np.arcsin(optic_axis_unit_vectors[:, 1])
+    kappa = np.zeros_like(theta)
+
+    return theta, phi, kappa
+
+
+def calculate_rotation_matrix_batch(theta, phi, kappa):
+    """
+    Batched version of calculate_rotation_matrix (A.6 and A.2-A.5).
+
+    :param theta, phi, kappa: arrays of shape (N,) with angles in radians
+    :return: array of shape (N, 3, 3) with rotation matrices
+    """
+
+    cos_theta, sin_theta = np.cos(theta), np.sin(theta)
+    cos_phi, sin_phi = np.cos(phi), np.sin(phi)
+
+    R_eye = np.empty(np.shape(theta) + (3, 3))
+    R_eye[..., 0, 0] = -cos_theta
+    R_eye[..., 0, 1] = -sin_theta*sin_phi
+    R_eye[..., 0, 2] = sin_theta*cos_phi
+    R_eye[..., 1, 0] = 0
+    R_eye[..., 1, 1] = cos_phi
+    R_eye[..., 1, 2] = sin_phi
+    R_eye[..., 2, 0] = -sin_theta
+    R_eye[..., 2, 1] = cos_theta*sin_phi
+    R_eye[..., 2, 2] = -cos_theta*cos_phi
+
+    if np.any(kappa != 0):
+        zeros = np.zeros_like(kappa)
+        ones = np.ones_like(kappa)
+        R_kappa = np.stack([np.stack([np.cos(kappa), -np.sin(kappa), zeros], axis=-1),
+                            np.stack([np.sin(kappa),  np.cos(kappa), zeros], axis=-1),
+                            np.stack([    zeros,          zeros,      ones], axis=-1)], axis=-2)
+        R_eye = np.matmul(R_eye, R_kappa)
+
+    return R_eye
+
+
+def calculate_nu_ecs_batch(alpha, beta):
+    """
+    Batched version of calculate_nu_ecs (Formula 2.1).
+
+    :param alpha (radians): horizontal angles of visial axis compare to optical (scalar or array of shape (N,))
+    :param beta (radians): vertical angles of visial axis compare to optical (scalar or array of shape (N,))
+    :return: array of shape (3,) or (N, 3)
+    """
+
+    alpha, beta = np.broadcast_arrays(np.asarray(alpha, dtype=float), np.asarray(beta, dtype=float))
+
+    nu_ecs = np.stack([-np.sin(alpha)*np.cos(beta),
+                       np.sin(beta),
+                       np.cos(alpha)*np.cos(beta)], axis=-1)
+
+    return nu_ecs
+
+
+def calculate_visual_axis_unit_vector_batch(optic_axis_unit_vectors, alpha, beta):
+    """
+    Batched version of calculate_visual_axis_unit_vector (formula 2.30).
+
+    :param optic_axis_unit_vectors: array of shape (N, 3) with unit vectors of optic axis
+    :param alpha: horizontal angle of visial axis compare to optical (scalar or array of shape (N,))
+    :param beta: vertical angle of visial axis compare to optical (scalar or array of shape (N,))
+    :return: array of shape (N, 3) with visual axis unit vectors
+    """
+    nu_ecs = calculate_nu_ecs_batch(alpha, beta)
+
+    theta, phi, kappa = calculate_eye_angles_batch(optic_axis_unit_vectors)
+
+    Reye = calculate_rotation_matrix_batch(theta, phi, kappa)
+
+    visual_axis_unit_vectors = np.matmul(Reye, nu_ecs[..., np.newaxis])[..., 0]
+
+    return visual_axis_unit_vectors
+
+
+def calculate_optic_axis_unit_vector_from_visual_axis_batch(visual_axis_unit_vectors, alpha, beta):
+    """
+    Inverse of calculate_visual_axis_unit_vector_batch (formula 2.30 with kappa = 0):
+    finds theta and phi such that R_eye(theta, phi) * nu_ecs = visual axis, and returns the optic axis R_eye * (0, 0, 1).
+
+    R_flip * visual axis = R_theta * R_phi * nu_ecs, where R_theta does not change the y component,
+    so phi is found from the y component, and theta is the rotation angle in the xz plane.
+
+    :param visual_axis_unit_vectors: array of shape (N, 3) with visual axis unit vectors
+    :param alpha: horizontal angle of visial axis compare to optical (scalar or array of shape (N,))
+    :param beta: vertical angle of visial axis compare to optical (scalar or array of shape (N,))
+    :return: array of shape (N, 3) with unit vectors of optic axis
+    """
+
+    nu_ecs = np.broadcast_to(calculate_nu_ecs_batch(alpha, beta), np.shape(visual_axis_unit_vectors))
+    flipped = visual_axis_unit_vectors * np.array([-1, 1, -1])
+
+    # cos(phi)*nu_y + sin(phi)*nu_z = flipped_y, the solution closest to phi = 0 is taken
+    magnitude = np.hypot(nu_ecs[:, 1], nu_ecs[:, 2])
+    phi = np.arctan2(nu_ecs[:, 2], nu_ecs[:, 1]) - np.arccos(np.clip(flipped[:, 1]/magnitude, -1, 1))
+
+    # R_phi * nu_ecs rotated by theta in the xz plane gives flipped
+    rotated_x = nu_ecs[:, 0]
+    rotated_z = -np.sin(phi)*nu_ecs[:, 1] + np.cos(phi)*nu_ecs[:, 2]
+    theta = np.arctan2(flipped[:, 2], flipped[:, 0]) - np.arctan2(rotated_z, rotated_x)
+    theta = np.arctan2(np.sin(theta), np.cos(theta))
+
+    optic_axis_unit_vectors = np.stack([np.sin(theta)*np.cos(phi),
+                                        np.sin(phi),
+                                        -np.cos(theta)*np.cos(phi)], axis=-1)
+
+    return optic_axis_unit_vectors
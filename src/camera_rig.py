@@ -0,0 +1,277 @@
+# Camera rig and eye model configuration.
+#
+# The pipeline functions are configured with a constants dictionary (check in integration_test.constants
+# for an example). CameraRig is built once from such a dictionary: it validates the constants and
+# precomputes everything that does not change from frame to frame.
+#
+# @author: Anna Eivazi
+
+from collections import namedtuple, OrderedDict
+
+import numpy as np
+
+from src.rotation_matrix import calculate_rotation_matrix_extrinsic
+from src.lens_distortion import UndistortionMap, DISTORTION_COEFFICIENTS_COUNT
+
+
+# rigs created by CameraRig.from_constants by the key of the constants (see _constants_key), the oldest is evicted
+_rigs = OrderedDict()
+RIGS_CACHE_SIZE = 16
+
+
+class EyeModel(namedtuple('EyeModel', ['R_cm', 'K_cm', 'n1', 'n2', 'alpha', 'beta'])):
+    """
+    Immutable parameters of one eye.
+
+    R_cm: radius of cornea curvature
+    K_cm: distance between the center of the pupil and the center of corneal curvature
+    n1: effective index of refraction of the aqueous humor and cornea combined
+    n2: the index of refraction of air
+    alpha, beta: horizontal and vertical angles of visual axis compare to optical (radians)
+    """
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, R_cm, K_cm, n1, n2, alpha, beta):
+        """
+        Validates parameters and creates the eye model.
+        """
+        R_cm, K_cm, n1, n2, alpha, beta = (float(value) for value in (R_cm, K_cm, n1, n2, alpha, beta))
+
+        if R_cm <= 0:
+            raise ValueError('R_cm should be positive, got {}'.format(R_cm))
+        if not 0 < K_cm < R_cm:
+            raise ValueError('K_cm should be positive and smaller than R_cm, got {}'.format(K_cm))
+        if n1 <= 0 or n2 <= 0:
+            raise ValueError('Indices of refraction should be positive, got n1={}, n2={}'.format(n1, n2))
+
+        return cls(R_cm, K_cm, n1, n2, alpha, beta)
+
+    @classmethod
+    def from_constants(cls, constants, alpha_key='alpha_right'):
+        """
+        Creates the eye model from a constants dictionary.
+
+        :param constants: constants dictionary (check in integration_test.constants for an example)
+        :param alpha_key: key of the alpha angle of the eye
+        """
+        return cls.create(constants['R_cm'], constants['K_cm'], constants['n1'], constants['n2'],
+                          constants[alpha_key], constants['beta'])
+
+    @classmethod
+    def create_cornea(cls, R_cm):
+        """
+        Validates the radius of cornea curvature and creates the eye model for cornea center calculations,
+        the other parameters are None.
+        """
+        R_cm = float(R_cm)
+
+        if R_cm <= 0:
+            raise ValueError('R_cm should be positive, got {}'.format(R_cm))
+
+        return cls(R_cm, None, None, None, None, None)
+
+
+class CameraRig(namedtuple('CameraRig', ['focal_length_cm', 'pixel_size_cm', 'principal_point', 'intrinsics',
+                                         'camera_position_wcs', 'lights_wcs', 'camera_rotation',
+                                         'camera_rotation_matrix', 'z_shift', 'distance_to_camera_cm',
+                                         'cornea_solver', 'eye', 'left_eye', 'distortion_coefficients',
+                                         'undistortion_map'])):
+    """
+    Immutable, validated configuration of the camera, lights, screen and eye model.
+
+    intrinsics: (focal_length_cm, pixel_size_x, pixel_size_y, principal_point_x, principal_point_y)
+                in the order of transform_2D_to_3D arguments
+    lights_wcs: array of shape (L, 3) with coordinates of all lights
+    camera_rotation_matrix: extrinsic rotation from WCS to the screen coordinate system
+    z_shift: z coordinate of the screen, None for a rig of cornea center calculations
+    eye: EyeModel of the tracked (right) eye, only R_cm is given for a rig of cornea center calculations
+    left_eye: EyeModel of the left eye for binocular processing, None if 'alpha_left' is not given
+    distortion_coefficients: k1, k2, p1, p2, k3 of the lens (see lens_distortion.py), None for an ideal pinhole
+    undistortion_map: UndistortionMap of the sensor, None for an ideal pinhole
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_constants(cls, constants, cornea_only=False):
+        """
+        Validates the constants dictionary and creates the rig.
+
+        Rigs are cached: the same constants (compared by value) give the same rig without validating
+        and precomputing them again, thus functions called per frame with kwargs do not rebuild it.
+
+        Lights are read from the keys 'light_1_wcs', 'light_2_wcs', ... (at least two are needed).
+        'camera_rotation' is optional, by default the camera is not rotated relatively to the screen.
+        'cornea_solver' is optional, by default it is 'minimize'.
+        'alpha_left' is optional, if given the left eye is created with it and the other parameters of the eye.
+        'distortion_coefficients' is optional: k1, k2, p1, p2 and optionally k3 of the lens. If given,
+        the undistortion map of the sensor of size 'image_size' (width, height) is calculated,
+        by default the sensor is twice the principal point.
+        If cornea_only is set, only the camera, the lights and 'R_cm' are needed (as for calculate_cornea_center),
+        z_shift and left_eye are None and the eye has only R_cm.
+
+        :param constants: constants dictionary (check in integration_test.constants for an example)
+        :param cornea_only: create the rig for cornea center calculations only
+        :return: CameraRig
+        """
+
+        key = _constants_key(cls, constants, cornea_only)
+        rig = _rigs.get(key) if key is not None else None
+        if rig is None:
+            rig = cls._create(constants, cornea_only)
+            if key is not None:
+                _rigs[key] = rig
+                if len(_rigs) > RIGS_CACHE_SIZE:
+                    _rigs.popitem(last=False)
+
+        return rig
+
+    @classmethod
+    def _create(cls, constants, cornea_only):
+
+        focal_length_cm = float(constants['focal_length_cm'])
+        if focal_length_cm <= 0:
+            raise ValueError('focal_length_cm should be positive, got {}'.format(focal_length_cm))
+
+        pixel_size_cm = tuple(float(value) for value in constants['pixel_size_cm'])
+        if len(pixel_size_cm) != 2 or min(pixel_size_cm) <= 0:
+            raise ValueError('pixel_size_cm should be two positive values, got {}'.format(constants['pixel_size_cm']))
+
+        principal_point = tuple(float(value) for value in constants['principal_point'])
+        if len(principal_point) != 2:
+            raise ValueError('principal_point should be two values, got {}'.format(constants['principal_point']))
+
+        camera_position_wcs = _read_point(constants, 'camera_position_wcs')
+
+        lights_wcs = []
+        while 'light_{}_wcs'.format(len(lights_wcs) + 1) in constants:
+            lights_wcs.append(_read_point(constants, 'light_{}_wcs'.format(len(lights_wcs) + 1)))
+        if len(lights_wcs) < 2:
+            raise ValueError('At least two lights (light_1_wcs, light_2_wcs) are needed')
+        lights_wcs = np.array(lights_wcs)
+        lights_wcs.setflags(write=False)
+
+        camera_rotation = np.array(constants.get('camera_rotation', (0, 0, 0)), dtype=float)
+        if camera_rotation.shape != (3,):
+            raise ValueError('camera_rotation should be three angles, got {}'.format(constants['camera_rotation']))
+        camera_rotation.setflags(write=False)
+
+        camera_rotation_matrix = np.array(calculate_rotation_matrix_extrinsic(*camera_rotation))
+        camera_rotation_matrix.setflags(write=False)
+
+        distance_to_camera_cm = float(constants['distance_to_camera_cm'])
+        if distance_to_camera_cm <= 0:
+            raise ValueError('distance_to_camera_cm should be positive, got {}'.format(distance_to_camera_cm))
+
+        intrinsics = (focal_length_cm,) + pixel_size_cm + principal_point
+
+        distortion_coefficients = None
+        undistortion_map = None
+        if 'distortion_coefficients' in constants:
+            distortion_coefficients = tuple(float(value) for value in constants['distortion_coefficients'])
+            if len(distortion_coefficients) not in (DISTORTION_COEFFICIENTS_COUNT - 1, DISTORTION_COEFFICIENTS_COUNT):
+                raise ValueError('distortion_coefficients should be k1, k2, p1, p2 and optionally k3, got {}'.format(
+                    constants['distortion_coefficients']))
+            distortion_coefficients = (distortion_coefficients + (0.,))[:DISTORTION_COEFFICIENTS_COUNT]
+
+            if any(distortion_coefficients):
+                image_size = tuple(constants.get('image_size', (2*principal_point[0], 2*principal_point[1])))
+                if len(image_size) != 2:
+                    raise ValueError('image_size should be width and height, got {}'.format(image_size))
+                undistortion_map = UndistortionMap.create(distortion_coefficients, intrinsics, image_size)
+            else:
+                distortion_coefficients = None
+
+        return cls(focal_length_cm=focal_length_cm,
+                   pixel_size_cm=pixel_size_cm,
+                   principal_point=principal_point,
+                   intrinsics=intrinsics,
+                   camera_position_wcs=camera_position_wcs,
+                   lights_wcs=lights_wcs,
+                   camera_rotation=camera_rotation,
+                   camera_rotation_matrix=camera_rotation_matrix,
+                   z_shift=None if cornea_only else float(constants['z_shift']),
+                   distance_to_camera_cm=distance_to_camera_cm,
+                   cornea_solver=constants.get('cornea_solver', 'minimize'),
+                   eye=EyeModel.create_cornea(constants['R_cm']) if cornea_only else EyeModel.from_constants(constants),
+                   left_eye=EyeModel.from_constants(constants, 'alpha_left')
+                   if 'alpha_left' in constants and not cornea_only else None,
+                   distortion_coefficients=distortion_coefficients,
+                   undistortion_map=undistortion_map)
+
+    def to_constants(self):
+        """
+        Inverse of from_constants: returns the constants dictionary of the rig.
+
+        The eye is given with 'alpha_right' (and 'alpha_left' for the left eye), a rig for cornea center
+        calculations gives only the camera, the lights and 'R_cm'.
+        """
+
+        constants = {
+            'focal_length_cm': self.focal_length_cm,
+            'pixel_size_cm': self.pixel_size_cm,
+            'principal_point': self.principal_point,
+            'camera_position_wcs': self.camera_position_wcs,
+            'camera_rotation': self.camera_rotation,
+            'distance_to_camera_cm': self.distance_to_camera_cm,
+            'cornea_solver': self.cornea_solver,
+            'R_cm': self.eye.R_cm
+        }
+        for index, light_wcs in enumerate(self.lights_wcs):
+            constants['light_{}_wcs'.format(index + 1)] = light_wcs
+
+        if self.z_shift is not None:
+            constants['z_shift'] = self.z_shift
+        if self.eye.K_cm is not None:
+            constants.update({'K_cm': self.eye.K_cm, 'n1': self.eye.n1, 'n2': self.eye.n2,
+                              'alpha_right': self.eye.alpha, 'beta': self.eye.beta})
+        if self.left_eye is not None:
+            constants['alpha_left'] = self.left_eye.alpha
+        if self.distortion_coefficients is not None:
+            constants['distortion_coefficients'] = self.distortion_coefficients
+            constants['image_size'] = self.undistortion_map.image_size
+
+        return constants
+
+    @property
+    def light_1_wcs(self):
+        return self.lights_wcs[0]
+
+    @property
+    def light_2_wcs(self):
+        return self.lights_wcs[1]
+
+    def undistort_points(self, points_ics):
+        """
+        Removes the lens distortion of points in Image Coordinate System before transform_2D_to_3D.
+
+        :param points_ics: array of shape (..., 2)
+        :return: undistorted points, the same points for an ideal pinhole
+        """
+        if self.undistortion_map is None:
+            return points_ics
+        return self.undistortion_map.undistort(points_ics)
+
+
+def _read_point(constants, key):
+    """
+    Reads a 3D point from the constants dictionary as a read-only array.
+    """
+    point = np.array(constants[key], dtype=float)
+    if point.shape != (3,):
+        raise ValueError('{} should be a 3D point, got {}'.format(key, constants[key]))
+    point.setflags(write=False)
+    return point
+
+
+def _constants_key(cls, constants, cornea_only):
+    """
+    Returns a hashable key of the constants dictionary by value, None if some value is not hashable.
+    """
+    try:
+        key = (cls, cornea_only) + tuple(sorted((name, np.shape(value), tuple(np.ravel(value).tolist()))
+                                                for name, value in constants.items()))
+        hash(key)
+    except TypeError:
+        return None
+    return key
@@ -39,6 +39,31 @@ def transform_2D_to_3D(x, y,
 
     return x_ccs, y_ccs, z_ccs
 
+
+def transform_2D_to_3D_batch(points_ics,
+                             focal_length,
+                             pixel_size_x, pixel_size_y,
+                             principal_point_x, principal_point_y):
+    """
+    Batched version of transform_2D_to_3D.
+
+    :param
+    points_ics: array of shape (N, 2) with 2D coordinates in ICS
+    focal_length, pixel_size_x, pixel_size_y, principal_point_x, principal_point_y: see transform_2D_to_3D
+
+    :return: array of shape (N, 3) with 3D points in CCS
+    """
+
+    points_ics = np.asarray(points_ics, dtype=float)
+
+    points_ccs = np.empty(points_ics.shape[:-1] + (3,))
+    points_ccs[..., 0] = (points_ics[..., 0] - principal_point_x) * pixel_size_x
+    points_ccs[..., 1] = (points_ics[..., 1] - principal_point_y) * pixel_size_y
+    points_ccs[..., 2] = -focal_length
+
+    return points_ccs
+
+
 def transform_3D_to_3D(input_coordinates,
                        alpha_rad, beta_rad, gamma_rad,
                        shift_of_zero):
@@ -68,3 +93,23 @@ def transform_3D_to_3D(input_coordinates,
 
     return output_coordinates
 
+
+def transform_3D_to_3D_batch(input_coordinates,
+                             alpha_rad, beta_rad, gamma_rad,
+                             shift_of_zero):
+    """
+    Batched version of transform_3D_to_3D.
+
+    :param
+    input_coordinates: array of shape (N, 3) with 3D points in CS_in
+    gamma, beta, alpha: rotation angles of axis (radians)
+    shift_of_zero: zero shift of coordinate systems
+    :return:
+    output_coordinates: array of shape (N, 3) with 3D points in CS_out
+    """
+
+    R = calculate_rotation_matrix_extrinsic(alpha_rad, beta_rad, gamma_rad)
+
+    output_coordinates = np.dot(input_coordinates, R.T) + shift_of_zero
+
+    return output_coordinates
@@ -0,0 +1,90 @@
+# Temporal tracking of the cornea center solution.
+#
+# At usual frame rates (60-500 Hz) kq1 and kq2 of the previous frame are very close to the solution
+# of the current frame, thus they are a much better initial solution than the distance to the camera.
+
+import numpy as np
+
+from src.calculate_cornea_center import calculate_cornea_center_and_kq
+from src.camera_rig import CameraRig
+
+
+class CorneaCenterTracker(object):
+    """
+    Estimates cornea centers of one eye frame by frame, starting the solver from the previous solution.
+
+    The previous kq1, kq2 (optionally moved forward with their constant velocity) are used as the
+    initial solution of the next frame. The tracker resets itself and starts again from
+    'distance_to_camera_cm' after a blink (missing or NaN glint), after a failed (NaN) solution
+    or when the time since the previous frame is larger than max_gap.
+    """
+
+    def __init__(self, max_gap=0.1, predict_velocity=True, rig=None, **kwargs):
+        """
+        :param max_gap: maximal time between two frames (in units of timestamps, e.g. seconds) to keep the solution
+        :param predict_velocity: use constant velocity prediction of kq1, kq2
+        :param rig: CameraRig, if not given it is created from kwargs
+        :param kwargs: constants dictionary (check in integration_test.constants for an example)
+        """
+        self.max_gap = max_gap
+        self.predict_velocity = predict_velocity
+        self.rig = rig if rig is not None else CameraRig.from_constants(kwargs, cornea_only=True)
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the previous solution.
+        """
+        self.kq = None
+        self.kq_velocity = None
+        self.timestamp = None
+
+    def initial_solution(self, timestamp):
+        """
+        Returns initial solution kq1, kq2 for the frame with the given timestamp,
+        or None if there is no previous solution to start from.
+        """
+        if self.kq is None:
+            return None
+
+        time_step = timestamp - self.timestamp
+        if time_step > self.max_gap or time_step <= 0:
+            self.reset()
+            return None
+
+        if self.predict_velocity and self.kq_velocity is not None:
+            return self.kq + self.kq_velocity * time_step
+
+        return self.kq
+
+    def update(self, u1_ics, u2_ics, timestamp):
+        """
+        Estimates cornea center of the next frame.
+
+        :param u1_ics: glint 1 coordinates in Image Coordinate System, None or NaN if glint was not detected
+        :param u2_ics: glint 2 coordinates in Image Coordinate System, None or NaN if glint was not detected
+        :param timestamp: time of the frame
+        :return: cornea center, None if one of the glints is missing
+        """
+
+        if u1_ics is None or u2_ics is None or not np.all(np.isfinite(u1_ics)) or not np.all(np.isfinite(u2_ics)):
+            self.reset()
+            return None
+
+        initial_solution = self.initial_solution(timestamp)
+
+        cornea_center, kq = calculate_cornea_center_and_kq(u1_ics, u2_ics, initial_solution, self.rig)
+        kq = np.asarray(kq, dtype=float)
+
+        # a failed solution is not a starting point for the next frames
+        if not np.all(np.isfinite(kq)):
+            self.reset()
+            return cornea_center
+
+        if self.kq is not None:
+            self.kq_velocity = (kq - self.kq) / (timestamp - self.timestamp)
+
+        self.kq = kq
+        self.timestamp = timestamp
+
+        return cornea_center
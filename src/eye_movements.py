@@ -0,0 +1,357 @@
+# Detection of fixations and saccades in the stream of gaze rays.
+#
+# Two detectors (Salvucci, Goldberg, "Identifying fixations and saccades in eye-tracking protocols", ETRA 2000):
+#   I-VT: frames with an angular velocity above a threshold are saccades, the other frames are fixations;
+#   I-DT: a window of frames is a fixation if its dispersion is below a threshold for at least min_duration,
+#         and the fixation grows while the dispersion stays below the threshold.
+# Angles are calculated from the gaze rays of get_gaze_rays (centers of cornea curvature and visual axes):
+# the angular velocity is the angle between two consecutive points of interest seen from the cornea center,
+# the dispersion is the sum of horizontal and vertical ranges of the visual axis angles.
+#
+# Both detectors work on a whole session at once (detect_* functions) or incrementally, frame by frame
+# or chunk by chunk (VelocityThresholdDetector and DispersionThresholdDetector), with the same result.
+# Every frame gets a label (FIXATION, SACCADE or UNCLASSIFIED for missing frames) and a fixation id
+# (-1 for frames that are not in a fixation), find_fixations groups frames into fixations.
+#
+# @author: Anna Eivazi
+
+from collections import namedtuple
+
+import numpy as np
+
+from src.kernels import jit
+from src.calculate_point_of_interest import calculate_point_of_interest_batch
+
+
+UNCLASSIFIED = 0
+FIXATION = 1
+SACCADE = 2
+
+# frames decided by a detector: global frame indices, labels and fixation ids, arrays of shape (n,)
+DetectedFrames = namedtuple('DetectedFrames', ['indices', 'labels', 'fixation_ids'])
+
+# starts, stops: frame indices of fixations (stop is exclusive), start_timestamps, durations: in seconds,
+# points_of_interest: array of shape (F, 3) with the average point of interest of every fixation
+Fixations = namedtuple('Fixations', ['starts', 'stops', 'start_timestamps', 'durations', 'points_of_interest'])
+
+
+def calculate_angular_velocities(centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, timestamps, z_shift,
+                                 previous_point_of_interest=None, previous_timestamp=np.nan):
+    """
+    Calculates angular velocities of the gaze: the angle between the previous and the current point of interest
+    seen from the current center of cornea curvature, divided by the time between the frames.
+
+    :param centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs: arrays of shape (N, 3) (see get_gaze_rays)
+    :param timestamps: array of shape (N,) in seconds
+    :param z_shift: z of the screen in coordinate system aligned with screen (rig.z_shift)
+    :param previous_point_of_interest, previous_timestamp: the frame before the first one, if known
+    :return: array of shape (N,) with angular velocities in degrees per second, NaN for the first frame
+             (if the previous frame is not known) and for frames next to missing ones
+    """
+
+    points_of_interest = calculate_point_of_interest_batch(centers_of_cornea_curvature_scs,
+                                                           visual_axis_unit_vectors_scs, z_shift)
+
+    if previous_point_of_interest is None:
+        previous_point_of_interest = np.full(3, np.nan)
+    previous_points_of_interest = np.concatenate([np.reshape(previous_point_of_interest, (1, 3)),
+                                                  points_of_interest[:-1]])
+    previous_directions = previous_points_of_interest - centers_of_cornea_curvature_scs
+
+    # angle between the vectors, arctan2 of the magnitudes of cross and dot products is exact for small angles
+    angles = np.degrees(np.arctan2(np.linalg.norm(np.cross(previous_directions, visual_axis_unit_vectors_scs), axis=-1),
+                                   np.sum(previous_directions*visual_axis_unit_vectors_scs, axis=-1)))
+
+    return angles/np.diff(timestamps, prepend=previous_timestamp)
+
+
+def calculate_gaze_angles(visual_axis_unit_vectors_scs):
+    """
+    :param visual_axis_unit_vectors_scs: array of shape (N, 3), directed to the screen
+    :return: array of shape (N, 2) with horizontal and vertical angles of visual axes in degrees
+    """
+    return np.degrees(np.stack([np.arctan2(visual_axis_unit_vectors_scs[:, 0], -visual_axis_unit_vectors_scs[:, 2]),
+                                np.arcsin(np.clip(visual_axis_unit_vectors_scs[:, 1], -1, 1))], axis=-1))
+
+
+def calculate_fixation_ids(labels, previous_label=UNCLASSIFIED, next_fixation_id=0):
+    """
+    Numbers runs of FIXATION labels.
+
+    :param labels: array of shape (N,)
+    :param previous_label: label of the frame before the first one
+    :param next_fixation_id: id of the first fixation that starts in these frames
+    :return: array of shape (N,) with fixation ids, -1 for other frames
+    """
+    fixations = labels == FIXATION
+    starts = fixations & (np.concatenate([[previous_label], labels[:-1]]) != FIXATION)
+    fixation_ids = next_fixation_id + np.cumsum(starts) - 1
+    return np.where(fixations, fixation_ids, -1)
+
+
+class VelocityThresholdDetector(object):
+    """
+    Incremental I-VT, keeps only the point of interest of the last frame.
+    """
+
+    def __init__(self, z_shift, threshold=30.):
+        """
+        :param z_shift: z of the screen in coordinate system aligned with screen (rig.z_shift)
+        :param threshold: angular velocity in degrees per second, faster frames are saccades
+        """
+        self.z_shift = z_shift
+        self.threshold = threshold
+        self.reset()
+
+    def reset(self):
+        self.number_of_frames = 0
+        self.previous_point_of_interest = None
+        self.previous_timestamp = np.nan
+        self.previous_label = UNCLASSIFIED
+        self.next_fixation_id = 0
+
+    def process(self, centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, timestamps):
+        """
+        Classifies frames, continuing from the previous ones.
+
+        :param centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs: arrays of shape (N, 3)
+        :param timestamps: array of shape (N,) in seconds
+        :return: DetectedFrames with all N frames
+        """
+
+        centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, timestamps = \
+            (np.asarray(values, dtype=float) for values in
+             (centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, timestamps))
+        frames_count = len(timestamps)
+        if frames_count == 0:
+            return DetectedFrames(*(np.empty(0, dtype=int) for _ in range(3)))
+
+        velocities = calculate_angular_velocities(centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs,
+                                                  timestamps, self.z_shift,
+                                                  self.previous_point_of_interest, self.previous_timestamp)
+
+        labels = np.where(np.isnan(velocities), UNCLASSIFIED, np.where(velocities > self.threshold, SACCADE, FIXATION))
+        fixation_ids = calculate_fixation_ids(labels, self.previous_label, self.next_fixation_id)
+
+        indices = self.number_of_frames + np.arange(frames_count)
+        self.number_of_frames += frames_count
+        self.previous_point_of_interest = calculate_point_of_interest_batch(centers_of_cornea_curvature_scs[-1:],
+                                                                            visual_axis_unit_vectors_scs[-1:],
+                                                                            self.z_shift)[0]
+        self.previous_timestamp = timestamps[-1]
+        self.previous_label = labels[-1]
+        self.next_fixation_id = max(self.next_fixation_id, fixation_ids.max() + 1)
+
+        return DetectedFrames(indices, labels, fixation_ids)
+
+    def update(self, center_of_cornea_curvature_scs, visual_axis_unit_vector_scs, timestamp):
+        """
+        Classifies one frame.
+
+        :return: DetectedFrames with this frame
+        """
+        return self.process([center_of_cornea_curvature_scs], [visual_axis_unit_vector_scs], [timestamp])
+
+    def finish(self):
+        """
+        All frames are classified immediately, so nothing is left.
+        """
+        return DetectedFrames(*(np.empty(0, dtype=int) for _ in range(3)))
+
+
+@jit
+def dispersion_threshold_kernel(angles, timestamps, first_frame, max_dispersion, min_duration,
+                                state, bounds, labels, fixation_ids):
+    """
+    I-DT state machine over frames [first_frame, N), the frames before first_frame are the pending window.
+
+    A window starts in the first frame which is not decided yet (state[0]). When it spans min_duration,
+    it becomes a fixation if its dispersion is not larger than max_dispersion, otherwise its first frame
+    is a saccade and the window starts in the next frame. An open fixation (state[1]) grows frame by frame
+    while its dispersion (bounds of its angles) stays small enough.
+
+    :param angles: array of shape (N, 2) with gaze angles in degrees, NaN for missing frames
+    :param timestamps: array of shape (N,) in seconds
+    :param state: array of shape (3,): the start of the window, 1 if a fixation is open, the next fixation id
+    :param bounds: array of shape (4,) with the ranges of angles of the open fixation
+    :param labels, fixation_ids: output arrays of shape (N,), written for the decided frames [0, state[0])
+    """
+
+    for frame in range(first_frame, angles.shape[0]):
+        x, y = angles[frame, 0], angles[frame, 1]
+
+        if np.isnan(x) or np.isnan(y):
+            # a missing frame ends the fixation and the window
+            for window_frame in range(state[0], frame + 1):
+                labels[window_frame] = 0
+                fixation_ids[window_frame] = -1
+            state[0] = frame + 1
+            state[1] = 0
+            continue
+
+        if state[1] == 1:
+            min_x, max_x = min(bounds[0], x), max(bounds[1], x)
+            min_y, max_y = min(bounds[2], y), max(bounds[3], y)
+            if (max_x - min_x) + (max_y - min_y) <= max_dispersion:
+                bounds[0], bounds[1], bounds[2], bounds[3] = min_x, max_x, min_y, max_y
+                labels[frame] = 1
+                fixation_ids[frame] = state[2] - 1
+                state[0] = frame + 1
+                continue
+            state[1] = 0
+
+        while state[0] <= frame and timestamps[frame] - timestamps[state[0]] >= min_duration:
+            start = state[0]
+            min_x, max_x, min_y, max_y = x, x, y, y
+            for window_frame in range(start, frame):
+                min_x, max_x = min(min_x, angles[window_frame, 0]), max(max_x, angles[window_frame, 0])
+                min_y, max_y = min(min_y, angles[window_frame, 1]), max(max_y, angles[window_frame, 1])
+
+            if (max_x - min_x) + (max_y - min_y) <= max_dispersion:
+                bounds[0], bounds[1], bounds[2], bounds[3] = min_x, max_x, min_y, max_y
+                for window_frame in range(start, frame + 1):
+                    labels[window_frame] = 1
+                    fixation_ids[window_frame] = state[2]
+                state[0] = frame + 1
+                state[1] = 1
+                state[2] += 1
+                break
+
+            labels[start] = 2
+            fixation_ids[start] = -1
+            state[0] = start + 1
+
+
+class DispersionThresholdDetector(object):
+    """
+    Incremental I-DT, keeps only the frames of the window which is not decided yet (shorter than min_duration)
+    and the ranges of angles of the open fixation.
+    """
+
+    def __init__(self, max_dispersion=1., min_duration=0.1):
+        """
+        :param max_dispersion: largest sum of horizontal and vertical ranges of a fixation in degrees
+        :param min_duration: shortest fixation in seconds
+        """
+        self.max_dispersion = float(max_dispersion)
+        self.min_duration = float(min_duration)
+        self.reset()
+
+    def reset(self):
+        self.number_of_frames = 0
+        self.pending_angles = np.empty((0, 2))
+        self.pending_timestamps = np.empty(0)
+        self.state = np.zeros(3, dtype=np.int64)
+        self.bounds = np.zeros(4)
+
+    def process(self, centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, timestamps):
+        """
+        Classifies frames, continuing from the previous ones. Frames of a window which may still become a fixation
+        are decided by the next calls (or by finish).
+
+        :param centers_of_cornea_curvature_scs: array of shape (N, 3), not used by I-DT,
+                                                 kept for the same interface as VelocityThresholdDetector
+        :param visual_axis_unit_vectors_scs: array of shape (N, 3)
+        :param timestamps: array of shape (N,) in seconds
+        :return: DetectedFrames with the frames decided by these frames
+        """
+
+        angles = np.concatenate([self.pending_angles,
+                                 calculate_gaze_angles(np.reshape(np.asarray(visual_axis_unit_vectors_scs, dtype=float),
+                                                                  (-1, 3)))])
+        timestamps = np.concatenate([self.pending_timestamps, np.asarray(timestamps, dtype=float)])
+        first_frame = len(self.pending_timestamps)
+        first_index = self.number_of_frames - first_frame
+
+        labels = np.zeros(len(timestamps), dtype=np.int64)
+        fixation_ids = np.full(len(timestamps), -1, dtype=np.int64)
+        dispersion_threshold_kernel(angles, timestamps, first_frame, self.max_dispersion, self.min_duration,
+                                    self.state, self.bounds, labels, fixation_ids)
+
+        decided_count = self.state[0]
+        self.pending_angles = angles[decided_count:]
+        self.pending_timestamps = timestamps[decided_count:]
+        self.state[0] = 0
+        self.number_of_frames += len(timestamps) - first_frame
+
+        return DetectedFrames(first_index + np.arange(decided_count), labels[:decided_count],
+                              fixation_ids[:decided_count])
+
+    def update(self, center_of_cornea_curvature_scs, visual_axis_unit_vector_scs, timestamp):
+        """
+        Classifies one frame.
+
+        :return: DetectedFrames with the frames decided by this frame
+        """
+        return self.process([center_of_cornea_curvature_scs], [visual_axis_unit_vector_scs], [timestamp])
+
+    def finish(self):
+        """
+        Ends the session: the pending frames (shorter than min_duration) are UNCLASSIFIED.
+
+        :return: DetectedFrames with the pending frames
+        """
+        pending_count = len(self.pending_timestamps)
+        indices = self.number_of_frames - pending_count + np.arange(pending_count)
+        self.reset()
+        return DetectedFrames(indices, np.full(pending_count, UNCLASSIFIED), np.full(pending_count, -1))
+
+
+def _detect(detector, centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, timestamps):
+    detected_frames = [detector.process(centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, timestamps),
+                       detector.finish()]
+    return np.concatenate([frames.labels for frames in detected_frames]), \
+        np.concatenate([frames.fixation_ids for frames in detected_frames])
+
+
+def detect_velocity_threshold(centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, timestamps, z_shift,
+                              threshold=30.):
+    """
+    I-VT of a whole session, see VelocityThresholdDetector.
+
+    :return: arrays of shape (N,) with labels and fixation ids
+    """
+    return _detect(VelocityThresholdDetector(z_shift, threshold),
+                   centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, timestamps)
+
+
+def detect_dispersion_threshold(centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, timestamps,
+                                max_dispersion=1., min_duration=0.1):
+    """
+    I-DT of a whole session, see DispersionThresholdDetector.
+
+    :return: arrays of shape (N,) with labels and fixation ids
+    """
+    return _detect(DispersionThresholdDetector(max_dispersion, min_duration),
+                   centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, timestamps)
+
+
+def find_fixations(fixation_ids, timestamps, points_of_interest, min_duration=0.):
+    """
+    Groups frames of every fixation.
+
+    :param fixation_ids: array of shape (N,), -1 for frames which are not in a fixation
+    :param timestamps: array of shape (N,) in seconds
+    :param points_of_interest: array of shape (N, 3)
+    :param min_duration: shorter fixations are dropped
+    :return: Fixations
+    """
+
+    fixation_ids = np.asarray(fixation_ids)
+    frames = np.flatnonzero(fixation_ids >= 0)
+    if len(frames) == 0:
+        return Fixations(np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0), np.empty(0), np.empty((0, 3)))
+
+    # frames of a fixation are consecutive, a new fixation starts where the id changes
+    first_frames = np.flatnonzero(np.diff(fixation_ids[frames], prepend=-1) != 0)
+    starts = frames[first_frames]
+    stops = frames[np.append(first_frames[1:], len(frames)) - 1] + 1
+
+    start_timestamps = timestamps[starts]
+    durations = timestamps[stops - 1] - start_timestamps
+    points_of_interest = np.add.reduceat(points_of_interest[frames], first_frames)/np.diff(
+        np.append(first_frames, len(frames)))[:, np.newaxis]
+
+    long_enough = durations >= min_duration
+    return Fixations(starts[long_enough], stops[long_enough], start_timestamps[long_enough], durations[long_enough],
+                     points_of_interest[long_enough])
@@ -0,0 +1,235 @@
+# Forward model: glints and pupil center on the image of a known eye looking at a known target.
+#
+# The pipeline goes from the image to the point of interest, here the same model of the thesis is used
+# in the opposite direction, so that synthetic frames with ground truth can be generated:
+#   target and cornea center -> visual axis -> optic axis (inverse of formula 2.30) -> pupil center (formula 2.3),
+#   cornea center and every light -> point of reflection on the cornea (law of reflection, formula 3.7) -> glint,
+#   pupil center -> point of refraction on the cornea (Snell's law, formulas 3.29-3.37) -> pupil center on image.
+# Points of reflection and refraction are projected to the image with project_3D_to_2D,
+# and moved by the lens distortion of the rig (see lens_distortion.py).
+# All frames are calculated at once with array operations, the iterative parts (reflection and refraction)
+# are Newton iterations run for all frames together.
+#
+# @author: Anna Eivazi
+
+from collections import namedtuple
+
+import numpy as np
+
+from src.camera_rig import CameraRig
+from src.calculate_optic_axis import calculate_r_batch, calculate_p_batch, dot_product_batch, normalized_batch
+from src.calculate_visual_axis import calculate_optic_axis_unit_vector_from_visual_axis_batch
+from src.lens_distortion import distort_points
+from src.projection_2D_3D import project_3D_to_2D
+
+
+# cornea_centers_wcs: array of shape (N, 3), targets_scs: array of shape (N, 3) with gaze targets on the screen,
+# glints_ics: array of shape (N, L, 2) with glints of all lights of the rig, pupil_centers_ics: array of shape (N, 2),
+# pupil_centers_wcs, optic_axis_unit_vectors: arrays of shape (N, 3)
+SimulatedFrames = namedtuple('SimulatedFrames', ['cornea_centers_wcs', 'targets_scs', 'glints_ics', 'pupil_centers_ics',
+                                                 'pupil_centers_wcs', 'optic_axis_unit_vectors'])
+
+
+def project_to_image_batch(points_wcs, camera_wcs, intrinsics):
+    """
+    Inverse of transform_2D_to_3D_batch: image coordinates of points seen through the camera nodal point.
+
+    transform_2D_to_3D places the image behind the nodal point (z = -focal_length), where it is inverted,
+    so x and y are negated before project_3D_to_2D.
+
+    :param points_wcs: array of shape (..., 3)
+    :param camera_wcs: camera nodal point
+    :param intrinsics: (focal_length, pixel_size_x, pixel_size_y, principal_point_x, principal_point_y)
+    :return: array of shape (..., 2) in Image Coordinate System
+    """
+    directions = points_wcs - camera_wcs
+    x, y = project_3D_to_2D(-directions[..., 0], -directions[..., 1], directions[..., 2], *intrinsics)
+    return np.stack([x, y], axis=-1)
+
+
+def calculate_points_of_reflection_batch(cornea_centers, camera_wcs, lights_wcs, R, tolerance=1e-10, max_iterations=20):
+    """
+    Finds points of reflection of all lights on the cornea (the inverse of formulas 3.2 and 3.7).
+
+    The point of reflection q lies in the plane of the cornea center, the camera and the light,
+    q = c + R*(cos(t)*e1 + sin(t)*e2) with e1 pointing to the camera. The law of reflection holds when
+    the normal bisects the directions to the light and to the camera, i.e. when the tangent of the cornea
+    is orthogonal to unit(l - q) + unit(o - q). This equation is solved for t by Newton iterations
+    starting from half of the angle between the camera and the light.
+
+    :param cornea_centers: array of shape (N, 3) with centers of cornea curvature
+    :param camera_wcs: camera nodal point
+    :param lights_wcs: array of shape (L, 3) with coordinates of lights
+    :param R: radius of cornea curvature (scalar or array of shape (N,))
+    :return: array of shape (N, L, 3) with points of reflection
+    """
+
+    cornea_centers = cornea_centers[:, np.newaxis, :]
+    R = np.asarray(R, dtype=float).reshape(np.shape(R) + (1,) * (np.ndim(R) > 0))
+
+    to_camera = camera_wcs - cornea_centers
+    to_lights = lights_wcs - cornea_centers
+    e1 = np.broadcast_to(normalized_batch(to_camera), to_lights.shape)
+    e2 = normalized_batch(np.cross(np.cross(to_camera, to_lights), e1))
+
+    t = np.arccos(np.clip(dot_product_batch(e1, normalized_batch(to_lights)), -1, 1))/2
+
+    for _ in range(max_iterations):
+        normal = np.cos(t)[..., np.newaxis]*e1 + np.sin(t)[..., np.newaxis]*e2
+        tangent = -np.sin(t)[..., np.newaxis]*e1 + np.cos(t)[..., np.newaxis]*e2
+        q = cornea_centers + R[..., np.newaxis]*normal
+
+        to_light, to_camera_q = lights_wcs - q, camera_wcs - q
+        distance_to_light = np.linalg.norm(to_light, axis=-1)
+        distance_to_camera = np.linalg.norm(to_camera_q, axis=-1)
+        a = to_light/distance_to_light[..., np.newaxis]
+        b = to_camera_q/distance_to_camera[..., np.newaxis]
+
+        residual = dot_product_batch(tangent, a + b)
+        derivative = -dot_product_batch(normal, a + b) - R*((1 - dot_product_batch(a, tangent)**2)/distance_to_light +
+                                                            (1 - dot_product_batch(b, tangent)**2)/distance_to_camera)
+        step = residual/derivative
+        t = t - step
+
+        if not np.nanmax(np.abs(step), initial=0) > tolerance:
+            break
+
+    return cornea_centers + R[..., np.newaxis]*(np.cos(t)[..., np.newaxis]*e1 + np.sin(t)[..., np.newaxis]*e2)
+
+
+def calculate_points_of_refraction_batch(pupil_centers, cornea_centers, camera_wcs, focal_length, R, K, n1, n2,
+                                         tolerance=1e-10, max_iterations=20):
+    """
+    Finds points of refraction of pupil centers on the cornea (the inverse of formulas 3.29-3.37).
+
+    The pupil center on the image plane v = (x, y, -focal_length) is found by Gauss-Newton iterations, such that
+    calculate_p_batch gives back the pupil center, starting from the projection of the pupil center without refraction.
+    The Jacobian is calculated with finite differences at the starting point and reused (chord method).
+
+    :param pupil_centers: array of shape (N, 3) with pupil centers
+    :param cornea_centers: array of shape (N, 3) with centers of cornea curvature
+    :param camera_wcs: camera nodal point
+    :param focal_length: distance between the nodal point and the image plane
+    :param R, K, n1, n2: eye model parameters (scalars or arrays of shape (N,))
+    :return: array of shape (N, 3) with points of refraction
+    """
+
+    def residual(v):
+        r = calculate_r_batch(camera_wcs, v, cornea_centers, R)
+        return calculate_p_batch(camera_wcs, r, cornea_centers, R, K, n1, n2) - pupil_centers
+
+    directions = pupil_centers - camera_wcs
+    v = camera_wcs - (camera_wcs[2] + focal_length)/directions[:, 2:]*directions
+
+    # the Jacobian changes little between the iterations, so it is calculated only once
+    value = residual(v)
+    step_size = 1e-7*focal_length
+    jacobian = np.empty(value.shape + (2,))
+    for axis in range(2):
+        shifted = v.copy()
+        shifted[:, axis] += step_size
+        jacobian[..., axis] = (residual(shifted) - value)/step_size
+
+    # left pseudo-inverse of the (N, 3, 2) Jacobian, the least squares step is -pseudo_inverse * residual
+    jacobian_t = np.swapaxes(jacobian, -1, -2)
+    pseudo_inverse = np.matmul(np.linalg.inv(np.matmul(jacobian_t, jacobian)), jacobian_t)
+
+    for _ in range(max_iterations):
+        step = -np.matmul(pseudo_inverse, value[..., np.newaxis])[..., 0]
+        v[:, :2] += step
+
+        if not np.nanmax(np.abs(step), initial=0) > tolerance:
+            break
+        value = residual(v)
+
+    return calculate_r_batch(camera_wcs, v, cornea_centers, R)
+
+
+def simulate_frames(cornea_centers_wcs, targets_scs, eye=None, chunk_size=4096, rig=None, **kwargs):
+    """
+    Calculates glints and pupil centers on the image of an eye looking at the targets on the screen.
+
+    The result is the ground truth of get_points_of_interest (two lights)
+    and get_points_of_interest_multiple_lights (all lights of the rig).
+
+    :param cornea_centers_wcs: array of shape (N, 3) with centers of cornea curvature
+    :param targets_scs: array of shape (N, 2) with points on the screen (z = rig.z_shift) or (N, 3) with any points
+                        in screen coordinate system
+    :param eye: EyeModel, by default rig.eye, its parameters may be arrays of shape (N,) (see binocular.stack_eye_models)
+    :param chunk_size: number of frames ray-traced at once
+    :param rig: CameraRig, if not given it is created from kwargs
+    :param kwargs: constants dictionary (check in integration_test.constants for an example)
+    :return: SimulatedFrames
+    """
+
+    if rig is None:
+        rig = CameraRig.from_constants(kwargs)
+    if eye is None:
+        eye = rig.eye
+
+    cornea_centers_wcs = np.asarray(cornea_centers_wcs, dtype=float)
+    targets_scs = np.asarray(targets_scs, dtype=float)
+    if targets_scs.shape[-1] == 2:
+        targets_scs = np.concatenate([targets_scs, np.full(targets_scs.shape[:-1] + (1,), rig.z_shift)], axis=-1)
+    if targets_scs.shape != cornea_centers_wcs.shape:
+        raise ValueError('Expected targets for every cornea center, got {} and {}'.format(
+            targets_scs.shape, cornea_centers_wcs.shape))
+
+    # screen coordinate system is rotated by camera_rotation_matrix
+    targets_wcs = np.dot(targets_scs, rig.camera_rotation_matrix)
+    visual_axis_unit_vectors = normalized_batch(targets_wcs - cornea_centers_wcs)
+
+    optic_axis_unit_vectors = \
+        calculate_optic_axis_unit_vector_from_visual_axis_batch(visual_axis_unit_vectors, eye.alpha, eye.beta)
+
+    # Formula 2.3
+    pupil_centers_wcs = cornea_centers_wcs + np.asarray(eye.K_cm)[..., np.newaxis]*optic_axis_unit_vectors
+
+    frames_count = len(cornea_centers_wcs)
+    glints_ics = np.empty((frames_count, len(rig.lights_wcs), 2))
+    pupil_centers_ics = np.empty((frames_count, 2))
+
+    # the iterations create many temporary arrays, in chunks they stay in the processor cache
+    for start in range(0, frames_count, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        R, K, n1, n2 = (value[chunk] if np.ndim(value) else value for value in (eye.R_cm, eye.K_cm, eye.n1, eye.n2))
+
+        points_of_reflection = calculate_points_of_reflection_batch(cornea_centers_wcs[chunk], rig.camera_position_wcs,
+                                                                    rig.lights_wcs, R)
+        points_of_refraction = calculate_points_of_refraction_batch(pupil_centers_wcs[chunk], cornea_centers_wcs[chunk],
+                                                                    rig.camera_position_wcs, rig.focal_length_cm,
+                                                                    R, K, n1, n2)
+
+        glints_ics[chunk] = project_to_image_batch(points_of_reflection, rig.camera_position_wcs, rig.intrinsics)
+        pupil_centers_ics[chunk] = project_to_image_batch(points_of_refraction, rig.camera_position_wcs, rig.intrinsics)
+
+    if rig.distortion_coefficients is not None:
+        glints_ics = distort_points(glints_ics, rig.distortion_coefficients, rig.intrinsics)
+        pupil_centers_ics = distort_points(pupil_centers_ics, rig.distortion_coefficients, rig.intrinsics)
+
+    return SimulatedFrames(cornea_centers_wcs, targets_scs, glints_ics, pupil_centers_ics,
+                           pupil_centers_wcs, optic_axis_unit_vectors)
+
+
+def simulate_random_frames(frames_count, head_box_cm=5., screen_area_cm=((-25., 25.), (-30., 0.)), seed=0,
+                           eye=None, rig=None, **kwargs):
+    """
+    Simulates frames with uniformly random cornea centers and targets.
+
+    :param frames_count: number of frames
+    :param head_box_cm: cornea centers are in a cube with this half size around (0, 0, rig.distance_to_camera_cm)
+    :param screen_area_cm: ((x_min, x_max), (y_min, y_max)) of the targets on the screen
+    :param seed: seed of the random generator
+    :return: SimulatedFrames
+    """
+
+    if rig is None:
+        rig = CameraRig.from_constants(kwargs)
+
+    random = np.random.RandomState(seed)
+    cornea_centers_wcs = np.array([0, 0, rig.distance_to_camera_cm]) + \
+        random.uniform(-head_box_cm, head_box_cm, size=(frames_count, 3))
+    targets_scs = np.stack([random.uniform(*screen_area_cm[0], size=frames_count),
+                            random.uniform(*screen_area_cm[1], size=frames_count)], axis=-1)
+
+    return simulate_frames(cornea_centers_wcs, targets_scs, eye=eye, rig=rig)
@@ -0,0 +1,142 @@
+# Columnar container of frames.
+#
+# All values of N frames (timestamp, glints, pupil, validity flag, the resulting point of interest
+# and the reason code of frames which could not be calculated, see validity.py)
+# are stored in one preallocated structured array with FRAME_DTYPE. Every column is a view into this array,
+# and slicing a FrameBatch gives a FrameBatch which is a view as well, so no values are copied.
+#
+# @author: Anna Eivazi
+
+import numpy as np
+
+from src.camera_rig import CameraRig
+from src.calculate_point_of_interest import get_points_of_interest_and_reasons
+from src.validity import VALID, MISSING_INPUT
+
+
+FRAME_DTYPE = np.dtype([
+    ('timestamp', np.float64),
+    ('glint_1', np.float64, (2,)),
+    ('glint_2', np.float64, (2,)),
+    ('pupil', np.float64, (2,)),
+    ('valid', np.bool_),
+    ('point_of_interest', np.float64, (3,)),
+    ('reason', np.uint8),
+])
+
+
+class FrameBatch(object):
+    """
+    N frames stored in a structured array with FRAME_DTYPE.
+
+    Columns timestamps, glints_1, glints_2, pupils, valid, points_of_interest and reasons are views
+    of shapes (N,), (N, 2), (N, 2), (N, 2), (N,), (N, 3) and (N,), writing into them changes the batch.
+    """
+
+    def __init__(self, frames):
+        """
+        :param frames: one-dimensional structured array with FRAME_DTYPE, used without copying
+        """
+        if frames.dtype != FRAME_DTYPE or frames.ndim != 1:
+            raise ValueError('Expected one-dimensional array with FRAME_DTYPE, got {} of dtype {}'.format(
+                frames.shape, frames.dtype))
+        self.frames = frames
+
+    @classmethod
+    def empty(cls, frames_count):
+        """
+        Preallocates a batch of frames_count frames, all frames are invalid and points of interest are NaN.
+        """
+        frames = np.zeros(frames_count, dtype=FRAME_DTYPE)
+        frames['point_of_interest'] = np.nan
+        return cls(frames)
+
+    @classmethod
+    def from_arrays(cls, glints_1_ics, glints_2_ics, pupil_centers_ics, timestamps=None, valid=None):
+        """
+        Creates a batch from arrays of shape (N, 2) with glints and pupil centers in Image Coordinate System.
+
+        :param timestamps: array of shape (N,), by default frame numbers
+        :param valid: boolean array of shape (N,), by default frames where all coordinates are finite
+        """
+        batch = cls.empty(len(glints_1_ics))
+        batch.glints_1[:] = glints_1_ics
+        batch.glints_2[:] = glints_2_ics
+        batch.pupils[:] = pupil_centers_ics
+        batch.timestamps[:] = np.arange(len(batch)) if timestamps is None else timestamps
+        if valid is None:
+            valid = np.all(np.isfinite(batch.glints_1) & np.isfinite(batch.glints_2) & np.isfinite(batch.pupils),
+                           axis=-1)
+        batch.valid[:] = valid
+        return batch
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        """
+        Returns a FrameBatch for a slice (a view), an index array or a boolean mask (a copy).
+        """
+        if isinstance(index, (int, np.integer)):
+            index = slice(index, index + 1 if index != -1 else None)
+        return FrameBatch(self.frames[index])
+
+    @property
+    def timestamps(self):
+        return self.frames['timestamp']
+
+    @property
+    def glints_1(self):
+        return self.frames['glint_1']
+
+    @property
+    def glints_2(self):
+        return self.frames['glint_2']
+
+    @property
+    def pupils(self):
+        return self.frames['pupil']
+
+    @property
+    def valid(self):
+        return self.frames['valid']
+
+    @property
+    def points_of_interest(self):
+        return self.frames['point_of_interest']
+
+    @property
+    def reasons(self):
+        return self.frames['reason']
+
+    def process(self, rig=None, **kwargs):
+        """
+        Calculates points of interest of the valid frames with get_points_of_interest_and_reasons
+        and writes them and their reason codes into the batch. Points of interest of invalid frames are set to NaN
+        and their reason to MISSING_INPUT. Afterwards only frames with a point of interest are valid.
+
+        :param rig: CameraRig, if not given it is created from kwargs
+        :param kwargs: constants dictionary (check in integration_test.constants for an example)
+        :return: this batch
+        """
+
+        if rig is None:
+            rig = CameraRig.from_constants(kwargs)
+
+        valid = self.valid
+        if np.all(valid):
+            self.points_of_interest[:], self.reasons[:] = \
+                get_points_of_interest_and_reasons(self.glints_1, self.glints_2, self.pupils, rig=rig)
+        else:
+            self.points_of_interest[~valid] = np.nan
+            self.reasons[~valid] = MISSING_INPUT
+            if np.any(valid):
+                self.points_of_interest[valid], self.reasons[valid] = \
+                    get_points_of_interest_and_reasons(self.glints_1[valid],
+                                                       self.glints_2[valid],
+                                                       self.pupils[valid],
+                                                       rig=rig)
+
+        valid[:] = self.reasons == VALID
+
+        return self
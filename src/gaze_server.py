@@ -0,0 +1,235 @@
+# Local gaze estimation server.
+#
+# Several local applications can get gaze of one tracker from the same server instead of embedding the library.
+# Clients connect over TCP or a Unix socket and send frames as lines of JSON:
+#
+#   {"id": 1, "glint_1": [332, 164], "glint_2": [322, 169], "pupil": [323, 163]}
+#
+# and receive, in the same order, lines
+#
+#   {"id": 1, "point_of_interest": [x, y, z]}   or   {"id": 1, "error": "..."}
+#
+# Frames the pipeline can not calculate get the name of their reason code as the error (see validity.py),
+# e.g. {"id": 1, "error": "pupil_ray_misses_cornea"}, so responses never contain NaN (which is not valid JSON).
+# Frames of all clients received within batch_window seconds are coalesced into one micro-batch
+# and processed at once by get_points_of_interest_and_reasons.
+#
+# @author: Anna Eivazi
+
+import asyncio
+import json
+
+import numpy as np
+
+from src.camera_rig import CameraRig
+from src.calculate_point_of_interest import get_points_of_interest_and_reasons
+from src.validity import VALID, REASON_NAMES
+
+
+class GazeServer(object):
+    """
+    asyncio server calculating points of interest in micro-batches.
+    """
+
+    def __init__(self, batch_window=0.002, max_batch_size=256, rig=None, **kwargs):
+        """
+        :param batch_window: time (seconds) to wait for more frames after the first frame of a batch
+        :param max_batch_size: maximal number of frames in one batch
+        :param rig: CameraRig, if not given it is created from kwargs
+        :param kwargs: constants dictionary (check in integration_test.constants for an example)
+        """
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.rig = rig if rig is not None else CameraRig.from_constants(kwargs)
+
+        self.number_of_batches = 0
+        self.number_of_frames = 0
+
+        self._queue = None
+        self._batch_task = None
+        self._servers = []
+
+    async def start_tcp(self, host='127.0.0.1', port=0):
+        """
+        Starts listening on a TCP socket.
+
+        :return: (host, port) the server listens on, useful with port=0
+        """
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        self._start(server)
+        return server.sockets[0].getsockname()[:2]
+
+    async def start_unix(self, path):
+        """
+        Starts listening on a Unix socket.
+        """
+        server = await asyncio.start_unix_server(self._handle_connection, path)
+        self._start(server)
+
+    async def close(self):
+        """
+        Stops all listeners and the batching task.
+        """
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            try:
+                await self._batch_task
+            except asyncio.CancelledError:
+                pass
+            self._batch_task = None
+
+    async def submit(self, glint_1_ics, glint_2_ics, pupil_center_ics):
+        """
+        Calculates point of interest of one frame as a part of the next micro-batch.
+
+        :return: array of shape (3,) with point of interest, NaN if the frame is not valid
+        """
+        point_of_interest, _ = await self.submit_with_reason(glint_1_ics, glint_2_ics, pupil_center_ics)
+        return point_of_interest
+
+    async def submit_with_reason(self, glint_1_ics, glint_2_ics, pupil_center_ics):
+        """
+        Same as submit, with the reason code of the frame (see validity.py).
+
+        :return: array of shape (3,) with point of interest, reason code
+        """
+        if self._batch_task is None:
+            self._start()
+
+        future = asyncio.get_running_loop().create_future()
+        frame = np.array([glint_1_ics, glint_2_ics, pupil_center_ics], dtype=float)
+        if frame.shape != (3, 2):
+            raise ValueError('glint_1, glint_2 and pupil should be 2D points')
+
+        await self._queue.put((frame, future))
+        return await future
+
+    def _start(self, server=None):
+        if server is not None:
+            self._servers.append(server)
+        if self._batch_task is None:
+            self._queue = asyncio.Queue()
+            self._batch_task = asyncio.ensure_future(self._run_batches())
+
+    async def _next_batch(self):
+        """
+        Waits for the first frame, then collects frames until batch_window expires or the batch is full.
+        """
+        loop = asyncio.get_running_loop()
+
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.batch_window
+
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await self._next_batch()
+            frames = np.array([frame for frame, _ in batch])
+
+            try:
+                points_of_interest, reasons = await loop.run_in_executor(None, get_points_of_interest_and_reasons,
+                                                                         frames[:, 0], frames[:, 1], frames[:, 2],
+                                                                         self.rig)
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            self.number_of_batches += 1
+            self.number_of_frames += len(batch)
+
+            for (_, future), point_of_interest, reason in zip(batch, points_of_interest, reasons):
+                if not future.done():
+                    future.set_result((point_of_interest, int(reason)))
+
+    async def _respond(self, request):
+        """
+        Processes one request line and returns the response dictionary.
+        """
+        try:
+            request = json.loads(request)
+            request_id = request.get('id')
+            # Python's json accepts NaN and Infinity, which can not be sent back in the response
+            json.dumps(request_id, allow_nan=False)
+        except (ValueError, AttributeError) as error:
+            return {'id': None, 'error': 'Invalid request: {}'.format(error)}
+
+        try:
+            point_of_interest, reason = await self.submit_with_reason(request['glint_1'], request['glint_2'],
+                                                                      request['pupil'])
+        except KeyError as error:
+            return {'id': request_id, 'error': 'Missing field {}'.format(error)}
+        except (TypeError, ValueError) as error:
+            return {'id': request_id, 'error': str(error)}
+
+        if reason != VALID:
+            return {'id': request_id, 'error': REASON_NAMES[reason]}
+
+        return {'id': request_id, 'point_of_interest': point_of_interest.tolist()}
+
+    async def _handle_connection(self, reader, writer):
+        # responses are written in the order of requests, while requests are processed concurrently
+        responses = asyncio.Queue()
+
+        async def write_responses():
+            while True:
+                response = await responses.get()
+                if response is None:
+                    return
+                writer.write((json.dumps(await response, allow_nan=False) + '\n').encode())
+                await writer.drain()
+
+        writer_task = asyncio.ensure_future(write_responses())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    responses.put_nowait(asyncio.ensure_future(self._respond(line)))
+            responses.put_nowait(None)
+            await writer_task
+        except (ConnectionError, asyncio.CancelledError):
+            writer_task.cancel()
+        finally:
+            writer.close()
+
+
+async def request_points_of_interest(reader, writer, frames):
+    """
+    Client side: sends frames over an open connection and reads the responses.
+
+    :param reader, writer: streams returned by asyncio.open_connection or asyncio.open_unix_connection
+    :param frames: list of (glint_1_ics, glint_2_ics, pupil_center_ics)
+    :return: list of response dictionaries in the order of frames
+    """
+    for request_id, (glint_1, glint_2, pupil) in enumerate(frames):
+        request = {'id': request_id,
+                   'glint_1': [float(value) for value in glint_1],
+                   'glint_2': [float(value) for value in glint_2],
+                   'pupil': [float(value) for value in pupil]}
+        writer.write((json.dumps(request) + '\n').encode())
+    await writer.drain()
+
+    return [json.loads(await reader.readline()) for _ in frames]
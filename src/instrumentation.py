@@ -0,0 +1,104 @@
+# Opt-in instrumentation of the gaze pipeline.
+#
+# get_point_of_interest and the cornea center solvers accept an optional stats object.
+# When it is given, wall time of every stage, solver iterations and function evaluations, and failures
+# are recorded in it. When it is None (default), nothing is measured and the pipeline runs as before.
+#
+# @author: Anna Eivazi
+
+from collections import Counter, defaultdict, deque
+import time
+
+import numpy as np
+
+
+class PipelineStats(object):
+    """
+    Collects measurements of the pipeline and summarizes them with percentiles.
+
+    Only the last `window` values of every measurement are kept, so memory does not grow with the
+    number of frames. Every recorded event is also passed to the callback, if given, as a dictionary:
+    {'type': 'stage', 'stage': ..., 'seconds': ...},
+    {'type': 'solver', 'solver': ..., 'iterations': ..., 'evaluations': ..., 'converged': ...},
+    {'type': 'failure', 'stage': ..., 'error': ...}
+    """
+
+    def __init__(self, window=10000, callback=None):
+        """
+        :param window: number of last values kept for percentiles
+        :param callback: function called with every event
+        """
+        self.window = window
+        self.callback = callback
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets all measurements.
+        """
+        self.stage_seconds = defaultdict(lambda: deque(maxlen=self.window))
+        self.solver_iterations = defaultdict(lambda: deque(maxlen=self.window))
+        self.solver_evaluations = defaultdict(lambda: deque(maxlen=self.window))
+        self.solver_not_converged = Counter()
+        self.failures = Counter()
+        self.last_errors = deque(maxlen=10)
+
+    def record_stage(self, stage, seconds):
+        self.stage_seconds[stage].append(seconds)
+        if self.callback is not None:
+            self.callback({'type': 'stage', 'stage': stage, 'seconds': seconds})
+
+    def record_solver(self, solver, iterations, evaluations, converged):
+        self.solver_iterations[solver].append(iterations)
+        self.solver_evaluations[solver].append(evaluations)
+        if not converged:
+            self.solver_not_converged[solver] += 1
+        if self.callback is not None:
+            self.callback({'type': 'solver', 'solver': solver, 'iterations': iterations,
+                           'evaluations': evaluations, 'converged': converged})
+
+    def record_failure(self, stage, error):
+        self.failures[stage] += 1
+        self.last_errors.append((stage, repr(error)))
+        if self.callback is not None:
+            self.callback({'type': 'failure', 'stage': stage, 'error': error})
+
+    def time_stage(self, stage, function, *args, **kwargs):
+        """
+        Calls function(*args, **kwargs), records its wall time under the stage name,
+        or the failure if it raises (the exception is re-raised).
+        """
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except Exception as error:
+            self.record_failure(stage, error)
+            raise
+        self.record_stage(stage, time.perf_counter() - start)
+        return result
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """
+        Summarizes the measurements:
+        {'stages': {stage: {'count', 'mean', 'p50', ...}},
+         'solvers': {solver: {'count', 'not_converged', 'iterations': {...}, 'evaluations': {...}}},
+         'failures': {stage: count}}
+        Times are given in seconds.
+        """
+
+        def describe(values):
+            values = np.asarray(values, dtype=float)
+            description = {'count': len(values), 'mean': float(np.mean(values))}
+            for percentile, value in zip(percentiles, np.percentile(values, percentiles)):
+                description['p{:g}'.format(percentile)] = float(value)
+            return description
+
+        return {
+            'stages': {stage: describe(seconds) for stage, seconds in self.stage_seconds.items() if seconds},
+            'solvers': {solver: {'count': len(iterations),
+                                 'not_converged': self.solver_not_converged[solver],
+                                 'iterations': describe(iterations),
+                                 'evaluations': describe(self.solver_evaluations[solver])}
+                        for solver, iterations in self.solver_iterations.items() if iterations},
+            'failures': dict(self.failures)
+        }
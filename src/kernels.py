@@ -0,0 +1,362 @@
+# Scalar-arithmetic kernels of the per-frame math.
+#
+# The formulas of calculate_optic_axis.py and calculate_cornea_center.py work on 3-element vectors,
+# where the overhead of a NumPy call is much larger than the arithmetic itself. Here the same formulas are
+# written with scalar arithmetic only and fused into one kernel per task, which numba compiles to machine code.
+#
+# numba is optional: COMPILED is True when it is importable, and only then the pipeline uses the kernels
+# (see calculate_optic_axis.calculate_optic_axis_unit_vector_fast, calculate_optic_axis_unit_vector_batch_fast
+# and calculate_cornea_center.CORNEA_CENTER_SOLVERS).
+# Without numba the kernels still run as plain Python, which is only useful for testing them,
+# and the pipeline uses the NumPy functions, which stay the reference implementation.
+#
+# @author: Anna Eivazi
+
+import math
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+COMPILED = numba is not None
+
+# relative increase of the cost of the Levenberg-Marquardt solvers explained by rounding errors at the minimum
+COST_RELATIVE_TOLERANCE = 1e-12
+
+
+def jit(function):
+    """
+    Compiles function with numba in nopython mode if numba is available.
+    """
+    if numba is None:
+        return function
+    return numba.njit(cache=True)(function)
+
+
+@jit
+def _dot(ax, ay, az, bx, by, bz):
+    return ax*bx + ay*by + az*bz
+
+
+@jit
+def _normalized(x, y, z):
+    magnitude = math.sqrt(x*x + y*y + z*z)
+    return x/magnitude, y/magnitude, z/magnitude
+
+
+@jit
+def _normalized_with_derivative(x, y, z, dx, dy, dz):
+    # d(v/|v|) = (dv - v_unit * (v_unit dot dv)) / |v|, see calculate_cornea_center.normalized_with_derivative
+    magnitude = math.sqrt(x*x + y*y + z*z)
+    ux, uy, uz = x/magnitude, y/magnitude, z/magnitude
+    projection = ux*dx + uy*dy + uz*dz
+    return ux, uy, uz, (dx - ux*projection)/magnitude, (dy - uy*projection)/magnitude, (dz - uz*projection)/magnitude
+
+
+@jit
+def optic_axis_unit_vector_kernel(o, v, c, R, K, n1, n2, omega):
+    """
+    Fused formulas 3.29, 2.42, 3.31-3.34, 3.37 and 3.38 of calculate_optic_axis_unit_vector for one frame.
+
+    :param o: camera nodal point
+    :param v: pupil center on image
+    :param c: center of cornea curvature
+    :param R, K, n1, n2: eye model parameters
+    :param omega: output array of shape (3,) for the unit vector of optic axis
+    """
+
+    # Formula 3.29
+    ovx, ovy, ovz = o[0] - v[0], o[1] - v[1], o[2] - v[2]
+    ocx, ocy, ocz = o[0] - c[0], o[1] - c[1], o[2] - c[2]
+    a = _dot(ovx, ovy, ovz, ovx, ovy, ovz)
+    b = _dot(ovx, ovy, ovz, ocx, ocy, ocz)
+    cc = _dot(ocx, ocy, ocz, ocx, ocy, ocz) - R*R
+    kr = (-b - math.sqrt(b*b - a*cc))/a
+
+    # Formula 2.42
+    rx, ry, rz = o[0] + kr*ovx, o[1] + kr*ovy, o[2] + kr*ovz
+
+    # Formulas 3.31-3.33
+    zx, zy, zz = _normalized(o[0] - rx, o[1] - ry, o[2] - rz)
+    ex, ey, ez = (rx - c[0])/R, (ry - c[1])/R, (rz - c[2])/R
+    eta_dot_zeta = _dot(ex, ey, ez, zx, zy, zz)
+    n1_n2_ratio = n1/n2
+    a = eta_dot_zeta - math.sqrt(n1_n2_ratio*n1_n2_ratio - 1 + eta_dot_zeta*eta_dot_zeta)
+    ix, iy, iz = (a*ex - zx)/n1_n2_ratio, (a*ey - zy)/n1_n2_ratio, (a*ez - zz)/n1_n2_ratio
+
+    # Formulas 3.37, 3.34
+    rc_dot_iota = _dot(rx - c[0], ry - c[1], rz - c[2], ix, iy, iz)
+    kp = -rc_dot_iota - math.sqrt(rc_dot_iota*rc_dot_iota - (R*R - K*K))
+    px, py, pz = rx + kp*ix, ry + kp*iy, rz + kp*iz
+
+    # Formula 3.38
+    omega[0], omega[1], omega[2] = _normalized(px - c[0], py - c[1], pz - c[2])
+
+
+@jit
+def optic_axis_unit_vectors_kernel(o, v, c, R, K, n1, n2, omega):
+    """
+    optic_axis_unit_vector_kernel for N frames, v, c and omega are arrays of shape (N, 3),
+    R, K, n1, n2 are arrays of shape (N,).
+    """
+    for i in range(v.shape[0]):
+        optic_axis_unit_vector_kernel(o, v[i], c[i], R[i], K[i], n1[i], n2[i], omega[i])
+
+
+@jit
+def _cornea_center_with_derivative(kq, o, u, l, R):
+    # formulas 3.2 and 3.7 and the derivative dc/dkq, see calculate_cornea_center.calculate_c_derivative
+    dx, dy, dz = _normalized(o[0] - u[0], o[1] - u[1], o[2] - u[2])
+    qx, qy, qz = o[0] + kq*dx, o[1] + kq*dy, o[2] + kq*dz
+
+    lx, ly, lz, dlx, dly, dlz = _normalized_with_derivative(l[0] - qx, l[1] - qy, l[2] - qz, -dx, -dy, -dz)
+    ox, oy, oz, dox, doy, doz = _normalized_with_derivative(o[0] - qx, o[1] - qy, o[2] - qz, -dx, -dy, -dz)
+    bx, by, bz, dbx, dby, dbz = _normalized_with_derivative(lx + ox, ly + oy, lz + oz, dlx + dox, dly + doy, dlz + doz)
+
+    return qx - R*bx, qy - R*by, qz - R*bz, dx - R*dbx, dy - R*dby, dz - R*dbz
+
+
+@jit
+def cornea_center_kernel(u1, u2, o, l1, l2, R, kq, tolerance, max_iterations, damping, gauss_newton, cornea_center):
+    """
+    Levenberg-Marquardt iterations of solve_kq_levenberg_marquardt for one frame, where steps increasing the cost
+    are rejected.
+
+    :param kq: array of shape (2,) with the initial solution, overwritten with the solution
+    :param gauss_newton: if True, every step is accepted, which with damping 0 gives
+                         Gauss-Newton iterations of solve_cornea_centers_wcs_batch
+    :param cornea_center: output array of shape (3,) for the cornea center
+    :return: number of iterations, and whether the iterations have converged
+    """
+
+    c1x, c1y, c1z, d1x, d1y, d1z = _cornea_center_with_derivative(kq[0], o, u1, l1, R)
+    c2x, c2y, c2z, d2x, d2y, d2z = _cornea_center_with_derivative(kq[1], o, u2, l2, R)
+    cost = (c1x - c2x)**2 + (c1y - c2y)**2 + (c1z - c2z)**2
+
+    iterations = 0
+    converged = False
+    while iterations < max_iterations:
+        iterations += 1
+
+        # residual c1 - c2 and its Jacobian [dc1/dkq1, -dc2/dkq2]
+        residual_x, residual_y, residual_z = c1x - c2x, c1y - c2y, c1z - c2z
+        a = _dot(d1x, d1y, d1z, d1x, d1y, d1z)
+        b = -_dot(d1x, d1y, d1z, d2x, d2y, d2z)
+        c = _dot(d2x, d2y, d2z, d2x, d2y, d2z)
+        g1 = _dot(d1x, d1y, d1z, residual_x, residual_y, residual_z)
+        g2 = -_dot(d2x, d2y, d2z, residual_x, residual_y, residual_z)
+
+        a_damped = a*(1 + damping)
+        c_damped = c*(1 + damping)
+        determinant = a_damped*c_damped - b*b
+        delta1 = -(c_damped*g1 - b*g2)/determinant
+        delta2 = -(a_damped*g2 - b*g1)/determinant
+
+        new_c1 = _cornea_center_with_derivative(kq[0] + delta1, o, u1, l1, R)
+        new_c2 = _cornea_center_with_derivative(kq[1] + delta2, o, u2, l2, R)
+        new_cost = (new_c1[0] - new_c2[0])**2 + (new_c1[1] - new_c2[1])**2 + (new_c1[2] - new_c2[2])**2
+
+        # see calculate_cornea_center.solve_kq_levenberg_marquardt
+        small_step = abs(delta1) < tolerance and abs(delta2) < tolerance and \
+            (gauss_newton or new_cost <= cost*(1 + COST_RELATIVE_TOLERANCE))
+
+        if gauss_newton or new_cost <= cost:
+            kq[0] += delta1
+            kq[1] += delta2
+            c1x, c1y, c1z, d1x, d1y, d1z = new_c1
+            c2x, c2y, c2z, d2x, d2y, d2z = new_c2
+            cost = new_cost
+            damping /= 10
+        else:
+            damping *= 10
+
+        if small_step:
+            converged = True
+            break
+
+    cornea_center[0] = (c1x + c2x)/2
+    cornea_center[1] = (c1y + c2y)/2
+    cornea_center[2] = (c1z + c2z)/2
+
+    return iterations, converged
+
+
+@jit
+def cornea_centers_kernel(u1, u2, o, l1, l2, R, kq, tolerance, max_iterations, cornea_centers, iterations, converged):
+    """
+    cornea_center_kernel with Gauss-Newton iterations for N frames,
+    u1, u2, cornea_centers are arrays of shape (N, 3), R of shape (N,), kq of shape (N, 2).
+    """
+    for i in range(u1.shape[0]):
+        iterations[i], converged[i] = \
+            cornea_center_kernel(u1[i], u2[i], o, l1, l2, R[i], kq[i], tolerance, max_iterations, 0., True,
+                                 cornea_centers[i])
+
+
+@jit
+def interpolate_map_kernel(points, grid_values, step, values):
+    """
+    Bilinear interpolation of lens_distortion.interpolate_map for every point.
+    """
+    rows, columns = grid_values.shape[0], grid_values.shape[1]
+    for i in range(points.shape[0]):
+        grid_x, grid_y = points[i, 0]/step, points[i, 1]/step
+        # NaN points are outside as well
+        if not (0 <= grid_x <= columns - 1 and 0 <= grid_y <= rows - 1):
+            values[i, 0], values[i, 1] = math.nan, math.nan
+            continue
+
+        column, row = min(int(grid_x), columns - 2), min(int(grid_y), rows - 2)
+        fraction_x, fraction_y = grid_x - column, grid_y - row
+        for j in range(2):
+            top = grid_values[row, column, j] + fraction_x*(grid_values[row, column + 1, j] - grid_values[row, column, j])
+            bottom = grid_values[row + 1, column, j] + \
+                fraction_x*(grid_values[row + 1, column + 1, j] - grid_values[row + 1, column, j])
+            values[i, j] = top + fraction_y*(bottom - top)
+
+
+@jit
+def interpolate_grid_kernel(points, axes, axes_offsets, grid_values, values):
+    """
+    Multilinear interpolation of lookup_table.interpolate_grid for every point.
+
+    axes are concatenated, the axis of dimension d is axes[axes_offsets[d]:axes_offsets[d + 1]],
+    grid_values is the grid reshaped to (number of grid points, number of values) in C order.
+    """
+    dimensions = len(axes_offsets) - 1
+    indices = np.empty(dimensions, dtype=np.int64)
+    fractions = np.empty(dimensions)
+    strides = np.empty(dimensions, dtype=np.int64)
+    stride = 1
+    for d in range(dimensions - 1, -1, -1):
+        strides[d] = stride
+        stride *= axes_offsets[d + 1] - axes_offsets[d]
+
+    # weights and grid indices of the corners of the cell, built dimension by dimension
+    corner_weights = np.empty(1 << dimensions)
+    corner_indices = np.empty(1 << dimensions, dtype=np.int64)
+
+    for i in range(points.shape[0]):
+        inside = True
+        for d in range(dimensions):
+            axis = axes[axes_offsets[d]:axes_offsets[d + 1]]
+            x = points[i, d]
+            # NaN points are outside as well
+            if not (axis[0] <= x <= axis[-1]):
+                inside = False
+                break
+            index = min(np.searchsorted(axis, x, side='right') - 1, len(axis) - 2)
+            indices[d] = index
+            fractions[d] = (x - axis[index])/(axis[index + 1] - axis[index])
+
+        if not inside:
+            for j in range(values.shape[1]):
+                values[i, j] = math.nan
+            continue
+
+        corner_weights[0] = 1.
+        corner_indices[0] = 0
+        corners_count = 1
+        for d in range(dimensions):
+            for k in range(corners_count):
+                corner_weights[corners_count + k] = corner_weights[k]*fractions[d]
+                corner_indices[corners_count + k] = corner_indices[k] + (indices[d] + 1)*strides[d]
+                corner_weights[k] *= 1 - fractions[d]
+                corner_indices[k] += indices[d]*strides[d]
+            corners_count *= 2
+
+        for j in range(values.shape[1]):
+            value = 0.
+            for k in range(corners_count):
+                value += corner_weights[k]*grid_values[corner_indices[k], j]
+            values[i, j] = value
+
+
+def _as_vector(vector):
+    return np.ascontiguousarray(vector, dtype=float)
+
+
+def optic_axis_unit_vector(pupil_wcs, camera_wcs, cornea_wcs, R, K, n1, n2):
+    """
+    Same as calculate_optic_axis.calculate_optic_axis_unit_vector, calculated by optic_axis_unit_vector_kernel.
+    """
+    omega = np.empty(3)
+    optic_axis_unit_vector_kernel(_as_vector(camera_wcs), _as_vector(pupil_wcs), _as_vector(cornea_wcs),
+                                  float(R), float(K), float(n1), float(n2), omega)
+    return omega
+
+
+def optic_axis_unit_vectors(pupil_wcs, camera_wcs, cornea_wcs, R, K, n1, n2):
+    """
+    Same as calculate_optic_axis.calculate_optic_axis_unit_vector_batch, calculated by optic_axis_unit_vectors_kernel.
+    """
+    pupil_wcs = _as_vector(pupil_wcs)
+    frames_count = len(pupil_wcs)
+    R, K, n1, n2 = (_as_vector(np.broadcast_to(value, (frames_count,))) for value in (R, K, n1, n2))
+
+    omega = np.empty((frames_count, 3))
+    optic_axis_unit_vectors_kernel(_as_vector(camera_wcs), pupil_wcs, _as_vector(cornea_wcs), R, K, n1, n2, omega)
+    return omega
+
+
+def solve_kq_levenberg_marquardt(u1_wcs, u2_wcs, o_wcs, l1_wcs, l2_wcs, R, initial_solution,
+                                 tolerance=1e-9, max_iterations=20, damping=1e-3, stats=None):
+    """
+    Same as calculate_cornea_center.solve_kq_levenberg_marquardt, calculated by cornea_center_kernel.
+    """
+    kq = np.array(initial_solution, dtype=float)
+    iterations, converged = cornea_center_kernel(_as_vector(u1_wcs), _as_vector(u2_wcs), _as_vector(o_wcs),
+                                                 _as_vector(l1_wcs), _as_vector(l2_wcs), float(R), kq,
+                                                 tolerance, max_iterations, damping, False, np.empty(3))
+
+    if stats is not None:
+        stats.record_solver('levenberg_marquardt', iterations, iterations + 1, converged)
+
+    return kq
+
+
+def solve_cornea_centers_wcs_batch(u1_wcs, u2_wcs, o_wcs, l1_wcs, l2_wcs, R, initial_solution,
+                                   tolerance=1e-9, max_iterations=20):
+    """
+    Same as calculate_cornea_center.solve_cornea_centers_wcs_batch, calculated by cornea_centers_kernel.
+    """
+    u1_wcs = _as_vector(u1_wcs)
+    frames_count = len(u1_wcs)
+
+    kq = np.empty((frames_count, 2))
+    kq[:] = initial_solution
+    cornea_centers = np.empty((frames_count, 3))
+    iterations = np.zeros(frames_count, dtype=np.int64)
+    converged = np.zeros(frames_count, dtype=np.bool_)
+
+    cornea_centers_kernel(u1_wcs, _as_vector(u2_wcs), _as_vector(o_wcs), _as_vector(l1_wcs), _as_vector(l2_wcs),
+                          _as_vector(np.broadcast_to(R, (frames_count,))), kq, tolerance, max_iterations,
+                          cornea_centers, iterations, converged)
+
+    return cornea_centers, iterations, converged
+
+
+def interpolate_map(points, grid_values, step):
+    """
+    Same as lens_distortion.interpolate_map, calculated by interpolate_map_kernel.
+    """
+    values = np.empty((len(points), 2))
+    interpolate_map_kernel(np.ascontiguousarray(points, dtype=np.float64), grid_values, float(step), values)
+    return values
+
+
+def interpolate_grid(points, axes, grid_values):
+    """
+    Same as lookup_table.interpolate_grid, calculated by interpolate_grid_kernel.
+    """
+    values_count = grid_values.shape[-1]
+    axes_offsets = np.cumsum([0] + [len(axis) for axis in axes])
+    values = np.empty((len(points), values_count))
+    interpolate_grid_kernel(np.ascontiguousarray(points, dtype=np.float64),
+                            np.ascontiguousarray(np.concatenate(axes), dtype=np.float64), axes_offsets,
+                            np.ascontiguousarray(grid_values, dtype=np.float64).reshape(-1, values_count), values)
+    return values
@@ -0,0 +1,202 @@
+# Lens distortion of the camera.
+#
+# transform_2D_to_3D assumes an ideal pinhole camera. Real lenses (especially wide-angle ones) move the image points
+# radially and tangentially, which is described by the Brown-Conrady model with coefficients k1, k2, p1, p2, k3
+# (the order used by OpenCV). In normalized coordinates x = (x_ics - principal_point_x)*pixel_size_x/focal_length
+# (y similarly) and r^2 = x^2 + y^2, an ideal point moves to:
+#   x_d = x*(1 + k1*r^2 + k2*r^4 + k3*r^6) + 2*p1*x*y + p2*(r^2 + 2*x^2)
+#   y_d = y*(1 + k1*r^2 + k2*r^4 + k3*r^6) + p1*(r^2 + 2*y^2) + 2*p2*x*y
+# The inverse has no closed form and is found by fixed point iterations, which is too slow for every glint.
+# UndistortionMap stores undistorted coordinates of a grid over the sensor, built once per rig (see camera_rig.py),
+# and undistorts points by bilinear interpolation in this grid (compiled by numba if available, see kernels.py).
+#
+# @author: Anna Eivazi
+
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from src import kernels
+
+
+DISTORTION_COEFFICIENTS_COUNT = 5
+
+
+def _to_normalized(points_ics, intrinsics):
+    focal_length, pixel_size_x, pixel_size_y, principal_point_x, principal_point_y = intrinsics
+    return ((points_ics[..., 0] - principal_point_x) * pixel_size_x / focal_length,
+            (points_ics[..., 1] - principal_point_y) * pixel_size_y / focal_length)
+
+
+def _to_image(x, y, intrinsics):
+    focal_length, pixel_size_x, pixel_size_y, principal_point_x, principal_point_y = intrinsics
+    return np.stack([x * focal_length / pixel_size_x + principal_point_x,
+                     y * focal_length / pixel_size_y + principal_point_y], axis=-1)
+
+
+def distort_points(points_ics, distortion_coefficients, intrinsics):
+    """
+    Moves ideal (pinhole) image points to where the lens with the distortion coefficients images them.
+
+    :param points_ics: array of shape (..., 2) in Image Coordinate System
+    :param distortion_coefficients: k1, k2, p1, p2, k3
+    :param intrinsics: (focal_length, pixel_size_x, pixel_size_y, principal_point_x, principal_point_y)
+    :return: array of shape (..., 2) with distorted points
+    """
+
+    k1, k2, p1, p2, k3 = distortion_coefficients
+    x, y = _to_normalized(np.asarray(points_ics, dtype=float), intrinsics)
+
+    r2 = x*x + y*y
+    radial = 1 + r2*(k1 + r2*(k2 + r2*k3))
+
+    return _to_image(x*radial + 2*p1*x*y + p2*(r2 + 2*x*x),
+                     y*radial + p1*(r2 + 2*y*y) + 2*p2*x*y,
+                     intrinsics)
+
+
+def undistort_points_iterative(points_ics, distortion_coefficients, intrinsics, tolerance=1e-12, max_iterations=100):
+    """
+    Inverse of distort_points by fixed point iterations x = (x_d - tangential(x))/radial(x).
+
+    :param points_ics: array of shape (..., 2) with distorted points in Image Coordinate System
+    :param distortion_coefficients: k1, k2, p1, p2, k3
+    :param intrinsics: (focal_length, pixel_size_x, pixel_size_y, principal_point_x, principal_point_y)
+    :param tolerance: iterations stop when all steps in normalized coordinates are smaller than tolerance
+    :param max_iterations: maximum number of iterations
+    :return: array of shape (..., 2) with ideal (pinhole) points
+    """
+
+    k1, k2, p1, p2, k3 = distortion_coefficients
+    x_distorted, y_distorted = _to_normalized(np.asarray(points_ics, dtype=float), intrinsics)
+
+    x, y = x_distorted, y_distorted
+    for _ in range(max_iterations):
+        r2 = x*x + y*y
+        radial = 1 + r2*(k1 + r2*(k2 + r2*k3))
+        x_next = (x_distorted - 2*p1*x*y - p2*(r2 + 2*x*x))/radial
+        y_next = (y_distorted - p1*(r2 + 2*y*y) - 2*p2*x*y)/radial
+
+        step = np.maximum(np.abs(x_next - x), np.abs(y_next - y))
+        x, y = x_next, y_next
+        if not np.nanmax(step, initial=0) > tolerance:
+            break
+
+    return _to_image(x, y, intrinsics)
+
+
+class UndistortionMap(namedtuple('UndistortionMap', ['undistorted_points', 'step_px', 'distortion_coefficients',
+                                                     'intrinsics', 'image_size'])):
+    """
+    Immutable lookup map of undistorted coordinates over the sensor.
+
+    undistorted_points: array of shape (H, W, 2) with undistorted coordinates of the grid points
+                        (x, y) = (column*step_px, row*step_px)
+    step_px: distance between grid points in pixels
+    distortion_coefficients, intrinsics: used for points outside of the map
+    image_size: width and height of the sensor in pixels
+    """
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, distortion_coefficients, intrinsics, image_size, step_px=1.):
+        """
+        Calculates the map with undistort_points_iterative.
+        Maps are memoized by their parameters, thus rigs with the same camera share the map and it is built once.
+
+        :param distortion_coefficients: k1, k2, p1, p2, k3
+        :param intrinsics: (focal_length, pixel_size_x, pixel_size_y, principal_point_x, principal_point_y)
+        :param image_size: width and height of the sensor in pixels
+        :param step_px: distance between grid points in pixels
+        :return: UndistortionMap
+        """
+
+        width, height = image_size
+        if width <= 1 or height <= 1:
+            raise ValueError('image_size should be larger than one pixel, got {}'.format(image_size))
+        if step_px <= 0:
+            raise ValueError('step_px should be positive, got {}'.format(step_px))
+
+        distortion_coefficients = tuple(float(value) for value in distortion_coefficients)
+        intrinsics = tuple(float(value) for value in intrinsics)
+        undistorted_points = _calculate_undistorted_points(distortion_coefficients, intrinsics,
+                                                           float(width), float(height), float(step_px))
+
+        return cls(undistorted_points, float(step_px), distortion_coefficients, intrinsics, (width, height))
+
+    def undistort(self, points_ics):
+        """
+        Undistorts points by bilinear interpolation in the map, points outside of the map
+        are undistorted by undistort_points_iterative.
+
+        :param points_ics: array of shape (..., 2) with distorted points in Image Coordinate System
+        :return: array of shape (..., 2) with ideal (pinhole) points, NaN for NaN points
+        """
+
+        points_ics = np.asarray(points_ics, dtype=float)
+        undistorted_points = interpolate_map_fast(points_ics.reshape(-1, 2), self.undistorted_points,
+                                                  self.step_px).reshape(points_ics.shape)
+
+        outside = np.isnan(undistorted_points[..., 0]) & np.all(np.isfinite(points_ics), axis=-1)
+        if np.any(outside):
+            undistorted_points[outside] = undistort_points_iterative(points_ics[outside], self.distortion_coefficients,
+                                                                     self.intrinsics)
+
+        return undistorted_points
+
+
+@lru_cache(maxsize=8)
+def _calculate_undistorted_points(distortion_coefficients, intrinsics, width, height, step_px):
+    """
+    Undistorted coordinates of the grid over the sensor for UndistortionMap.create, as a read-only array.
+    """
+
+    # the grid covers the sensor from pixel 0 up to pixel width - 1 and height - 1
+    xs = np.arange(int(np.ceil((width - 1)/step_px)) + 1) * step_px
+    ys = np.arange(int(np.ceil((height - 1)/step_px)) + 1) * step_px
+    grid = np.stack(np.meshgrid(xs, ys), axis=-1)
+
+    undistorted_points = undistort_points_iterative(grid, distortion_coefficients, intrinsics)
+    undistorted_points.setflags(write=False)
+
+    return undistorted_points
+
+
+def interpolate_map(points, grid_values, step):
+    """
+    Bilinear interpolation of values given on a regular grid with the first point at zero.
+
+    :param points: array of shape (N, 2) with x, y
+    :param grid_values: array of shape (H, W, 2) with values at (x, y) = (column*step, row*step)
+    :param step: distance between grid points
+    :return: array of shape (N, 2), NaN for points outside of the grid
+    """
+
+    rows, columns = grid_values.shape[:2]
+    grid_x, grid_y = points[:, 0] / step, points[:, 1] / step
+    inside = (grid_x >= 0) & (grid_x <= columns - 1) & (grid_y >= 0) & (grid_y <= rows - 1)
+
+    # the last grid point belongs to the last cell
+    grid_x, grid_y = np.where(inside, grid_x, 0), np.where(inside, grid_y, 0)
+    column, row = np.minimum(grid_x.astype(np.intp), columns - 2), np.minimum(grid_y.astype(np.intp), rows - 2)
+    fraction_x, fraction_y = (grid_x - column)[:, np.newaxis], (grid_y - row)[:, np.newaxis]
+
+    flat_values = grid_values.reshape(-1, 2)
+    index = row * columns + column
+    top_left, top_right = flat_values[index], flat_values[index + 1]
+    bottom_left, bottom_right = flat_values[index + columns], flat_values[index + columns + 1]
+
+    top = top_left + fraction_x * (top_right - top_left)
+    values = top + fraction_y * (bottom_left + fraction_x * (bottom_right - bottom_left) - top)
+    values[~inside] = np.nan
+
+    return values
+
+
+# Implementation used by UndistortionMap.undistort: the compiled kernel if numba is available (see kernels.py),
+# otherwise the NumPy function above, which stays the reference.
+if kernels.COMPILED:
+    interpolate_map_fast = kernels.interpolate_map
+else:
+    interpolate_map_fast = interpolate_map
@@ -0,0 +1,231 @@
+# Lookup table surrogate of the pipeline for a fixed rig and a calibrated subject.
+#
+# With the rig and the eye model fixed, the point of interest is a smooth function of the glints and the pupil.
+# The table stores points of interest calculated by the exact pipeline on a regular grid over the operating range,
+# and frames are served by multilinear interpolation in this grid (compiled by numba if available, see kernels.py).
+# The frame is described by 6 features:
+#   glint midpoint x, y; glint_1 - glint_2 x, y; pupil - glint midpoint x, y (pixels).
+# Frames outside of the grid (or close to grid points where the pipeline fails) are calculated by the exact pipeline.
+#
+# The error of the interpolation is measured when the table is built, on the frames of the operating range
+# and on random points of the grid domain, and kept in error_bound_cm.
+#
+# @author: Anna Eivazi
+
+from itertools import product
+
+import numpy as np
+
+from src import kernels
+from src.camera_rig import CameraRig
+from src.calculate_point_of_interest import get_points_of_interest
+
+
+FEATURES_COUNT = 6
+
+# number of grid points of every feature, the glint difference changes only with the distance to the camera
+DEFAULT_GRID_SHAPE = (6, 6, 6, 2, 10, 10)
+
+
+def calculate_features(glints_1_ics, glints_2_ics, pupil_centers_ics):
+    """
+    :return: array of shape (N, 6) with glint midpoints, glint differences and pupil to glint midpoint vectors
+    """
+    glints_1_ics, glints_2_ics, pupil_centers_ics = \
+        (np.asarray(values, dtype=float) for values in (glints_1_ics, glints_2_ics, pupil_centers_ics))
+    midpoints = (glints_1_ics + glints_2_ics)/2
+    return np.concatenate([midpoints, glints_1_ics - glints_2_ics, pupil_centers_ics - midpoints], axis=-1)
+
+
+def calculate_frames(features):
+    """
+    Inverse of calculate_features.
+
+    :return: glints_1_ics, glints_2_ics, pupil_centers_ics, arrays of shape (N, 2)
+    """
+    midpoints, differences, pupils = features[:, 0:2], features[:, 2:4], features[:, 4:6]
+    return midpoints + differences/2, midpoints - differences/2, midpoints + pupils
+
+
+def interpolate_grid(points, axes, grid_values):
+    """
+    Multilinear interpolation of values given on a regular grid.
+
+    :param points: array of shape (N, D)
+    :param axes: D increasing arrays with grid points of every dimension
+    :param grid_values: array of shape (len(axes[0]), ..., len(axes[D - 1]), V)
+    :return: array of shape (N, V), NaN for points outside of the grid
+    """
+
+    inside = np.ones(len(points), dtype=bool)
+    indices, fractions = [], []
+    for x, axis in zip(points.T, axes):
+        inside &= (x >= axis[0]) & (x <= axis[-1])
+        # the last grid point belongs to the last cell
+        index = np.clip(np.searchsorted(axis, x, side='right') - 1, 0, len(axis) - 2)
+        indices.append(index)
+        fractions.append((x - axis[index])/(axis[index + 1] - axis[index]))
+
+    values = np.zeros((len(points), grid_values.shape[-1]))
+    for corner in product((0, 1), repeat=len(axes)):
+        weight = np.prod([fraction if bit else 1 - fraction for fraction, bit in zip(fractions, corner)], axis=0)
+        values += weight[:, np.newaxis] * grid_values[tuple(index + bit for index, bit in zip(indices, corner))]
+    values[~inside] = np.nan
+
+    return values
+
+
+# Implementation used by GazeLookupTable: the compiled kernel if numba is available (see kernels.py),
+# otherwise the NumPy function above, which stays the reference.
+if kernels.COMPILED:
+    interpolate_grid_fast = kernels.interpolate_grid
+else:
+    interpolate_grid_fast = interpolate_grid
+
+
+class GazeLookupTable(object):
+    """
+    Points of interest on a regular grid of frame features, served by linear interpolation.
+
+    error_bound_cm is the largest measured distance between interpolated and exact points of interest,
+    number_of_fallbacks counts frames calculated by the exact pipeline.
+    """
+
+    def __init__(self, axes, points_of_interest, rig, error_bound_cm=np.nan):
+        """
+        :param axes: 6 increasing arrays with grid points of every feature
+        :param points_of_interest: array of shape (len(axes[0]), ..., len(axes[5]), 2) with x, y of points of interest
+        :param rig: CameraRig used to calculate the table and the frames outside of it
+        :param error_bound_cm: measured error of the interpolation
+        """
+        if len(axes) != FEATURES_COUNT:
+            raise ValueError('Expected {} axes, got {}'.format(FEATURES_COUNT, len(axes)))
+
+        self.axes = tuple(np.asarray(axis, dtype=float) for axis in axes)
+        self.points_of_interest = np.ascontiguousarray(points_of_interest, dtype=float)
+        self.rig = rig
+        self.error_bound_cm = error_bound_cm
+        self.number_of_fallbacks = 0
+
+    @classmethod
+    def build(cls, lower_bounds, upper_bounds, grid_shape=DEFAULT_GRID_SHAPE, validation_frames=None,
+              validation_points_count=1000, seed=0, rig=None, **kwargs):
+        """
+        Calculates the table with get_points_of_interest and measures its error.
+
+        :param lower_bounds, upper_bounds: 6 values each, the domain of the features (see calculate_features)
+        :param grid_shape: number of grid points of every feature
+        :param validation_frames: glints_1_ics, glints_2_ics, pupil_centers_ics of frames of the operating range
+        :param validation_points_count: number of random points of the domain used to measure the error
+        :param seed: seed of the random generator of the validation points
+        :param rig: CameraRig, if not given it is created from kwargs
+        :param kwargs: constants dictionary (check in integration_test.constants for an example)
+        :return: GazeLookupTable
+        """
+
+        if rig is None:
+            rig = CameraRig.from_constants(kwargs)
+
+        lower_bounds, upper_bounds = np.asarray(lower_bounds, dtype=float), np.asarray(upper_bounds, dtype=float)
+        if np.any(upper_bounds <= lower_bounds):
+            raise ValueError('Upper bounds should be larger than lower bounds, got {} and {}'.format(
+                lower_bounds, upper_bounds))
+        if min(grid_shape) < 2:
+            raise ValueError('Every feature needs at least two grid points, got {}'.format(grid_shape))
+
+        axes = [np.linspace(lower, upper, count) for lower, upper, count in zip(lower_bounds, upper_bounds, grid_shape)]
+        grid = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, FEATURES_COUNT)
+        points_of_interest = get_points_of_interest(*calculate_frames(grid), rig=rig)
+
+        table = cls(axes, points_of_interest[:, :2].reshape(tuple(grid_shape) + (2,)), rig)
+
+        validation_points = np.random.RandomState(seed).uniform(lower_bounds, upper_bounds,
+                                                                size=(validation_points_count, FEATURES_COUNT))
+        errors = [table.measure_errors(*calculate_frames(validation_points))]
+        if validation_frames is not None:
+            errors.append(table.measure_errors(*validation_frames))
+        table.error_bound_cm = np.nanmax(np.concatenate(errors), initial=0)
+
+        return table
+
+    @classmethod
+    def from_frames(cls, glints_1_ics, glints_2_ics, pupil_centers_ics, grid_shape=DEFAULT_GRID_SHAPE, margin=0.05,
+                    rig=None, **kwargs):
+        """
+        Builds the table over the operating range of the given frames (for example, of a calibration session),
+        and measures its error on these frames as well.
+
+        :param margin: the range of every feature is extended by this fraction of it on both sides (at least 0.5 pixel)
+        :return: GazeLookupTable
+        """
+
+        features = calculate_features(glints_1_ics, glints_2_ics, pupil_centers_ics)
+        features = features[np.all(np.isfinite(features), axis=-1)]
+        lower_bounds, upper_bounds = features.min(axis=0), features.max(axis=0)
+
+        padding = np.maximum(margin*(upper_bounds - lower_bounds), 0.5)
+
+        return cls.build(lower_bounds - padding, upper_bounds + padding, grid_shape,
+                         validation_frames=(glints_1_ics, glints_2_ics, pupil_centers_ics), rig=rig, **kwargs)
+
+    def save(self, path):
+        """
+        Saves the table into a .npz file.
+        """
+        np.savez(path, points_of_interest=self.points_of_interest, error_bound_cm=self.error_bound_cm,
+                 **{'axis_{}'.format(index): axis for index, axis in enumerate(self.axes)})
+
+    @classmethod
+    def load(cls, path, rig=None, **kwargs):
+        """
+        Loads a table saved by save. The rig should be the one the table was built with.
+
+        :param rig: CameraRig, if not given it is created from kwargs
+        """
+        if rig is None:
+            rig = CameraRig.from_constants(kwargs)
+
+        with np.load(path) as data:
+            axes = [data['axis_{}'.format(index)] for index in range(FEATURES_COUNT)]
+            return cls(axes, data['points_of_interest'], rig, float(data['error_bound_cm']))
+
+    def interpolate(self, glints_1_ics, glints_2_ics, pupil_centers_ics):
+        """
+        :return: array of shape (N, 3) with interpolated points of interest, NaN for frames outside of the table
+        """
+        points_of_interest = np.empty((len(glints_1_ics), 3))
+        points_of_interest[:, :2] = interpolate_grid_fast(calculate_features(glints_1_ics, glints_2_ics,
+                                                                             pupil_centers_ics),
+                                                          self.axes, self.points_of_interest)
+        points_of_interest[:, 2] = self.rig.z_shift
+        return points_of_interest
+
+    def measure_errors(self, glints_1_ics, glints_2_ics, pupil_centers_ics):
+        """
+        :return: array of shape (N,) with distances between interpolated and exact points of interest,
+                 NaN for frames outside of the table or where the pipeline fails
+        """
+        exact_points_of_interest = get_points_of_interest(glints_1_ics, glints_2_ics, pupil_centers_ics, rig=self.rig)
+        return np.linalg.norm(self.interpolate(glints_1_ics, glints_2_ics, pupil_centers_ics) - exact_points_of_interest,
+                              axis=-1)
+
+    def get_points_of_interest(self, glints_1_ics, glints_2_ics, pupil_centers_ics):
+        """
+        Same as calculate_point_of_interest.get_points_of_interest, with the error up to error_bound_cm
+        inside of the table. Frames outside of the table are calculated by get_points_of_interest.
+
+        :param glints_1_ics, glints_2_ics, pupil_centers_ics: arrays of shape (N, 2) in Image Coordinate System
+        :return: array of shape (N, 3) with points of interest
+        """
+
+        points_of_interest = self.interpolate(glints_1_ics, glints_2_ics, pupil_centers_ics)
+
+        outside = np.isnan(points_of_interest[:, 0])
+        if np.any(outside):
+            self.number_of_fallbacks += int(np.count_nonzero(outside))
+            points_of_interest[outside] = get_points_of_interest(np.asarray(glints_1_ics, dtype=float)[outside],
+                                                                 np.asarray(glints_2_ics, dtype=float)[outside],
+                                                                 np.asarray(pupil_centers_ics, dtype=float)[outside],
+                                                                 rig=self.rig)
+
+        return points_of_interest
@@ -0,0 +1,92 @@
+# Chunked processing of recorded sessions stored in files.
+#
+# The input file is memory-mapped and processed in chunks of fixed size, the points of interest are written
+# into a memory-mapped .npy file. Only one chunk is held in memory at a time, so the peak memory does not
+# depend on the length of the session.
+#
+# Supported input files:
+#   .npy file with an array of shape (N, 6) or a structured array with FRAME_DTYPE (see frame_batch.py),
+#   raw binary file with N rows of 6 values (any numeric raw_dtype, float64 by default).
+# A row of 6 values is: glint_1 x, y, glint_2 x, y, pupil x, y in Image Coordinate System.
+#
+# @author: Anna Eivazi
+
+import numpy as np
+
+from src.camera_rig import CameraRig
+from src.frame_batch import FrameBatch, FRAME_DTYPE
+
+
+FRAME_VALUES_COUNT = 6
+
+
+def open_frames(path, raw_dtype=np.float64):
+    """
+    Memory-maps frames of a .npy or raw binary file without reading them.
+
+    :param path: path to the file
+    :param raw_dtype: type of values of a raw binary file
+    :return: read-only memory-mapped array of shape (N, 6) or structured array with FRAME_DTYPE
+    """
+
+    if str(path).endswith('.npy'):
+        frames = np.load(path, mmap_mode='r')
+    else:
+        frames = np.memmap(path, dtype=raw_dtype, mode='r')
+        if frames.size % FRAME_VALUES_COUNT != 0:
+            raise ValueError('Size of {} is not a multiple of {} values'.format(path, FRAME_VALUES_COUNT))
+        frames = frames.reshape(-1, FRAME_VALUES_COUNT)
+
+    if frames.dtype != FRAME_DTYPE and (frames.ndim != 2 or frames.shape[1] != FRAME_VALUES_COUNT):
+        raise ValueError('Expected frames of shape (N, {}) or with FRAME_DTYPE, got {} of dtype {}'.format(
+            FRAME_VALUES_COUNT, frames.shape, frames.dtype))
+
+    return frames
+
+
+def read_frame_batch(frames, start, stop):
+    """
+    Reads frames [start, stop) of an array returned by open_frames into a FrameBatch.
+    """
+
+    if frames.dtype == FRAME_DTYPE:
+        return FrameBatch(np.array(frames[start:stop]))
+
+    values = np.asarray(frames[start:stop], dtype=np.float64)
+    return FrameBatch.from_arrays(values[:, 0:2], values[:, 2:4], values[:, 4:6], timestamps=np.arange(start, stop))
+
+
+def process_file(input_path, output_path, chunk_size=65536, raw_dtype=np.float64, rig=None, **kwargs):
+    """
+    Calculates points of interest of all frames of a file, chunk by chunk.
+
+    Frames with non-finite coordinates (or not valid frames of a FRAME_DTYPE file) get NaN points of interest.
+
+    :param input_path: .npy or raw binary file with frames, see open_frames
+    :param output_path: .npy file, created with an array of shape (N, 3) with points of interest
+    :param chunk_size: number of frames processed at once
+    :param raw_dtype: type of values of a raw binary input file
+    :param rig: CameraRig, if not given it is created from kwargs
+    :param kwargs: constants dictionary (check in integration_test.constants for an example)
+    :return: memory-mapped array of shape (N, 3) with points of interest
+    """
+
+    if rig is None:
+        rig = CameraRig.from_constants(kwargs)
+
+    if chunk_size < 1:
+        raise ValueError('chunk_size should be positive, got {}'.format(chunk_size))
+
+    frames = open_frames(input_path, raw_dtype)
+    frames_count = len(frames)
+
+    points_of_interest = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float64, shape=(frames_count, 3))
+
+    for start in range(0, frames_count, chunk_size):
+        stop = min(start + chunk_size, frames_count)
+        batch = read_frame_batch(frames, start, stop).process(rig)
+        points_of_interest[start:stop] = batch.points_of_interest
+        # written pages are flushed to the file, so that they can be dropped from memory
+        points_of_interest.flush()
+
+    return points_of_interest
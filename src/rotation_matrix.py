@@ -1,7 +1,74 @@
+from functools import lru_cache, wraps
 from math import cos, sin
 import numpy as np
 
 
+# memoized rotation functions by module and qualified name, see memoize_rotation and rotation_cache_stats
+_memoized_functions = {}
+
+
+def memoize_rotation(maxsize=128):
+    """
+    Decorator which memoizes a function of angles returning a rotation matrix or vector.
+
+    The cache is bounded: when it holds maxsize entries, the least recently used one is evicted.
+    Angles are used as keys after conversion to float, the cached arrays are read-only.
+    Hits and misses of all memoized functions are reported by rotation_cache_stats.
+
+    :param maxsize: maximum number of cached angle combinations
+    """
+
+    def decorator(function):
+
+        @lru_cache(maxsize=maxsize)
+        def cached_function(*angles):
+            value = function(*angles)
+            value.setflags(write=False)
+            return value
+
+        @wraps(function)
+        def wrapper(*angles):
+            return cached_function(*(float(angle) for angle in angles))
+
+        wrapper.cache_info = cached_function.cache_info
+        wrapper.cache_clear = cached_function.cache_clear
+        _memoized_functions['{}.{}'.format(function.__module__, function.__qualname__)] = wrapper
+
+        return wrapper
+
+    return decorator
+
+
+def rotation_cache_stats():
+    """
+    Returns statistics of the rotation caches:
+    {'module.qualified_name' of the function: {'hits', 'misses', 'size', 'maxsize', 'hit_rate'}}
+    """
+
+    stats = {}
+    for name, function in _memoized_functions.items():
+        info = function.cache_info()
+        calls = info.hits + info.misses
+        stats[name] = {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxsize': info.maxsize,
+            'hit_rate': info.hits / calls if calls else 0.0
+        }
+
+    return stats
+
+
+def clear_rotation_caches():
+    """
+    Empties all rotation caches and resets their statistics.
+    """
+    for function in _memoized_functions.values():
+        function.cache_clear()
+
+
+@memoize_rotation(maxsize=64)
 def calculate_rotation_matrix_extrinsic(alpha_rad, beta_rad, gamma_rad):
     """
     Applies extrinsic rotation defined by Euler angles alpha, beta, gamma.
@@ -29,27 +96,23 @@ def calculate_rotation_matrix_extrinsic(alpha_rad, beta_rad, gamma_rad):
     pay attention here we first transform gamma around z,
     then beta around y and then alpha around x.
 
+    The product is built directly in its expanded form, and the result is memoized
+    (the camera angles are the same for every frame).
+
     :param
     alpha: rotation around x axis (radians)
     beta:  rotation around y axis (radians)
     gamma: rotation around z axis (radians)
     :return:
-    3x3 rotational matrix
+    3x3 rotational matrix (read-only)
     """
 
-    Rx = [[1,    0,             0    ],
-          [0, cos(alpha_rad), -sin(alpha_rad)],
-          [0, sin(alpha_rad),  cos(alpha_rad)]]
+    ca, sa = cos(alpha_rad), sin(alpha_rad)
+    cb, sb = cos(beta_rad), sin(beta_rad)
+    cg, sg = cos(gamma_rad), sin(gamma_rad)
 
-    Ry = [[cos(beta_rad),  0, sin(beta_rad) ],
-          [    0,          1,      0        ],
-          [-sin(beta_rad), 0, cos(beta_rad)]]
-
-    Rz = [[cos(gamma_rad), -sin(gamma_rad), 0],
-          [sin(gamma_rad),  cos(gamma_rad), 0],
-          [    0,                  0,       1]]
-
-    R = np.dot(np.dot(Rz, Ry), Rx)
+    R = np.array([[cb*cg, sa*sb*cg - ca*sg, ca*sb*cg + sa*sg],
+                  [cb*sg, sa*sb*sg + ca*cg, ca*sb*sg - sa*cg],
+                  [-sb,   sa*cb,            ca*cb]])
 
     return R
-
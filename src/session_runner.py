@@ -0,0 +1,88 @@
+# Offline reprocessing of many recording sessions in parallel.
+#
+# Every session (one subject) has its own constants, e.g. alpha_right, beta, R_cm, K_cm.
+# Sessions are spread across processes of a ProcessPoolExecutor: the rig of a session is validated in the
+# main process and sent to a worker together with all frames of the session, i.e. once per session.
+#
+# @author: Anna Eivazi
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import time
+
+import numpy as np
+
+from src.camera_rig import CameraRig
+from src.calculate_point_of_interest import get_point_of_interest, get_points_of_interest
+
+
+# glints_1_ics, glints_2_ics, pupil_centers_ics: arrays of shape (N, 2)
+Session = namedtuple('Session', ['session_id', 'constants', 'glints_1_ics', 'glints_2_ics', 'pupil_centers_ics'])
+
+# points_of_interest: array of shape (N, 3), elapsed_s: processing time in the worker
+SessionResult = namedtuple('SessionResult', ['session_id', 'points_of_interest', 'number_of_frames',
+                                             'elapsed_s', 'frames_per_second'])
+
+
+def process_session(session_id, rig, glints_1_ics, glints_2_ics, pupil_centers_ics, vectorized=True):
+    """
+    Calculates points of interest of all frames of one session and measures the throughput.
+
+    :param session_id: identifier of the session, returned unchanged
+    :param rig: CameraRig of the session
+    :param glints_1_ics, glints_2_ics, pupil_centers_ics: arrays of shape (N, 2)
+    :param vectorized: use get_points_of_interest for all frames at once,
+                       otherwise get_point_of_interest is called frame by frame
+    :return: SessionResult
+    """
+
+    start = time.perf_counter()
+
+    if vectorized:
+        points_of_interest = get_points_of_interest(glints_1_ics, glints_2_ics, pupil_centers_ics, rig=rig)
+    else:
+        points_of_interest = np.array([get_point_of_interest(glint_1, glint_2, pupil, rig=rig)
+                                       for glint_1, glint_2, pupil
+                                       in zip(glints_1_ics, glints_2_ics, pupil_centers_ics)]).reshape(-1, 3)
+
+    elapsed_s = time.perf_counter() - start
+    number_of_frames = len(points_of_interest)
+
+    return SessionResult(session_id,
+                         points_of_interest,
+                         number_of_frames,
+                         elapsed_s,
+                         number_of_frames / elapsed_s if elapsed_s > 0 else float('inf'))
+
+
+def run_sessions(sessions, max_workers=None, vectorized=True, executor=None):
+    """
+    Processes sessions in parallel processes.
+
+    The results are returned in the order of the sessions, independently of the order in which
+    the workers finish. Constants of all sessions are validated before any work is started.
+
+    :param sessions: iterable of Session
+    :param max_workers: number of processes, by default the number of processors
+    :param vectorized: see process_session
+    :param executor: an existing executor to use instead of creating a ProcessPoolExecutor
+    :return: list of SessionResult
+    """
+
+    sessions = list(sessions)
+    rigs = [CameraRig.from_constants(session.constants) for session in sessions]
+
+    arguments = (
+        [session.session_id for session in sessions],
+        rigs,
+        [np.asarray(session.glints_1_ics, dtype=float) for session in sessions],
+        [np.asarray(session.glints_2_ics, dtype=float) for session in sessions],
+        [np.asarray(session.pupil_centers_ics, dtype=float) for session in sessions],
+        [vectorized] * len(sessions)
+    )
+
+    if executor is not None:
+        return list(executor.map(process_session, *arguments))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(process_session, *arguments))
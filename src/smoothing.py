@@ -0,0 +1,293 @@
+# Streaming smoothing filters of the gaze.
+#
+# Both filters keep only their current state (no history of frames), so every frame costs the same:
+#   KalmanFilter: constant velocity model with white noise acceleration, the same model for every coordinate,
+#                 so all coordinates share one 2x2 covariance matrix;
+#   OneEuroFilter: exponential smoothing with a cutoff frequency growing with the speed
+#                  (Casiez, Roussel, Vogel, "1 Euro Filter", CHI 2012).
+# Filters work on vectors of any size: points of interest, centers of cornea curvature or visual axes
+# (GazeRayFilter smooths the gaze ray and intersects it with the screen).
+# update processes one frame, filter processes a whole recording and continues from the same state.
+# The per-frame recursion is written as a kernel, compiled by numba if available (see kernels.py).
+#
+# @author: Anna Eivazi
+
+import math
+
+import numpy as np
+
+from src.kernels import jit
+from src.calculate_point_of_interest import calculate_point_of_interest_batch
+
+
+@jit
+def kalman_filter_kernel(values, timestamps, acceleration_variance, measurement_variance,
+                         position, velocity, covariance, last_timestamp, filtered_values):
+    """
+    Kalman filter iterations over frames, the state (position, velocity, covariance, last_timestamp) is updated in place.
+
+    Frames with a NaN value are only predicted. Frames with a timestamp not after the previous one are corrected
+    without the prediction (no time elapsed), the last timestamp does not go back.
+
+    :param values: array of shape (N, D) with measurements
+    :param timestamps: array of shape (N,) in seconds
+    :param position, velocity: arrays of shape (D,)
+    :param covariance: array of shape (3,) with the shared covariance (position, position-velocity, velocity)
+    :param last_timestamp: array of shape (1,), NaN before the first measurement
+    :param filtered_values: output array of shape (N, D)
+    """
+
+    dimensions = values.shape[1]
+    for i in range(values.shape[0]):
+        measured = True
+        for j in range(dimensions):
+            if math.isnan(values[i, j]):
+                measured = False
+
+        if math.isnan(last_timestamp[0]):
+            if measured:
+                # the first measurement initializes the state, velocity is unknown
+                for j in range(dimensions):
+                    position[j] = values[i, j]
+                    velocity[j] = 0.
+                covariance[0], covariance[1], covariance[2] = measurement_variance, 0., 1e6*measurement_variance
+                last_timestamp[0] = timestamps[i]
+            for j in range(dimensions):
+                filtered_values[i, j] = values[i, j]
+            continue
+
+        # prediction
+        dt = timestamps[i] - last_timestamp[0]
+        if dt > 0:
+            last_timestamp[0] = timestamps[i]
+        else:
+            dt = 0.
+        for j in range(dimensions):
+            position[j] += velocity[j]*dt
+        p00, p01, p11 = covariance[0], covariance[1], covariance[2]
+        p00 = p00 + 2*dt*p01 + dt*dt*p11 + acceleration_variance*dt*dt*dt/3
+        p01 = p01 + dt*p11 + acceleration_variance*dt*dt/2
+        p11 = p11 + acceleration_variance*dt
+
+        # correction
+        if measured:
+            innovation_variance = p00 + measurement_variance
+            gain_position, gain_velocity = p00/innovation_variance, p01/innovation_variance
+            for j in range(dimensions):
+                innovation = values[i, j] - position[j]
+                position[j] += gain_position*innovation
+                velocity[j] += gain_velocity*innovation
+            p11 = p11 - gain_velocity*p01
+            p00, p01 = (1 - gain_position)*p00, (1 - gain_position)*p01
+
+        covariance[0], covariance[1], covariance[2] = p00, p01, p11
+        for j in range(dimensions):
+            filtered_values[i, j] = position[j]
+
+
+@jit
+def _smoothing_factor(dt, cutoff):
+    return 1/(1 + 1/(2*math.pi*cutoff*dt))
+
+
+@jit
+def one_euro_filter_kernel(values, timestamps, min_cutoff, beta, derivative_cutoff,
+                           position, derivative, last_timestamp, filtered_values):
+    """
+    One Euro filter iterations over frames, the state (position, derivative, last_timestamp) is updated in place.
+
+    Frames with a NaN value do not change the state and give NaN.
+    Frames with a timestamp not after the previous one (no time elapsed) do not change the state
+    and give the previous filtered value.
+
+    :param values: array of shape (N, D) with measurements
+    :param timestamps: array of shape (N,) in seconds
+    :param position, derivative: arrays of shape (D,) with filtered values and their filtered derivatives
+    :param last_timestamp: array of shape (1,), NaN before the first measurement
+    :param filtered_values: output array of shape (N, D)
+    """
+
+    dimensions = values.shape[1]
+    for i in range(values.shape[0]):
+        measured = True
+        for j in range(dimensions):
+            if math.isnan(values[i, j]):
+                measured = False
+
+        if not measured:
+            for j in range(dimensions):
+                filtered_values[i, j] = math.nan
+            continue
+
+        if math.isnan(last_timestamp[0]):
+            for j in range(dimensions):
+                position[j] = values[i, j]
+                derivative[j] = 0.
+        else:
+            dt = timestamps[i] - last_timestamp[0]
+            if not dt > 0:
+                for j in range(dimensions):
+                    filtered_values[i, j] = position[j]
+                continue
+            derivative_factor = _smoothing_factor(dt, derivative_cutoff)
+            for j in range(dimensions):
+                derivative[j] += derivative_factor*((values[i, j] - position[j])/dt - derivative[j])
+                factor = _smoothing_factor(dt, min_cutoff + beta*abs(derivative[j]))
+                position[j] += factor*(values[i, j] - position[j])
+
+        last_timestamp[0] = timestamps[i]
+        for j in range(dimensions):
+            filtered_values[i, j] = position[j]
+
+
+class StreamingFilter(object):
+    """
+    State and timestamps handling common for KalmanFilter and OneEuroFilter.
+    """
+
+    def __init__(self, frame_interval):
+        """
+        :param frame_interval: time between frames in seconds, used when timestamps are not given
+        """
+        if frame_interval <= 0:
+            raise ValueError('frame_interval should be positive, got {}'.format(frame_interval))
+        self.frame_interval = float(frame_interval)
+        self.last_timestamp = np.full(1, np.nan)
+        self.dimensions = None
+
+    def reset(self):
+        """
+        Forgets the state, the next frame starts a new recording.
+        """
+        self.last_timestamp[:] = np.nan
+        self.dimensions = None
+
+    def _prepare(self, values, timestamps):
+        values = np.ascontiguousarray(values, dtype=float)
+        if values.ndim != 2:
+            raise ValueError('Expected values of shape (N, D), got {}'.format(values.shape))
+
+        if self.dimensions is None:
+            self.dimensions = values.shape[1]
+            self._create_state(self.dimensions)
+        elif values.shape[1] != self.dimensions:
+            raise ValueError('Expected values with {} coordinates, got {}'.format(self.dimensions, values.shape[1]))
+
+        if timestamps is None:
+            start = 0. if np.isnan(self.last_timestamp[0]) else self.last_timestamp[0] + self.frame_interval
+            timestamps = start + self.frame_interval*np.arange(len(values))
+        timestamps = np.ascontiguousarray(np.broadcast_to(timestamps, (len(values),)), dtype=float)
+
+        return values, timestamps
+
+    def update(self, value, timestamp=None):
+        """
+        Filters one frame.
+
+        :param value: array of shape (D,), for example a point of interest
+        :param timestamp: time of the frame in seconds, by default the previous one plus frame_interval
+        :return: filtered value, array of shape (D,)
+        """
+        return self.filter(np.asarray(value, dtype=float)[np.newaxis], timestamp)[0]
+
+    def filter(self, values, timestamps=None):
+        """
+        Filters N frames of a recording, continuing from the current state.
+
+        :param values: array of shape (N, D)
+        :param timestamps: array of shape (N,) in seconds, by default spaced by frame_interval
+        :return: array of shape (N, D) with filtered values
+        """
+        values, timestamps = self._prepare(values, timestamps)
+        filtered_values = np.empty_like(values)
+        self._run(values, timestamps, filtered_values)
+        return filtered_values
+
+
+class KalmanFilter(StreamingFilter):
+    """
+    Constant velocity Kalman filter, frames with NaN values are predicted from the previous ones.
+    """
+
+    def __init__(self, measurement_std=0.3, acceleration_std=50., frame_interval=1/60.):
+        """
+        :param measurement_std: standard deviation of the noise of the values (cm for points of interest)
+        :param acceleration_std: standard deviation of the acceleration per second (cm/s^2 for points of interest)
+        :param frame_interval: time between frames in seconds, used when timestamps are not given
+        """
+        super(KalmanFilter, self).__init__(frame_interval)
+        self.measurement_variance = float(measurement_std)**2
+        self.acceleration_variance = float(acceleration_std)**2
+        self.covariance = np.zeros(3)
+
+    def _create_state(self, dimensions):
+        self.position = np.zeros(dimensions)
+        self.velocity = np.zeros(dimensions)
+
+    def _run(self, values, timestamps, filtered_values):
+        kalman_filter_kernel(values, timestamps, self.acceleration_variance, self.measurement_variance,
+                             self.position, self.velocity, self.covariance, self.last_timestamp, filtered_values)
+
+
+class OneEuroFilter(StreamingFilter):
+    """
+    One Euro filter of every coordinate, frames with NaN values give NaN and do not change the state.
+    """
+
+    def __init__(self, min_cutoff=1., beta=0.05, derivative_cutoff=1., frame_interval=1/60.):
+        """
+        :param min_cutoff: cutoff frequency in Hz at zero speed, smaller values smooth more
+        :param beta: growth of the cutoff frequency with the speed, larger values lag less
+        :param derivative_cutoff: cutoff frequency in Hz of the filtered speed
+        :param frame_interval: time between frames in seconds, used when timestamps are not given
+        """
+        super(OneEuroFilter, self).__init__(frame_interval)
+        self.min_cutoff = float(min_cutoff)
+        self.beta = float(beta)
+        self.derivative_cutoff = float(derivative_cutoff)
+
+    def _create_state(self, dimensions):
+        self.position = np.zeros(dimensions)
+        self.derivative = np.zeros(dimensions)
+
+    def _run(self, values, timestamps, filtered_values):
+        one_euro_filter_kernel(values, timestamps, self.min_cutoff, self.beta, self.derivative_cutoff,
+                               self.position, self.derivative, self.last_timestamp, filtered_values)
+
+
+class GazeRayFilter(object):
+    """
+    Smooths centers of cornea curvature and visual axes (see calculate_point_of_interest.get_gaze_rays)
+    with two filters and intersects the smoothed gaze rays with the screen.
+    """
+
+    def __init__(self, center_filter, axis_filter, z_shift):
+        """
+        :param center_filter, axis_filter: KalmanFilter or OneEuroFilter
+        :param z_shift: z of the screen in coordinate system aligned with screen (rig.z_shift)
+        """
+        self.center_filter = center_filter
+        self.axis_filter = axis_filter
+        self.z_shift = z_shift
+
+    def reset(self):
+        self.center_filter.reset()
+        self.axis_filter.reset()
+
+    def update(self, center_of_cornea_curvature_scs, visual_axis_unit_vector_scs, timestamp=None):
+        """
+        :return: smoothed point of interest, array of shape (3,)
+        """
+        return self.filter(np.asarray(center_of_cornea_curvature_scs, dtype=float)[np.newaxis],
+                           np.asarray(visual_axis_unit_vector_scs, dtype=float)[np.newaxis], timestamp)[0]
+
+    def filter(self, centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, timestamps=None):
+        """
+        :param centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs: arrays of shape (N, 3)
+        :param timestamps: array of shape (N,) in seconds, by default spaced by frame_interval of the filters
+        :return: array of shape (N, 3) with smoothed points of interest
+        """
+        centers = self.center_filter.filter(centers_of_cornea_curvature_scs, timestamps)
+        axes = self.axis_filter.filter(visual_axis_unit_vectors_scs, timestamps)
+        axes /= np.linalg.norm(axes, axis=-1, keepdims=True)
+        return calculate_point_of_interest_batch(centers, axes, self.z_shift)
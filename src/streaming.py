@@ -0,0 +1,84 @@
+# Streaming processing of frame sources.
+#
+# Frames are read lazily from any iterable (a list, a generator reading a file or a camera, ...) and
+# processed in micro-batches of fixed size by the vectorized pipeline (get_points_of_interest).
+# Only one chunk is kept in memory at a time, so memory does not grow with the length of the recording,
+# and the first result is available as soon as the first chunk is read.
+#
+# @author: Anna Eivazi
+
+import math
+from collections import namedtuple
+from itertools import islice
+
+import numpy as np
+
+from src.camera_rig import CameraRig
+from src.frame_batch import FrameBatch
+
+
+# timestamps: array of shape (n,), points_of_interest: array of shape (n, 3), n <= chunk_size
+GazeChunk = namedtuple('GazeChunk', ['timestamps', 'points_of_interest'])
+
+
+def iterate_chunks(frames, chunk_size):
+    """
+    Lazily splits an iterable into lists of at most chunk_size elements.
+
+    :param frames: iterable or iterator
+    :param chunk_size: maximal number of elements in one chunk
+    :return: generator of lists
+    """
+
+    if chunk_size < 1:
+        raise ValueError('chunk_size should be positive, got {}'.format(chunk_size))
+
+    iterator = iter(frames)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_frame_batches(frames, chunk_size=256, rig=None, **kwargs):
+    """
+    Lazily calculates points of interest for a stream of frames.
+
+    Frames with a missing (None) or not finite glint or pupil are marked as invalid and get NaN points of interest.
+
+    :param frames: iterable of frames (glint_1_ics, glint_2_ics, pupil_center_ics, timestamp)
+    :param chunk_size: number of frames processed at once
+    :param rig: CameraRig, if not given it is created from kwargs
+    :param kwargs: constants dictionary (check in integration_test.constants for an example)
+    :return: generator of processed FrameBatch, one for every chunk_size frames (the last one may be shorter)
+    """
+
+    if rig is None:
+        rig = CameraRig.from_constants(kwargs)
+
+    for chunk in iterate_chunks(frames, chunk_size):
+        glints_1_ics, glints_2_ics, pupil_centers_ics, timestamps = zip(*chunk)
+        batch = FrameBatch.from_arrays(_as_points(glints_1_ics), _as_points(glints_2_ics),
+                                       _as_points(pupil_centers_ics), timestamps)
+        yield batch.process(rig)
+
+
+def _as_points(points):
+    """
+    Converts a sequence of points into an array of shape (n, 2), missing points (None) become NaN.
+    """
+    if any(point is None for point in points):
+        points = [(math.nan, math.nan) if point is None else point for point in points]
+    return np.array(points, dtype=float)
+
+
+def stream_points_of_interest(frames, chunk_size=256, rig=None, **kwargs):
+    """
+    Same as stream_frame_batches, but yields only timestamps and points of interest.
+
+    :return: generator of GazeChunk, one for every chunk_size frames (the last one may be shorter)
+    """
+
+    for batch in stream_frame_batches(frames, chunk_size, rig, **kwargs):
+        yield GazeChunk(batch.timestamps, batch.points_of_interest)
@@ -0,0 +1,293 @@
+# First-order propagation of the image noise to the point of interest.
+#
+# The point of interest on the screen is a function of 6 image coordinates: glint_1 x, y, glint_2 x, y, pupil x, y.
+# Its Jacobian J of shape (2, 6) maps a covariance S of the image coordinates to the covariance of the point
+# of interest on the screen, J * S * J^T, so no Monte Carlo runs of the pipeline are needed.
+#
+# The cornea center depends on the glints through the optimum kq of formula 3.11. The optimum satisfies
+# Jkq^T * (c1 - c2) = 0, where Jkq is the Jacobian of c1(kq1) - c2(kq2) with respect to kq, and by the implicit
+# function theorem:
+#   dkq/du = -(Jkq^T Jkq)^-1 Jkq^T d(c1 - c2)/du
+# (as in Gauss-Newton, the terms with the residual c1 - c2, which is zero for consistent glints, are neglected).
+# Derivatives of c1 and c2 are analytic (see calculate_cornea_center.calculate_c_derivative).
+# The rest of the pipeline (formulas 3.29-3.61) is closed-form for a known cornea center, and it is differentiated
+# with central differences without solving for the cornea center again, as is the lens undistortion of the glints.
+#
+# @author: Anna Eivazi
+
+import numpy as np
+
+from src.camera_rig import CameraRig
+from src.coordinate_system_transformations import transform_2D_to_3D_batch
+from src.calculate_cornea_center import normalized, normalized_with_derivative, cornea_centers_difference_jacobian
+from src.calculate_point_of_interest import get_gaze_rays_and_reasons, intersect_gaze_rays_with_screen, \
+    get_points_of_interest_from_cornea_centers, select_eye_frames
+from src.validity import VALID
+
+
+IMAGE_COORDINATES_COUNT = 6
+
+# steps of central differences of the closed-form part of the pipeline
+CORNEA_CENTER_STEP_CM = 1e-5
+IMAGE_STEP_PX = 1e-3
+
+
+def calculate_c_derivatives(kq, o, u, l, R):
+    """
+    Calculates cornea centers c(kq, u) of formulas 3.2, 3.7 and their derivatives with respect to kq
+    and to x, y of the image of corneal reflection center u.
+
+    :param kq: array of shape (..., 1)
+    :param o: nodal point of camera
+    :param u: array of shape (..., 3) with images of corneal reflection centers
+    :param l: light coordinates
+    :param R: radius of cornea surface, array of shape (..., 1)
+    :return: cornea centers of shape (..., 3), derivatives dc/dkq, dc/du_x, dc/du_y of shape (..., 3, 3)
+    """
+
+    # derivatives along kq, u_x, u_y are calculated at once along the second to last axis
+    u_derivative = np.array([[1., 0., 0.], [0., 1., 0.]])
+    d, d_derivative = normalized_with_derivative((o - u)[..., np.newaxis, :], -u_derivative)
+
+    q = o + kq[..., np.newaxis] * d
+    q_derivative = np.concatenate([d, kq[..., np.newaxis] * d_derivative], axis=-2)
+
+    l_q_unit, l_q_unit_derivative = normalized_with_derivative(l[..., np.newaxis, :] - q, -q_derivative)
+    o_q_unit, o_q_unit_derivative = normalized_with_derivative(o - q, -q_derivative)
+
+    bisector_unit, bisector_unit_derivative = \
+        normalized_with_derivative(l_q_unit + o_q_unit, l_q_unit_derivative + o_q_unit_derivative)
+
+    R = R[..., np.newaxis]
+    c = q - R * bisector_unit
+    c_derivative = q_derivative - R * bisector_unit_derivative
+
+    return c[..., 0, :], c_derivative
+
+
+def calculate_kq_from_cornea_centers(cornea_centers, u1, u2, o, l1, l2, R, iterations=2):
+    """
+    Finds kq1, kq2 of the optimum of formula 3.11 for known cornea centers.
+
+    kq is the distance from the camera to the intersection of the ray through u with the cornea sphere,
+    which is refined by Gauss-Newton iterations (the cornea center is the average of c1 and c2).
+
+    :param cornea_centers: array of shape (N, 3)
+    :param u1, u2: arrays of shape (N, 3) with images of corneal reflection centers
+    :param R: array of shape (N,) with radii of cornea surface
+    :return: array of shape (N, 2)
+    """
+
+    kq = np.empty((len(cornea_centers), 2))
+    for index, u in enumerate((u1, u2)):
+        to_center = cornea_centers - o
+        distance_along_ray = np.sum(normalized(o - u) * to_center, axis=-1)
+        discriminant = distance_along_ray**2 - np.sum(to_center**2, axis=-1) + R**2
+        kq[:, index] = distance_along_ray - np.sqrt(np.maximum(discriminant, 0))
+
+    for _ in range(iterations):
+        residual, jacobian = cornea_centers_difference_jacobian(kq, u1, u2, o, l1, l2, R)
+        jacobian_t = np.swapaxes(jacobian, -1, -2)
+        kq -= np.linalg.solve(np.matmul(jacobian_t, jacobian), np.matmul(jacobian_t, residual[..., np.newaxis]))[..., 0]
+
+    return kq
+
+
+def calculate_undistortion_jacobians(points_ics, rig):
+    """
+    Calculates derivatives of rig.undistort_points by central differences.
+
+    :param points_ics: array of shape (..., 2) with distorted points in Image Coordinate System
+    :param rig: CameraRig
+    :return: array of shape (..., 2, 2) with derivatives of undistorted x, y with respect to distorted x, y
+    """
+    jacobians = np.empty(points_ics.shape + (2,))
+    for axis in range(2):
+        step = np.zeros(2)
+        step[axis] = IMAGE_STEP_PX
+        jacobians[..., axis] = \
+            (rig.undistort_points(points_ics + step) - rig.undistort_points(points_ics - step))/(2*IMAGE_STEP_PX)
+    return jacobians
+
+
+def calculate_cornea_center_jacobians(cornea_centers, glints_1_ics, glints_2_ics, rig, eye):
+    """
+    Calculates derivatives of the cornea centers with respect to glint_1 x, y and glint_2 x, y
+    by the implicit function theorem.
+
+    :param cornea_centers: array of shape (N, 3) with cornea centers of the glints
+    :param glints_1_ics, glints_2_ics: arrays of shape (N, 2) in Image Coordinate System
+    :param rig: CameraRig
+    :param eye: EyeModel of the frames (scalars or arrays of shape (N,))
+    :return: array of shape (N, 3, 4)
+    """
+
+    frames_count = len(cornea_centers)
+    o = rig.camera_position_wcs
+    u1 = transform_2D_to_3D_batch(rig.undistort_points(glints_1_ics), *rig.intrinsics)
+    u2 = transform_2D_to_3D_batch(rig.undistort_points(glints_2_ics), *rig.intrinsics)
+    R = np.broadcast_to(np.asarray(eye.R_cm, dtype=float), (frames_count,))
+
+    kq = calculate_kq_from_cornea_centers(cornea_centers, u1, u2, o, rig.light_1_wcs, rig.light_2_wcs, R)
+
+    # both lights are calculated at once along the second axis
+    _, c_derivative = calculate_c_derivatives(kq[..., np.newaxis], o, np.stack([u1, u2], axis=-2),
+                                              np.stack([rig.light_1_wcs, rig.light_2_wcs]),
+                                              R[:, np.newaxis, np.newaxis])
+
+    # derivatives with respect to the image coordinates in pixels, of shape (N, 2, 3, 2)
+    pixel_size = np.array(rig.pixel_size_cm, dtype=float)
+    c_pixel_derivative = np.swapaxes(c_derivative[..., 1:, :], -1, -2) * pixel_size
+    if rig.undistortion_map is not None:
+        c_pixel_derivative = np.matmul(c_pixel_derivative,
+                                       calculate_undistortion_jacobians(np.stack([glints_1_ics, glints_2_ics], axis=1),
+                                                                        rig))
+    c_kq_derivative = c_derivative[..., 0, :]
+
+    # derivatives of c1 and c2 with respect to all 4 glint coordinates at fixed kq, of shape (N, 2, 3, 4)
+    c_glints_derivative = np.zeros((frames_count, 2, 3, 4))
+    c_glints_derivative[:, 0, :, 0:2] = c_pixel_derivative[:, 0]
+    c_glints_derivative[:, 1, :, 2:4] = c_pixel_derivative[:, 1]
+
+    # implicit function theorem at the optimum of formula 3.11
+    kq_jacobian = np.stack([c_kq_derivative[:, 0], -c_kq_derivative[:, 1]], axis=-1)
+    kq_jacobian_t = np.swapaxes(kq_jacobian, -1, -2)
+    kq_derivative = -np.linalg.solve(np.matmul(kq_jacobian_t, kq_jacobian),
+                                     np.matmul(kq_jacobian_t, c_glints_derivative[:, 0] - c_glints_derivative[:, 1]))
+
+    c_glints_derivative += c_kq_derivative[..., np.newaxis] * kq_derivative[:, :, np.newaxis, :]
+
+    # the cornea center is the average of c1 and c2
+    return c_glints_derivative.mean(axis=1)
+
+
+def calculate_point_of_interest_jacobians(glints_1_ics, glints_2_ics, pupil_centers_ics, rig=None, **kwargs):
+    """
+    Calculates points of interest of N frames and their Jacobians with respect to the image coordinates.
+
+    :param glints_1_ics: array of shape (N, 2) with glint 1 coordinates in Image Coordinate System
+    :param glints_2_ics: array of shape (N, 2) with glint 2 coordinates in Image Coordinate System
+    :param pupil_centers_ics: array of shape (N, 2) with pupil center coordinates in Image Coordinate System
+    :param rig: CameraRig, if not given it is created from kwargs
+    :param kwargs: constants dictionary (check in integration_test.constants for an example)
+    :return: array of shape (N, 3) with points of interest,
+             array of shape (N, 2, 6) with derivatives of x, y of points of interest with respect to
+             glint_1 x, y, glint_2 x, y, pupil x, y (NaN for invalid frames, see validity.py),
+             array of shape (N,) with reason codes
+    """
+
+    if rig is None:
+        rig = CameraRig.from_constants(kwargs)
+
+    glints_1_ics, glints_2_ics, pupil_centers_ics = \
+        (np.asarray(values, dtype=float) for values in (glints_1_ics, glints_2_ics, pupil_centers_ics))
+
+    centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs, reasons = \
+        get_gaze_rays_and_reasons(glints_1_ics, glints_2_ics, pupil_centers_ics, rig)
+    points_of_interest = intersect_gaze_rays_with_screen(centers_of_cornea_curvature_scs, visual_axis_unit_vectors_scs,
+                                                         reasons, rig.z_shift)
+    jacobians = np.full((len(points_of_interest), 2, IMAGE_COORDINATES_COUNT), np.nan)
+
+    valid = reasons == VALID
+    if not np.any(valid):
+        return points_of_interest, jacobians, reasons
+
+    eye = select_eye_frames(rig.eye, valid)
+    valid_rig = rig._replace(eye=eye)
+    glints_1_ics, glints_2_ics, pupil_centers_ics = glints_1_ics[valid], glints_2_ics[valid], pupil_centers_ics[valid]
+
+    # cornea centers are rotated back from the coordinate system aligned with screen
+    cornea_centers = np.dot(centers_of_cornea_curvature_scs[valid], rig.camera_rotation_matrix)
+
+    def screen_points(centers, pupils):
+        return get_points_of_interest_from_cornea_centers(centers, pupils, valid_rig)[:, :2]
+
+    # central differences of the closed-form part of the pipeline, of shapes (N, 2, 3) and (N, 2, 2)
+    cornea_center_derivative = np.empty((len(cornea_centers), 2, 3))
+    for axis in range(3):
+        step = np.zeros(3)
+        step[axis] = CORNEA_CENTER_STEP_CM
+        cornea_center_derivative[..., axis] = \
+            (screen_points(cornea_centers + step, pupil_centers_ics) -
+             screen_points(cornea_centers - step, pupil_centers_ics))/(2*CORNEA_CENTER_STEP_CM)
+
+    pupil_derivative = np.empty((len(cornea_centers), 2, 2))
+    for axis in range(2):
+        step = np.zeros(2)
+        step[axis] = IMAGE_STEP_PX
+        pupil_derivative[..., axis] = \
+            (screen_points(cornea_centers, pupil_centers_ics + step) -
+             screen_points(cornea_centers, pupil_centers_ics - step))/(2*IMAGE_STEP_PX)
+
+    glints_derivative = np.matmul(cornea_center_derivative,
+                                  calculate_cornea_center_jacobians(cornea_centers, glints_1_ics, glints_2_ics,
+                                                                    rig, eye))
+
+    jacobians[valid] = np.concatenate([glints_derivative, pupil_derivative], axis=-1)
+
+    return points_of_interest, jacobians, reasons
+
+
+def calculate_image_covariance(glint_std_px, pupil_std_px):
+    """
+    Covariance of the 6 image coordinates with independent noise of every coordinate.
+
+    :param glint_std_px: standard deviation of the glint coordinates in pixels
+    :param pupil_std_px: standard deviation of the pupil coordinates in pixels
+    :return: diagonal array of shape (6, 6)
+    """
+    return np.diag(np.array([glint_std_px] * 4 + [pupil_std_px] * 2, dtype=float)**2)
+
+
+def propagate_covariances(jacobians, image_covariances):
+    """
+    :param jacobians: array of shape (N, 2, 6), see calculate_point_of_interest_jacobians
+    :param image_covariances: array of shape (6, 6) or (N, 6, 6)
+    :return: array of shape (N, 2, 2) with covariances J * S * J^T
+    """
+    return np.matmul(np.matmul(jacobians, image_covariances), np.swapaxes(jacobians, -1, -2))
+
+
+def get_points_of_interest_covariances(glints_1_ics, glints_2_ics, pupil_centers_ics, glint_std_px=0.2,
+                                       pupil_std_px=0.5, image_covariances=None, rig=None, **kwargs):
+    """
+    Calculates points of interest of N frames and covariances of their x, y on the screen
+    caused by the noise of the image coordinates.
+
+    :param glints_1_ics: array of shape (N, 2) with glint 1 coordinates in Image Coordinate System
+    :param glints_2_ics: array of shape (N, 2) with glint 2 coordinates in Image Coordinate System
+    :param pupil_centers_ics: array of shape (N, 2) with pupil center coordinates in Image Coordinate System
+    :param glint_std_px: standard deviation of the glint coordinates in pixels
+    :param pupil_std_px: standard deviation of the pupil coordinates in pixels
+    :param image_covariances: array of shape (6, 6) or (N, 6, 6) with covariance of glint_1 x, y, glint_2 x, y,
+                              pupil x, y, used instead of glint_std_px and pupil_std_px
+    :param rig: CameraRig, if not given it is created from kwargs
+    :param kwargs: constants dictionary (check in integration_test.constants for an example)
+    :return: array of shape (N, 3) with points of interest,
+             array of shape (N, 2, 2) with covariances in cm^2 (NaN for invalid frames)
+    """
+
+    if image_covariances is None:
+        image_covariances = calculate_image_covariance(glint_std_px, pupil_std_px)
+
+    points_of_interest, jacobians, _ = calculate_point_of_interest_jacobians(glints_1_ics, glints_2_ics,
+                                                                             pupil_centers_ics, rig, **kwargs)
+
+    return points_of_interest, propagate_covariances(jacobians, image_covariances)
+
+
+def get_point_of_interest_covariance(glint_1_ics, glint_2_ics, pupil_center_ics, glint_std_px=0.2, pupil_std_px=0.5,
+                                     image_covariance=None, rig=None, **kwargs):
+    """
+    Same as get_points_of_interest_covariances for one frame.
+
+    :return: point of interest, array of shape (2, 2) with covariance of its x, y
+    """
+
+    points_of_interest, covariances = \
+        get_points_of_interest_covariances(np.asarray(glint_1_ics, dtype=float)[np.newaxis],
+                                           np.asarray(glint_2_ics, dtype=float)[np.newaxis],
+                                           np.asarray(pupil_center_ics, dtype=float)[np.newaxis],
+                                           glint_std_px, pupil_std_px, image_covariance, rig, **kwargs)
+
+    return points_of_interest[0], covariances[0]
@@ -0,0 +1,41 @@
+# Reasons of invalid frames.
+#
+# The batched pipeline does not raise on frames it can not calculate (bad detections of glints or pupil, blinks):
+# every frame gets a reason code, VALID or the first stage which failed, and NaN results
+# (see calculate_point_of_interest.get_points_of_interest_and_reasons).
+# Invalid frames are removed from the batch after the stage which failed, so the next stages skip them.
+#
+# @author: Anna Eivazi
+
+import numpy as np
+
+
+VALID = 0
+# glint or pupil coordinates are not finite (not detected)
+MISSING_INPUT = 1
+# Gauss-Newton iterations of the cornea center did not converge
+CORNEA_NOT_CONVERGED = 2
+# the ray from the camera through the pupil on the image does not intersect the cornea (negative discriminant of 3.29)
+PUPIL_RAY_MISSES_CORNEA = 3
+# the refracted ray does not reach the distance K from the cornea center (negative discriminant of 3.37)
+PUPIL_NOT_REACHED = 4
+# the visual axis is parallel to the screen or points away from it (formula 3.61)
+VISUAL_AXIS_MISSES_SCREEN = 5
+
+REASON_NAMES = {
+    VALID: 'valid',
+    MISSING_INPUT: 'missing_input',
+    CORNEA_NOT_CONVERGED: 'cornea_not_converged',
+    PUPIL_RAY_MISSES_CORNEA: 'pupil_ray_misses_cornea',
+    PUPIL_NOT_REACHED: 'pupil_not_reached',
+    VISUAL_AXIS_MISSES_SCREEN: 'visual_axis_misses_screen',
+}
+
+
+def count_reasons(reasons):
+    """
+    :param reasons: array of shape (N,) with reason codes
+    :return: dictionary {reason name: number of frames} of the reasons which occur
+    """
+    codes, counts = np.unique(reasons, return_counts=True)
+    return {REASON_NAMES[code]: int(count) for code, count in zip(codes, counts)}
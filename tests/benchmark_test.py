@@ -0,0 +1,74 @@
+import unittest
+import os
+import tempfile
+
+from src.benchmark import run_benchmarks, find_regressions, save_baseline, load_baseline, main
+
+
+def create_results(latency_s, throughput_fps, batch_size=1000):
+    return {'batch_size': batch_size,
+            'stages': {'end_to_end': {'latency_s': latency_s, 'throughput_fps': throughput_fps}}}
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_run_benchmarks(self):
+
+        results = run_benchmarks(batch_size=10, repeat=1, min_time=0)
+
+        self.assertEqual(results['batch_size'], 10)
+        self.assertEqual(list(results['stages']), ['transform_2D_to_3D',
+                                                   'calculate_cornea_center',
+                                                   'calculate_optic_axis_unit_vector',
+                                                   'calculate_visual_axis_unit_vector',
+                                                   'rotate_to_screen_coordinate_system',
+                                                   'calculate_point_of_interest',
+                                                   'end_to_end'])
+        for result in results['stages'].values():
+            self.assertGreater(result['latency_s'], 0)
+            self.assertGreater(result['throughput_fps'], 0)
+
+        results = run_benchmarks(batch_size=10, repeat=1, min_time=0, stages=['calculate_point_of_interest'])
+        self.assertEqual(list(results['stages']), ['calculate_point_of_interest'])
+
+    def test_find_regressions(self):
+
+        baseline = create_results(1e-3, 1e5)
+
+        self.assertEqual(find_regressions(create_results(1.2e-3, 0.9e5), baseline, 25), [])
+
+        regressions = find_regressions(create_results(1.3e-3, 1e5), baseline, 25)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('end_to_end: latency'))
+
+        regressions = find_regressions(create_results(1e-3, 0.7e5), baseline, 25)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('end_to_end: throughput'))
+
+        # throughput of different batch sizes is not compared
+        self.assertEqual(find_regressions(create_results(1e-3, 0.7e5, batch_size=10), baseline, 25), [])
+
+        # stages missing in the baseline are skipped
+        self.assertEqual(find_regressions(create_results(2e-3, 1e5), {'batch_size': 1000, 'stages': {}}, 25), [])
+
+    def test_baseline_file(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmarks', 'baseline.json')
+
+            save_baseline(create_results(1e-3, 1e5), path)
+            self.assertEqual(load_baseline(path), create_results(1e-3, 1e5))
+
+            arguments = ['--baseline', path, '--batch-size', '10', '--repeat', '1',
+                         '--stage', 'calculate_point_of_interest']
+            self.assertEqual(main(arguments + ['--update-baseline']), 0)
+            self.assertEqual(main(arguments + ['--threshold', '1e6']), 0)
+
+            save_baseline({'batch_size': 10,
+                           'stages': {'calculate_point_of_interest': {'latency_s': 1e-12, 'throughput_fps': 1e15}}},
+                          path)
+            self.assertEqual(main(arguments), 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=1)
@@ -0,0 +1,66 @@
+import unittest
+import numpy as np
+import math
+
+from src.binocular import get_points_of_interest_binocular
+from src.camera_rig import CameraRig, EyeModel
+from src.calculate_point_of_interest import get_points_of_interest
+from tests import integration_test
+
+constants = dict(integration_test.constants, alpha_left=math.radians(5))
+
+right_eye_frames = (np.array([(332, 164), (327.45, 168.75), (330.5, 175.5)]),
+                    np.array([(313, 165), (309.05, 169.2), (311, 176)]),
+                    np.array([(323, 163), (322.9, 173.3), (320, 185.5)]))
+
+left_eye_frames = (np.array([(482, 166), (477.45, 170.75), (480.5, 177.5)]),
+                   np.array([(463, 167), (459.05, 171.2), (461, 178)]),
+                   np.array([(470, 165), (469.9, 175.3), (467, 187.5)]))
+
+
+class TestBinocular(unittest.TestCase):
+
+    def test_binocular(self):
+
+        points_of_interest = get_points_of_interest_binocular(left_eye_frames, right_eye_frames, **constants)
+
+        expected_right = get_points_of_interest(*right_eye_frames, **constants)
+        expected_left = get_points_of_interest(*left_eye_frames, **dict(constants, alpha_right=constants['alpha_left']))
+
+        np.testing.assert_array_almost_equal(points_of_interest.right, expected_right)
+        np.testing.assert_array_almost_equal(points_of_interest.left, expected_left)
+        np.testing.assert_array_almost_equal(points_of_interest.fused, (expected_left + expected_right) / 2)
+
+    def test_left_eye_model(self):
+
+        rig = CameraRig.from_constants(constants)
+        left_eye = EyeModel.create(R_cm=0.8, K_cm=0.45, n1=1.336, n2=1, alpha=math.radians(4.5), beta=math.radians(1))
+
+        points_of_interest = get_points_of_interest_binocular(left_eye_frames, right_eye_frames, left_eye, rig)
+
+        expected_left = get_points_of_interest(*left_eye_frames, rig=rig._replace(eye=left_eye))
+        np.testing.assert_array_almost_equal(points_of_interest.left, expected_left)
+
+        rig_without_left_eye = CameraRig.from_constants({key: value for key, value in constants.items()
+                                                         if key != 'alpha_left'})
+        self.assertIsNone(rig_without_left_eye.left_eye)
+        with self.assertRaises(ValueError):
+            get_points_of_interest_binocular(left_eye_frames, right_eye_frames, rig=rig_without_left_eye)
+
+    def test_fused_with_missing_eye(self):
+
+        left_glints_1 = left_eye_frames[0].copy()
+        left_glints_1[1] = np.nan
+
+        points_of_interest = get_points_of_interest_binocular((left_glints_1,) + left_eye_frames[1:],
+                                                              right_eye_frames, **constants)
+
+        self.assertTrue(np.all(np.isnan(points_of_interest.left[1])))
+        np.testing.assert_array_almost_equal(points_of_interest.fused[1], points_of_interest.right[1])
+
+        with self.assertRaises(ValueError):
+            get_points_of_interest_binocular([values[:2] for values in left_eye_frames], right_eye_frames, **constants)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=1)
@@ -1,7 +1,26 @@
 import unittest
 import numpy as np
 import math
-from src.calculate_cornea_center import calculate_cornea_center, calculate_q, normalized, calculate_c
+import scipy.optimize as opt
+from src.calculate_cornea_center import calculate_cornea_center, calculate_q, normalized, calculate_c, calculate_cornea_center_batch, \
+    calculate_cornea_center_wcs_planes, cornea_centers_difference_jacobian, solve_kq_levenberg_marquardt, solve_kq_minimize, \
+    solve_cornea_centers_wcs_batch, calculate_cornea_center_wcs, cornea_centers_spread_jacobian, \
+    solve_cornea_centers_lights_wcs
+from src.instrumentation import PipelineStats
+
+
+def find_glint_wcs(c, o, l, R):
+    """
+    Finds the image of the glint of light l on the image plane z = -1.2 for the cornea center c.
+    """
+    def equations(variables):
+        x, y, kq = variables
+        u = np.array([x, y, -1.2])
+        return calculate_c(calculate_q(kq, o, u), l, o, R) - c
+
+    x, y, _ = opt.fsolve(equations, (-1.2 * c[0] / c[2], -1.2 * c[1] / c[2], np.linalg.norm(c)), xtol=1e-13)
+    return np.array([x, y, -1.2])
+
 
 class TestCalculateC(unittest.TestCase):
 
@@ -72,6 +91,211 @@ class TestCalculateC(unittest.TestCase):
         expected_value = np.array([1.948963,   2.801269,  53.424463])
         np.testing.assert_array_almost_equal(c, expected_value)
 
+    def test_calculate_cornea_center_batch(self):
+        constants = {
+            'light_1_wcs': np.array([-23, 0, 0]),
+            'light_2_wcs': np.array([23, 0, 0]),
+            'camera_position_wcs': np.array([0, 0, 0]),
+            'focal_length_cm': 1.2,
+            'pixel_size_cm': (0.00048, 0.00048),
+            'principal_point': (400, 300),
+            'z_shift': -18,
+            'alpha_right': math.radians(-5),
+            'beta': math.radians(1.5),
+            'R_cm': 0.95,
+            'K_cm': 0.42,
+            'n1': 1.3375,
+            'n2': 1,
+            'distance_to_camera_cm': 52,
+        }
+
+        glints_1_ics = np.array([(327.45, 168.75), (322.711, 168.816), (317.78, 168.707)])
+        glints_2_ics = np.array([(309.05, 169.2), (304.579, 169.211), (299.561, 169.122)])
+
+        centers = calculate_cornea_center_batch(glints_1_ics, glints_2_ics, **constants)
+
+        for glint_1_ics, glint_2_ics, c in zip(glints_1_ics, glints_2_ics, centers):
+            expected_value = calculate_cornea_center(glint_1_ics, glint_2_ics, **constants)
+            np.testing.assert_allclose(c, expected_value, atol=1e-3)
+
+    def test_calculate_cornea_center_cornea_constants(self):
+        # the camera, the lights and R_cm are enough, the screen and the rest of the eye are not needed
+        constants = {
+            'light_1_wcs': np.array([-23, 0, 0]),
+            'light_2_wcs': np.array([23, 0, 0]),
+            'camera_position_wcs': np.array([0, 0, 0]),
+            'focal_length_cm': 1.2,
+            'pixel_size_cm': (0.00048, 0.00048),
+            'principal_point': (400, 300),
+            'R_cm': 0.95,
+            'distance_to_camera_cm': 52,
+        }
+        full_constants = dict(constants, z_shift=-18, alpha_right=math.radians(-5), beta=math.radians(1.5),
+                              K_cm=0.42, n1=1.3375, n2=1)
+
+        glint_1_ics, glint_2_ics = (327.45, 168.75), (309.05, 169.2)
+        c = calculate_cornea_center(glint_1_ics, glint_2_ics, **constants)
+        np.testing.assert_array_almost_equal(c, calculate_cornea_center(glint_1_ics, glint_2_ics, **full_constants))
+
+        centers = calculate_cornea_center_batch(np.array([glint_1_ics]), np.array([glint_2_ics]), **constants)
+        np.testing.assert_allclose(centers[0], c, atol=1e-3)
+
+    def test_calculate_cornea_center_wcs_planes(self):
+        # lights are not colinear with the camera, thus cornea center should lie on both planes
+        camera_wcs = np.array([0, 0, 0])
+        light_1_wcs = np.array([-23, 0, 0])
+        light_2_wcs = np.array([0, -15, 0])
+        glint_1_wcs = np.array([-0.03482400000000001, -0.063, -1.2])
+        glint_2_wcs = np.array([-0.04310400000000001, -0.0648, -1.2])
+        R = 0.78
+
+        c = calculate_cornea_center_wcs_planes(glint_1_wcs, glint_2_wcs, camera_wcs, light_1_wcs, light_2_wcs, R, (52, 52))
+
+        for light_wcs, glint_wcs in [(light_1_wcs, glint_1_wcs), (light_2_wcs, glint_2_wcs)]:
+            plane_normal = normalized(np.cross(light_wcs - camera_wcs, glint_wcs - camera_wcs))
+            self.assertAlmostEqual(np.dot(c - camera_wcs, plane_normal), 0)
+
+    def test_cornea_centers_difference_jacobian(self):
+        camera_wcs = np.array([0, 0, 0])
+        light_1_wcs = np.array([-23, 0, 0])
+        light_2_wcs = np.array([23, 0, 0])
+        glint_1_wcs = np.array([-0.03482400000000001, -0.063, -1.2])
+        glint_2_wcs = np.array([-0.04310400000000001, -0.0648, -1.2])
+        known_data = (glint_1_wcs, glint_2_wcs, camera_wcs, light_1_wcs, light_2_wcs, 0.78)
+
+        kq = np.array([47., 46.5])
+        difference, jacobian = cornea_centers_difference_jacobian(kq, *known_data)
+
+        expected_difference = calculate_c(calculate_q(kq[0], camera_wcs, glint_1_wcs), light_1_wcs, camera_wcs, 0.78) - \
+                              calculate_c(calculate_q(kq[1], camera_wcs, glint_2_wcs), light_2_wcs, camera_wcs, 0.78)
+        np.testing.assert_array_almost_equal(difference, expected_difference)
+
+        step = 1e-6
+        for i in range(2):
+            shifted_kq = kq.copy()
+            shifted_kq[i] += step
+            shifted_difference, _ = cornea_centers_difference_jacobian(shifted_kq, *known_data)
+            np.testing.assert_array_almost_equal(jacobian[:, i], (shifted_difference - difference) / step)
+
+    def test_solve_kq_levenberg_marquardt(self):
+        camera_wcs = np.array([0, 0, 0])
+        light_1_wcs = np.array([-23, 0, 0])
+        light_2_wcs = np.array([23, 0, 0])
+        glint_1_wcs = np.array([-0.03482400000000001, -0.063, -1.2])
+        glint_2_wcs = np.array([-0.04310400000000001, -0.0648, -1.2])
+        known_data = (glint_1_wcs, glint_2_wcs, camera_wcs, light_1_wcs, light_2_wcs, 0.78)
+
+        expected_value = solve_kq_minimize(*known_data, (52, 52))
+
+        kq = solve_kq_levenberg_marquardt(*known_data, (52, 52))
+        np.testing.assert_allclose(kq, expected_value, atol=1e-3)
+
+        # pure Gauss-Newton iterations
+        kq = solve_kq_levenberg_marquardt(*known_data, (52, 52), damping=0)
+        np.testing.assert_allclose(kq, expected_value, atol=1e-3)
+
+        # the first step (about 74) increases the cost and is rejected, the solver does not stop there
+        stats = PipelineStats()
+        kq = solve_kq_levenberg_marquardt(*known_data, (-29, -29), tolerance=80, damping=1e-5, stats=stats)
+        self.assertFalse(np.allclose(kq, (-29, -29)))
+        self.assertEqual(stats.summary()['solvers']['levenberg_marquardt']['iterations']['mean'], 2)
+
+    def test_solve_cornea_centers_wcs_batch(self):
+        camera_wcs = np.array([0, 0, 0])
+        light_1_wcs = np.array([-23, 0, 0])
+        light_2_wcs = np.array([23, 0, 0])
+        glints_1_wcs = np.array([[-0.03482400000000001, -0.063, -1.2],
+                                 [-0.03696, -0.063, -1.2]])
+        glints_2_wcs = np.array([[-0.04310400000000001, -0.0648, -1.2],
+                                 [-0.04524, -0.0648, -1.2]])
+
+        centers, iterations, converged = \
+            solve_cornea_centers_wcs_batch(glints_1_wcs, glints_2_wcs, camera_wcs, light_1_wcs, light_2_wcs, 0.78, (52, 52))
+
+        np.testing.assert_array_equal(converged, [True, True])
+        self.assertTrue(np.all(iterations > 0))
+        for glint_1_wcs, glint_2_wcs, c in zip(glints_1_wcs, glints_2_wcs, centers):
+            expected_value = calculate_cornea_center_wcs(glint_1_wcs, glint_2_wcs, camera_wcs, light_1_wcs, light_2_wcs,
+                                                         0.78, (52, 52))
+            np.testing.assert_allclose(c, expected_value, atol=1e-3)
+
+        # iterations stop before convergence
+        _, iterations, converged = \
+            solve_cornea_centers_wcs_batch(glints_1_wcs, glints_2_wcs, camera_wcs, light_1_wcs, light_2_wcs, 0.78, (52, 52),
+                                           max_iterations=1)
+        np.testing.assert_array_equal(converged, [False, False])
+        np.testing.assert_array_equal(iterations, [1, 1])
+
+    def test_cornea_centers_spread_jacobian(self):
+        camera_wcs = np.array([0, 0, 0])
+        lights_wcs = np.array([[-23, 0, 0], [23, 0, 0], [0, -15, 0]])
+        glints_wcs = np.array([[-0.03482400000000001, -0.063, -1.2],
+                               [-0.04310400000000001, -0.0648, -1.2],
+                               [-0.03912, -0.0625, -1.2]])
+
+        kq = np.array([47., 46.5, 46.8])
+        c, deviations, jacobian = cornea_centers_spread_jacobian(kq, glints_wcs, camera_wcs, lights_wcs, 0.78)
+
+        self.assertEqual(jacobian.shape, (3, 3, 3))
+        np.testing.assert_array_almost_equal(deviations, c - np.mean(c, axis=0))
+
+        step = 1e-6
+        for i in range(3):
+            shifted_kq = kq.copy()
+            shifted_kq[i] += step
+            _, shifted_deviations, _ = cornea_centers_spread_jacobian(shifted_kq, glints_wcs, camera_wcs, lights_wcs, 0.78)
+            np.testing.assert_array_almost_equal(jacobian[..., i], (shifted_deviations - deviations) / step)
+
+    def test_solve_cornea_centers_lights_wcs(self):
+        camera_wcs = np.array([0, 0, 0])
+        lights_wcs = np.array([[-23, 0, 0], [23, 0, 0], [0, -15, 0]])
+        R = 0.78
+        cornea_centers = np.array([[1.5, 2.5, 47.], [-3., 1., 55.], [0.5, -2., 60.]])
+
+        glints_wcs = np.array([[find_glint_wcs(c, camera_wcs, l, R) for l in lights_wcs] for c in cornea_centers])
+
+        # noise-free glints of three lights give the exact cornea centers
+        centers, kq, iterations, converged = \
+            solve_cornea_centers_lights_wcs(glints_wcs, camera_wcs, lights_wcs, R, 52)
+        np.testing.assert_array_almost_equal(centers, cornea_centers)
+        self.assertEqual(kq.shape, (3, 3))
+        self.assertTrue(np.all(converged))
+
+        # a single frame
+        center, _, _, converged = solve_cornea_centers_lights_wcs(glints_wcs[0], camera_wcs, lights_wcs, R, 52)
+        np.testing.assert_array_almost_equal(center, cornea_centers[0])
+        self.assertTrue(converged)
+
+        # two lights give the same result as equation 3.11
+        centers, _, _, _ = solve_cornea_centers_lights_wcs(glints_wcs[:, :2], camera_wcs, lights_wcs[:2], R, 52)
+        expected_value, _, _ = solve_cornea_centers_wcs_batch(glints_wcs[:, 0], glints_wcs[:, 1], camera_wcs,
+                                                             lights_wcs[0], lights_wcs[1], R, (52, 52))
+        np.testing.assert_array_almost_equal(centers, expected_value)
+
+        with self.assertRaises(ValueError):
+            solve_cornea_centers_lights_wcs(glints_wcs, camera_wcs, lights_wcs[:2], R, 52)
+
+    def test_unknown_cornea_solver(self):
+        constants = {
+            'light_1_wcs': np.array([-23, 0, 0]),
+            'light_2_wcs': np.array([23, 0, 0]),
+            'camera_position_wcs': np.array([0, 0, 0]),
+            'focal_length_cm': 1.2,
+            'pixel_size_cm': (0.00048, 0.00048),
+            'principal_point': (400, 300),
+            'z_shift': -18,
+            'alpha_right': math.radians(-5),
+            'beta': math.radians(1.5),
+            'R_cm': 0.95,
+            'K_cm': 0.42,
+            'n1': 1.3375,
+            'n2': 1,
+            'distance_to_camera_cm': 52,
+            'cornea_solver': 'unknown'
+        }
+        with self.assertRaises(ValueError):
+            calculate_cornea_center((327.45, 168.75), (309.05, 169.2), **constants)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
-from src.calculate_optic_axis import calculate_r, calculate_kr, calculate_iota, calculate_p, calculate_optic_axis_unit_vector
+from src.calculate_optic_axis import calculate_r, calculate_kr, calculate_iota, calculate_p, calculate_optic_axis_unit_vector, \
+    calculate_optic_axis_unit_vector_batch
 
 
 class TestCalculateOpticAxis(unittest.TestCase):
@@ -85,6 +86,21 @@ class TestCalculateOpticAxis(unittest.TestCase):
 
         self.assertAlmostEqual(np.linalg.norm(omega), 1)
 
+    def test_calculate_optic_axis_unit_vector_batch(self):
+
+        camera_position_wcs = np.array([0, 0, 0])
+        pupil_centers_wcs = np.array([[-0.03700800000000001, -0.060815999999999995, -1.2],
+                                      [-0.04200800000000001, -0.055815999999999995, -1.2]])
+        cornea_centers = np.array([[1.56013955, 2.50435559, 47.78392692],
+                                   [1.76171446, 2.4002904, 47.98009072]])
+
+        omegas = calculate_optic_axis_unit_vector_batch(pupil_centers_wcs, camera_position_wcs, cornea_centers,
+                                                        0.78, 0.42, 1.3375, 1)
+
+        for pupil_center_wcs, cornea_center, omega in zip(pupil_centers_wcs, cornea_centers, omegas):
+            expected_value = calculate_optic_axis_unit_vector(pupil_center_wcs, camera_position_wcs, cornea_center,
+                                                              0.78, 0.42, 1.3375, 1)
+            np.testing.assert_array_almost_equal(omega, expected_value)
 
 
 if __name__ == '__main__':
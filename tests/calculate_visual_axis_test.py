@@ -1,7 +1,8 @@
 import unittest
 import numpy as np
 import math
-from src.calculate_visual_axis import calculate_eye_angles, calculate_visual_axis_unit_vector, calculate_nu_ecs, calculate_rotation_matrix
+from src.calculate_visual_axis import calculate_eye_angles, calculate_visual_axis_unit_vector, calculate_nu_ecs, calculate_rotation_matrix, \
+    calculate_visual_axis_unit_vector_batch, calculate_optic_axis_unit_vector_from_visual_axis_batch
 
 
 class TestCalculateOpticAxis(unittest.TestCase):
@@ -113,6 +114,35 @@ class TestCalculateOpticAxis(unittest.TestCase):
 
         self.assertAlmostEqual(np.linalg.norm(visual_axis_unit_vector), 1)
 
+    def test_calculate_visual_axis_batch(self):
+
+        optic_axis_unit_vectors = np.array([[-0.210779, -0.221661, -0.952071],
+                                            [0.056123, -0.085017, -0.994797]])
+
+        alpha = math.radians(-5)
+        beta = math.radians(1.5)
+
+        visual_axis_unit_vectors = calculate_visual_axis_unit_vector_batch(optic_axis_unit_vectors, alpha, beta)
+
+        for optic_axis_unit_vector, visual_axis_unit_vector in zip(optic_axis_unit_vectors, visual_axis_unit_vectors):
+            expected_value = calculate_visual_axis_unit_vector(optic_axis_unit_vector, alpha, beta)
+            np.testing.assert_array_almost_equal(visual_axis_unit_vector, expected_value)
+
+    def test_calculate_optic_axis_from_visual_axis_batch(self):
+
+        optic_axis_unit_vectors = np.array([[-0.210779, -0.221661, -0.952071],
+                                            [0.056123, -0.085017, -0.994797]])
+        optic_axis_unit_vectors /= np.linalg.norm(optic_axis_unit_vectors, axis=-1, keepdims=True)
+
+        alpha = np.array([math.radians(-5), math.radians(5)])
+        beta = math.radians(1.5)
+
+        visual_axis_unit_vectors = calculate_visual_axis_unit_vector_batch(optic_axis_unit_vectors, alpha, beta)
+
+        np.testing.assert_array_almost_equal(
+            calculate_optic_axis_unit_vector_from_visual_axis_batch(visual_axis_unit_vectors, alpha, beta),
+            optic_axis_unit_vectors)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,92 @@
+import unittest
+import numpy as np
+import math
+
+from src.calibration import calibrate
+from src.camera_rig import CameraRig
+from src.calculate_point_of_interest import get_points_of_interest
+from tests.integration_test import constants
+
+# glint1, glint3 and pupil of the nine-point grid of integration_test
+glints_1 = np.array([(332, 164), (333, 164), (324.5, 164.4),
+                     (327.45, 168.75), (322.711, 168.816), (317.78, 168.707),
+                     (330.5, 175.5), (321.722, 174.583), (317.2, 174.933)])
+glints_2 = np.array([(313, 165), (314, 165), (305.6, 164),
+                     (309.05, 169.2), (304.579, 169.211), (299.561, 169.122),
+                     (311, 176), (303.389, 174.722), (298.933, 174.933)])
+pupils = np.array([(323, 163), (324, 163), (305.3, 159.5),
+                   (322.9, 173.3), (310.421, 171.658), (300.463, 173.024),
+                   (320, 185.5), (310.278, 185.556), (302.967, 186.1)])
+
+subject_constants = dict(constants, alpha_right=math.radians(-3), beta=math.radians(2.5), R_cm=0.82, K_cm=0.45)
+
+
+class TestCalibration(unittest.TestCase):
+
+    def test_calibrate(self):
+
+        targets = get_points_of_interest(glints_1, glints_2, pupils, **subject_constants)[:, :2]
+
+        result = calibrate(glints_1, glints_2, pupils, targets, **constants)
+
+        self.assertTrue(result.success)
+        self.assertLess(result.rms_error_cm, 1e-6)
+        self.assertEqual(result.residuals_cm.shape, (9, 2))
+        for key in ('alpha_right', 'beta', 'R_cm', 'K_cm'):
+            self.assertAlmostEqual(result.constants[key], subject_constants[key], places=5)
+        self.assertAlmostEqual(result.rig.eye.R_cm, subject_constants['R_cm'], places=5)
+        self.assertEqual(result.dropped_samples_count, 0)
+
+        np.testing.assert_array_almost_equal(
+            get_points_of_interest(glints_1, glints_2, pupils, **result.constants)[:, :2], targets)
+
+    def test_calibrate_angles(self):
+
+        targets = get_points_of_interest(glints_1, glints_2, pupils,
+                                         **dict(constants, alpha_right=math.radians(-3)))[:, :2]
+        noisy_targets = targets + np.random.RandomState(0).normal(0, 0.1, targets.shape)
+
+        result = calibrate(glints_1, glints_2, pupils, noisy_targets, parameters=('alpha', 'beta'), **constants)
+
+        self.assertAlmostEqual(math.degrees(result.rig.eye.alpha), -3, delta=0.2)
+        self.assertAlmostEqual(math.degrees(result.rig.eye.beta), 1.5, delta=0.2)
+        self.assertEqual(result.rig.eye.R_cm, constants['R_cm'])
+        self.assertLess(result.rms_error_cm, 0.2)
+
+    def test_calibrate_with_rig(self):
+
+        targets = get_points_of_interest(glints_1, glints_2, pupils, **subject_constants)[:, :2]
+
+        result = calibrate(glints_1, glints_2, pupils, targets, rig=CameraRig.from_constants(constants))
+
+        # the constants dictionary is complete without kwargs
+        self.assertEqual(result.constants['z_shift'], constants['z_shift'])
+        np.testing.assert_array_almost_equal(
+            get_points_of_interest(glints_1, glints_2, pupils, **result.constants)[:, :2], targets)
+
+    def test_invalid_samples(self):
+
+        targets = get_points_of_interest(glints_1, glints_2, pupils, **subject_constants)[:, :2]
+        damaged_pupils = pupils.copy()
+        damaged_pupils[0] = np.nan
+        damaged_pupils[1] += 300
+
+        result = calibrate(glints_1, glints_2, damaged_pupils, targets, **constants)
+
+        self.assertTrue(result.success)
+        self.assertEqual(result.dropped_samples_count, 2)
+        self.assertTrue(np.all(np.isnan(result.residuals_cm[:2])))
+        self.assertLess(np.max(np.abs(result.residuals_cm[2:])), 1e-6)
+        self.assertAlmostEqual(result.constants['R_cm'], subject_constants['R_cm'], places=5)
+
+    def test_invalid_parameters(self):
+
+        with self.assertRaises(ValueError):
+            calibrate(glints_1, glints_2, pupils, np.zeros((9, 2)), parameters=('n1',), **constants)
+
+        with self.assertRaises(ValueError):
+            calibrate(glints_1[:1], glints_2[:1], pupils[:1], np.zeros((1, 2)), **constants)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=1)
@@ -0,0 +1,107 @@
+import unittest
+import numpy as np
+import math
+
+from src.camera_rig import CameraRig, EyeModel
+from src.calculate_point_of_interest import get_point_of_interest, get_points_of_interest
+from src.rotation_matrix import calculate_rotation_matrix_extrinsic
+from tests.integration_test import constants
+
+
+class TestCameraRig(unittest.TestCase):
+
+    def test_from_constants(self):
+        rig = CameraRig.from_constants(constants)
+
+        self.assertEqual(rig.intrinsics, (1.2, 0.00048, 0.00048, 400, 300))
+        np.testing.assert_array_equal(rig.lights_wcs, [[-23, 0, 0], [23, 0, 0]])
+        np.testing.assert_array_equal(rig.light_2_wcs, [23, 0, 0])
+        np.testing.assert_array_almost_equal(rig.camera_rotation_matrix,
+                                             calculate_rotation_matrix_extrinsic(math.radians(8), 0, 0))
+        self.assertEqual(rig.cornea_solver, 'minimize')
+        self.assertAlmostEqual(rig.eye.n1, 1.3375)
+        self.assertAlmostEqual(rig.eye.alpha, math.radians(-5))
+
+        # camera rotation is optional
+        constants_without_rotation = dict(constants)
+        del constants_without_rotation['camera_rotation']
+        rig = CameraRig.from_constants(constants_without_rotation)
+        np.testing.assert_array_almost_equal(rig.camera_rotation_matrix, np.eye(3))
+
+    def test_immutable(self):
+        rig = CameraRig.from_constants(constants)
+
+        with self.assertRaises(AttributeError):
+            rig.z_shift = 0
+        with self.assertRaises(ValueError):
+            rig.camera_position_wcs[0] = 1
+        with self.assertRaises(ValueError):
+            rig.camera_rotation_matrix[0, 0] = 1
+
+    def test_validation(self):
+        with self.assertRaises(KeyError):
+            CameraRig.from_constants({key: value for key, value in constants.items() if key != 'z_shift'})
+        with self.assertRaises(ValueError):
+            CameraRig.from_constants(dict(constants, focal_length_cm=-1.2))
+        with self.assertRaises(ValueError):
+            CameraRig.from_constants(dict(constants, camera_position_wcs=np.array([0, 0])))
+        with self.assertRaises(ValueError):
+            CameraRig.from_constants({key: value for key, value in constants.items() if key != 'light_2_wcs'})
+        with self.assertRaises(ValueError):
+            EyeModel.create(R_cm=0.78, K_cm=0.9, n1=1.3375, n2=1, alpha=0, beta=0)
+
+    def test_cornea_only(self):
+        cornea_constants = {key: constants[key] for key in ['light_1_wcs', 'light_2_wcs', 'camera_position_wcs',
+                                                            'focal_length_cm', 'pixel_size_cm', 'principal_point',
+                                                            'R_cm', 'distance_to_camera_cm']}
+        rig = CameraRig.from_constants(cornea_constants, cornea_only=True)
+
+        self.assertIsNone(rig.z_shift)
+        self.assertEqual(rig.eye.R_cm, 0.78)
+        self.assertIsNone(rig.eye.K_cm)
+        with self.assertRaises(KeyError):
+            CameraRig.from_constants(cornea_constants)
+        with self.assertRaises(ValueError):
+            CameraRig.from_constants(dict(cornea_constants, R_cm=-0.78), cornea_only=True)
+
+    def test_to_constants(self):
+        rig = CameraRig.from_constants(dict(constants, alpha_left=math.radians(5), cornea_solver='planes',
+                                            distortion_coefficients=(-0.3, 0.1, 0.001, -0.0005),
+                                            image_size=(640, 480)))
+
+        constants_of_rig = rig.to_constants()
+        self.assertEqual(constants_of_rig['image_size'], (640, 480))
+        np.testing.assert_equal(tuple(CameraRig.from_constants(constants_of_rig)), tuple(rig))
+
+        rig = CameraRig.from_constants(constants, cornea_only=True)
+        self.assertNotIn('z_shift', rig.to_constants())
+        np.testing.assert_equal(tuple(CameraRig.from_constants(rig.to_constants(), cornea_only=True)), tuple(rig))
+
+    def test_cache(self):
+        rig = CameraRig.from_constants(constants)
+
+        # equal constants give the same rig, other constants give another one
+        self.assertIs(CameraRig.from_constants({key: np.copy(value) for key, value in constants.items()}), rig)
+        self.assertIsNot(CameraRig.from_constants(dict(constants, z_shift=-17)), rig)
+        self.assertIsNot(CameraRig.from_constants(constants, cornea_only=True), rig)
+
+        # an invalid dictionary is not cached
+        with self.assertRaises(ValueError):
+            CameraRig.from_constants(dict(constants, focal_length_cm=-1.2))
+        with self.assertRaises(ValueError):
+            CameraRig.from_constants(dict(constants, focal_length_cm=-1.2))
+
+    def test_pipeline_with_rig(self):
+        rig = CameraRig.from_constants(constants)
+        glint_1_ics, glint_2_ics, pupil_center_ics = (327.45, 168.75), (309.05, 169.2), (322.9, 173.3)
+
+        point_of_interest = get_point_of_interest(glint_1_ics, glint_2_ics, pupil_center_ics, rig=rig)
+        expected_value = get_point_of_interest(glint_1_ics, glint_2_ics, pupil_center_ics, **constants)
+        np.testing.assert_array_almost_equal(point_of_interest, expected_value)
+
+        points_of_interest = get_points_of_interest([glint_1_ics], [glint_2_ics], [pupil_center_ics], rig=rig)
+        np.testing.assert_allclose(points_of_interest[0], expected_value, atol=1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
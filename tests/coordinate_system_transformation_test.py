@@ -1,7 +1,8 @@
 import unittest
 import numpy as np
 
-from src.coordinate_system_transformations import transform_2D_to_3D, transform_3D_to_3D
+from src.coordinate_system_transformations import transform_2D_to_3D, transform_3D_to_3D, \
+    transform_2D_to_3D_batch, transform_3D_to_3D_batch
 
 
 class TestCSTransformation(unittest.TestCase):
@@ -90,6 +91,22 @@ class TestCSTransformation(unittest.TestCase):
         output = transform_3D_to_3D(input, alpha, beta, gamma, shift)
         np.testing.assert_array_almost_equal(output, expected_value)
 
+    def test_transform_2D_to_3D_batch(self):
+        points_ics = np.array([[400, 300], [650, 425], [0, 0]])
+        expected_value = np.array([[0, 0, -1.2],
+                                   [1.2, 0.6, -1.2],
+                                   [-1.92, -1.44, -1.2]])
+        points_ccs = transform_2D_to_3D_batch(points_ics, 1.2, 0.0048, 0.0048, 400, 300)
+        np.testing.assert_array_almost_equal(points_ccs, expected_value)
+
+    def test_transform_3D_to_3D_batch(self):
+        input = np.array([[12, 6, 12], [12, 6, 24]])
+        alpha, beta, gamma = np.radians((90, 90, 90))
+        shift = np.array([5, -10, 10])
+        output = transform_3D_to_3D_batch(input, alpha, beta, gamma, shift)
+        for row_input, row_output in zip(input, output):
+            np.testing.assert_array_almost_equal(row_output, transform_3D_to_3D(row_input, alpha, beta, gamma, shift))
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=1)
\ No newline at end of file
@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+
+from src.calculate_cornea_center import calculate_cornea_center
+from src.cornea_center_tracker import CorneaCenterTracker
+from tests.integration_test import constants
+
+
+class TestCorneaCenterTracker(unittest.TestCase):
+
+    def test_update(self):
+        tracker = CorneaCenterTracker(**constants)
+
+        # glints moving from point 4 to point 5 of the integration test
+        for i, t in enumerate(np.linspace(0, 1, 5)):
+            glint_1_ics = (1 - t) * np.array([327.45, 168.75]) + t * np.array([322.711, 168.816])
+            glint_2_ics = (1 - t) * np.array([309.05, 169.2]) + t * np.array([304.579, 169.211])
+
+            c = tracker.update(glint_1_ics, glint_2_ics, i * 0.01)
+
+            expected_value = calculate_cornea_center(glint_1_ics, glint_2_ics, **constants)
+            np.testing.assert_allclose(c, expected_value, atol=1e-2)
+
+        self.assertIsNotNone(tracker.kq_velocity)
+
+    def test_initial_solution(self):
+        tracker = CorneaCenterTracker(max_gap=0.1, **constants)
+        self.assertIsNone(tracker.initial_solution(0))
+
+        tracker.kq = np.array([47., 47.])
+        tracker.kq_velocity = np.array([10., 20.])
+        tracker.timestamp = 1.0
+        np.testing.assert_array_almost_equal(tracker.initial_solution(1.01), [47.1, 47.2])
+
+        tracker.predict_velocity = False
+        np.testing.assert_array_almost_equal(tracker.initial_solution(1.01), [47., 47.])
+
+        # gap
+        self.assertIsNone(tracker.initial_solution(1.5))
+        self.assertIsNone(tracker.kq)
+
+    def test_reset_after_blink(self):
+        tracker = CorneaCenterTracker(**constants)
+        tracker.update((327.45, 168.75), (309.05, 169.2), 0)
+        self.assertIsNotNone(tracker.kq)
+
+        self.assertIsNone(tracker.update(None, (309.05, 169.2), 0.01))
+        self.assertIsNone(tracker.kq)
+
+    def test_reset_after_nan_glint(self):
+        for solver in ('minimize', 'planes', 'levenberg_marquardt'):
+            tracker = CorneaCenterTracker(**dict(constants, cornea_solver=solver))
+            tracker.update((327.45, 168.75), (309.05, 169.2), 0)
+
+            self.assertIsNone(tracker.update((np.nan, 168.75), (309.05, 169.2), 0.01))
+            self.assertIsNone(tracker.kq)
+
+            for i in range(2, 5):
+                c = tracker.update((327.45, 168.75), (309.05, 169.2), i * 0.01)
+                self.assertTrue(np.all(np.isfinite(c)))
+                self.assertTrue(np.all(np.isfinite(tracker.kq)))
+
+
+if __name__ == '__main__':
+    unittest.main()
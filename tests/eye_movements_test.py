@@ -0,0 +1,111 @@
+import unittest
+import numpy as np
+
+from src.eye_movements import calculate_angular_velocities, calculate_gaze_angles, detect_velocity_threshold, \
+    detect_dispersion_threshold, find_fixations, VelocityThresholdDetector, DispersionThresholdDetector, \
+    FIXATION, SACCADE, UNCLASSIFIED
+
+z_shift = -18
+
+
+def create_session(fixation_frames=30, noise_cm=0.05, seed=0):
+    """
+    Gaze rays at 60 Hz of three fixations with saccades of 3 frames between them.
+
+    :return: centers of cornea curvature, visual axes, timestamps, points of interest
+    """
+    fixation_points = [np.array([0., 0, z_shift]), np.array([20., 5, z_shift]), np.array([-10., -15, z_shift])]
+
+    points_of_interest = [fixation_points[0]] * fixation_frames
+    for previous_point, point in zip(fixation_points[:-1], fixation_points[1:]):
+        points_of_interest += [previous_point + (point - previous_point) * step for step in (0.25, 0.5, 0.75)]
+        points_of_interest += [point] * fixation_frames
+
+    points_of_interest = np.array(points_of_interest)
+    points_of_interest[:, :2] += np.random.RandomState(seed).normal(scale=noise_cm, size=(len(points_of_interest), 2))
+
+    centers = np.tile([1., 2, 60], (len(points_of_interest), 1))
+    visual_axes = points_of_interest - centers
+    visual_axes /= np.linalg.norm(visual_axes, axis=-1, keepdims=True)
+
+    return centers, visual_axes, np.arange(len(points_of_interest)) / 60., points_of_interest
+
+
+class TestEyeMovements(unittest.TestCase):
+
+    def test_angular_velocities(self):
+
+        centers = np.array([[0., 0, 60], [0, 0, 60]])
+        visual_axes = np.array([[0., 0, -1], [np.sin(np.radians(1)), 0, -np.cos(np.radians(1))]])
+
+        velocities = calculate_angular_velocities(centers, visual_axes, np.array([0, 0.01]), z_shift)
+
+        self.assertTrue(np.isnan(velocities[0]))
+        self.assertAlmostEqual(velocities[1], 100)
+        np.testing.assert_array_almost_equal(calculate_gaze_angles(visual_axes), [[0, 0], [1, 0]])
+
+    def test_detect_fixations(self):
+
+        centers, visual_axes, timestamps, points_of_interest = create_session()
+
+        for labels, fixation_ids in (detect_velocity_threshold(centers, visual_axes, timestamps, z_shift),
+                                     detect_dispersion_threshold(centers, visual_axes, timestamps)):
+            self.assertEqual(len(labels), len(timestamps))
+            self.assertTrue(np.all(labels[[31, 32, 64, 65]] == SACCADE))
+            self.assertTrue(np.all(labels[40:60] == FIXATION))
+
+            fixations = find_fixations(fixation_ids, timestamps, points_of_interest, min_duration=0.1)
+
+            self.assertEqual(len(fixations.starts), 3)
+            np.testing.assert_array_equal(fixations.stops, [30, 63, 96])
+            np.testing.assert_allclose(fixations.points_of_interest[:, :2], [[0, 0], [20, 5], [-10, -15]], atol=0.05)
+            np.testing.assert_allclose(fixations.durations, 0.47, atol=0.02)
+
+    def test_incremental_detection(self):
+
+        centers, visual_axes, timestamps, _ = create_session()
+
+        for detector, detect in ((VelocityThresholdDetector(z_shift), lambda: detect_velocity_threshold(
+                                      centers, visual_axes, timestamps, z_shift)),
+                                 (DispersionThresholdDetector(), lambda: detect_dispersion_threshold(
+                                      centers, visual_axes, timestamps))):
+            labels, fixation_ids = detect()
+
+            # frame by frame, and in chunks
+            detected_frames = [detector.update(center, visual_axis, timestamp)
+                               for center, visual_axis, timestamp in zip(centers[:40], visual_axes[:40], timestamps[:40])]
+            detected_frames += [detector.process(centers[40:70], visual_axes[40:70], timestamps[40:70]),
+                                detector.process(centers[70:], visual_axes[70:], timestamps[70:]),
+                                detector.finish()]
+
+            np.testing.assert_array_equal(np.concatenate([frames.indices for frames in detected_frames]),
+                                          np.arange(len(timestamps)))
+            np.testing.assert_array_equal(np.concatenate([frames.labels for frames in detected_frames]), labels)
+            np.testing.assert_array_equal(np.concatenate([frames.fixation_ids for frames in detected_frames]),
+                                          fixation_ids)
+
+    def test_missing_frames(self):
+
+        centers, visual_axes, timestamps, _ = create_session()
+        visual_axes[45] = np.nan
+
+        for labels, fixation_ids in (detect_velocity_threshold(centers, visual_axes, timestamps, z_shift),
+                                     detect_dispersion_threshold(centers, visual_axes, timestamps)):
+            self.assertEqual(labels[45], UNCLASSIFIED)
+            # the fixation is split by the missing frame
+            self.assertNotEqual(fixation_ids[44], fixation_ids[47])
+            self.assertTrue(np.all(labels[50:60] == FIXATION))
+
+    def test_dispersion_threshold_short_session(self):
+
+        centers, visual_axes, timestamps, _ = create_session()
+
+        labels, fixation_ids = detect_dispersion_threshold(centers[:3], visual_axes[:3], timestamps[:3])
+
+        np.testing.assert_array_equal(labels, [UNCLASSIFIED] * 3)
+        np.testing.assert_array_equal(fixation_ids, [-1] * 3)
+        self.assertEqual(len(find_fixations(fixation_ids, timestamps[:3], np.zeros((3, 3))).starts), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import numpy as np
+import math
+
+from src.forward_simulator import simulate_frames, simulate_random_frames, project_to_image_batch
+from src.camera_rig import CameraRig, EyeModel
+from src.coordinate_system_transformations import transform_2D_to_3D_batch
+from src.calculate_cornea_center import calculate_cornea_center_batch
+from src.calculate_point_of_interest import get_points_of_interest, get_points_of_interest_multiple_lights
+from tests.integration_test import constants
+
+
+class TestForwardSimulator(unittest.TestCase):
+
+    def test_project_to_image(self):
+
+        rig = CameraRig.from_constants(constants)
+        points_ics = np.array([[323, 163], [400, 300], [512.5, 96.25]])
+
+        # points on the rays of transform_2D_to_3D are projected back to the same pixels
+        points_wcs = -40 * transform_2D_to_3D_batch(points_ics, *rig.intrinsics)
+
+        np.testing.assert_array_almost_equal(project_to_image_batch(points_wcs, rig.camera_position_wcs, rig.intrinsics),
+                                             points_ics)
+
+    def test_simulate_frames(self):
+
+        rig = CameraRig.from_constants(constants)
+        cornea_centers_wcs = np.array([[1.8, 3.3, 62], [-2, 1, 55], [0.5, -3, 48]])
+        targets_scs = np.array([[9.6, 18.9], [-7.8, -9], [30, -43.6]])
+
+        frames = simulate_frames(cornea_centers_wcs, targets_scs, rig=rig)
+
+        self.assertEqual(frames.glints_ics.shape, (3, 2, 2))
+        self.assertEqual(frames.pupil_centers_ics.shape, (3, 2))
+        np.testing.assert_array_almost_equal(frames.targets_scs[:, 2], rig.z_shift)
+        np.testing.assert_array_almost_equal(np.linalg.norm(frames.pupil_centers_wcs - cornea_centers_wcs, axis=-1),
+                                             rig.eye.K_cm)
+
+        # the pipeline recovers the ground truth from the simulated image
+        centers = calculate_cornea_center_batch(frames.glints_ics[:, 0], frames.glints_ics[:, 1], rig=rig)
+        np.testing.assert_array_almost_equal(centers, cornea_centers_wcs, decimal=8)
+
+        points_of_interest = get_points_of_interest(frames.glints_ics[:, 0], frames.glints_ics[:, 1],
+                                                    frames.pupil_centers_ics, rig=rig)
+        np.testing.assert_array_almost_equal(points_of_interest, frames.targets_scs, decimal=6)
+
+    def test_simulate_frames_multiple_lights_and_eyes(self):
+
+        three_lights_constants = dict(constants, light_3_wcs=np.array([0, 10, 0]))
+        rig = CameraRig.from_constants(three_lights_constants)
+        eye = EyeModel(*(np.array([value, value]) for value in
+                         EyeModel.create(0.8, 0.45, 1.3375, 1, math.radians(4), math.radians(-1))))
+
+        frames = simulate_frames(np.array([[1, 2, 55], [-1, 0, 50]]), np.array([[0, -10], [20, -25]]), eye=eye, rig=rig)
+
+        self.assertEqual(frames.glints_ics.shape, (2, 3, 2))
+
+        points_of_interest = get_points_of_interest_multiple_lights(frames.glints_ics, frames.pupil_centers_ics,
+                                                                    rig=rig._replace(eye=eye))
+        np.testing.assert_array_almost_equal(points_of_interest, frames.targets_scs, decimal=6)
+
+    def test_simulate_random_frames(self):
+
+        rig = CameraRig.from_constants(constants)
+
+        frames = simulate_random_frames(1000, seed=1, rig=rig)
+        chunked_frames = simulate_frames(frames.cornea_centers_wcs, frames.targets_scs, chunk_size=100, rig=rig)
+
+        self.assertTrue(np.all(np.isfinite(frames.glints_ics)))
+        self.assertTrue(np.all(np.isfinite(frames.pupil_centers_ics)))
+        np.testing.assert_array_almost_equal(chunked_frames.glints_ics, frames.glints_ics)
+        np.testing.assert_array_almost_equal(chunked_frames.pupil_centers_ics, frames.pupil_centers_ics)
+
+        points_of_interest = get_points_of_interest(frames.glints_ics[:, 0], frames.glints_ics[:, 1],
+                                                    frames.pupil_centers_ics, rig=rig)
+        np.testing.assert_array_almost_equal(points_of_interest, frames.targets_scs, decimal=6)
+
+    def test_simulate_frames_wrong_shapes(self):
+
+        with self.assertRaises(ValueError):
+            simulate_frames(np.zeros((3, 3)), np.zeros((2, 2)), **constants)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import numpy as np
+
+from src.calculate_point_of_interest import get_points_of_interest
+from src.frame_batch import FrameBatch, FRAME_DTYPE
+from tests.integration_test import constants
+
+glints_1 = np.array([(332, 164), (327.45, 168.75), (330.5, 175.5), (322.711, 168.816)])
+glints_2 = np.array([(313, 165), (309.05, 169.2), (311, 176), (304.579, 169.211)])
+pupils = np.array([(323, 163), (322.9, 173.3), (320, 185.5), (310.421, 171.658)])
+
+
+class TestFrameBatch(unittest.TestCase):
+
+    def test_from_arrays(self):
+
+        batch = FrameBatch.from_arrays(glints_1, glints_2, pupils, timestamps=[0.1, 0.2, 0.3, 0.4])
+
+        self.assertEqual(len(batch), 4)
+        self.assertEqual(batch.frames.dtype, FRAME_DTYPE)
+        np.testing.assert_array_equal(batch.glints_1, glints_1)
+        np.testing.assert_array_equal(batch.pupils, pupils)
+        np.testing.assert_array_equal(batch.valid, [True, True, True, True])
+        self.assertTrue(np.all(np.isnan(batch.points_of_interest)))
+
+        with self.assertRaises(ValueError):
+            FrameBatch(np.zeros(3))
+
+    def test_views(self):
+
+        batch = FrameBatch.from_arrays(glints_1, glints_2, pupils)
+
+        # columns and slices share memory with the batch
+        self.assertTrue(np.shares_memory(batch.glints_1, batch.frames))
+        part = batch[1:3]
+        self.assertTrue(np.shares_memory(part.frames, batch.frames))
+
+        part.timestamps[:] = 7
+        np.testing.assert_array_equal(batch.timestamps, [0, 7, 7, 3])
+
+        self.assertEqual(len(batch[-1]), 1)
+        np.testing.assert_array_equal(batch[-1].glints_1, glints_1[-1:])
+
+    def test_process(self):
+
+        batch = FrameBatch.from_arrays(glints_1, glints_2, pupils)
+        batch.process(**constants)
+
+        expected_points_of_interest = get_points_of_interest(glints_1, glints_2, pupils, **constants)
+        np.testing.assert_array_almost_equal(batch.points_of_interest, expected_points_of_interest)
+
+        # a part of the batch is processed in place
+        batch = FrameBatch.from_arrays(glints_1, glints_2, pupils)
+        batch[2:].process(**constants)
+        self.assertTrue(np.all(np.isnan(batch.points_of_interest[:2])))
+        np.testing.assert_array_almost_equal(batch.points_of_interest[2:], expected_points_of_interest[2:])
+
+    def test_process_invalid_frames(self):
+
+        missing_glints = glints_1.copy()
+        missing_glints[1] = np.nan
+
+        batch = FrameBatch.from_arrays(missing_glints, glints_2, pupils)
+        np.testing.assert_array_equal(batch.valid, [True, False, True, True])
+
+        batch.process(**constants)
+
+        expected_points_of_interest = get_points_of_interest(glints_1, glints_2, pupils, **constants)
+        self.assertTrue(np.all(np.isnan(batch.points_of_interest[1])))
+        np.testing.assert_array_almost_equal(batch.points_of_interest[[0, 2, 3]], expected_points_of_interest[[0, 2, 3]])
+
+        batch.valid[:] = False
+        batch.process(**constants)
+        self.assertTrue(np.all(np.isnan(batch.points_of_interest)))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=1)
@@ -0,0 +1,111 @@
+import unittest
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import numpy as np
+
+from src.calculate_point_of_interest import get_points_of_interest
+from src.gaze_server import GazeServer, request_points_of_interest
+from tests.integration_test import constants
+
+frames = [((332 + shift, 164), (322 + shift, 169), (323 + shift, 163)) for shift in range(-5, 5)]
+
+
+def expected_points_of_interest(frames):
+    glints_1, glints_2, pupils = (np.array(values, dtype=float) for values in zip(*frames))
+    return get_points_of_interest(glints_1, glints_2, pupils, **constants)
+
+
+class TestGazeServer(unittest.TestCase):
+
+    def test_tcp_server(self):
+
+        async def run():
+            server = GazeServer(batch_window=0.05, **constants)
+            host, port = await server.start_tcp()
+
+            connections = [await asyncio.open_connection(host, port) for _ in range(3)]
+            try:
+                responses = await asyncio.gather(*[request_points_of_interest(reader, writer, frames)
+                                                   for reader, writer in connections])
+            finally:
+                for _, writer in connections:
+                    writer.close()
+                await server.close()
+
+            return server, responses
+
+        server, responses = asyncio.run(run())
+
+        expected = expected_points_of_interest(frames)
+        for client_responses in responses:
+            self.assertEqual([response['id'] for response in client_responses], list(range(len(frames))))
+            np.testing.assert_array_almost_equal([response['point_of_interest'] for response in client_responses],
+                                                 expected)
+
+        # frames of all clients are coalesced into a few batches
+        self.assertEqual(server.number_of_frames, 3 * len(frames))
+        self.assertLess(server.number_of_batches, 3 * len(frames))
+
+    def test_max_batch_size(self):
+
+        async def run():
+            server = GazeServer(batch_window=0.05, max_batch_size=4, **constants)
+            results = await asyncio.gather(*[server.submit(*frame) for frame in frames])
+            await server.close()
+            return server, results
+
+        server, results = asyncio.run(run())
+
+        np.testing.assert_array_almost_equal(results, expected_points_of_interest(frames))
+        self.assertEqual(server.number_of_batches, 3)
+
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'Unix sockets are not supported')
+    def test_unix_server_errors(self):
+
+        async def run(path):
+            server = GazeServer(batch_window=0, **constants)
+            await server.start_unix(path)
+
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write(b'not json\n')
+            writer.write(json.dumps({'id': 7, 'glint_1': [332, 164]}).encode() + b'\n')
+            writer.write(json.dumps({'id': 8, 'glint_1': [332, 164], 'glint_2': [322],
+                                     'pupil': [323, 163]}).encode() + b'\n')
+            writer.write(json.dumps({'id': 9, 'glint_1': [332, 164], 'glint_2': [322, 169],
+                                     'pupil': [323, 163]}).encode() + b'\n')
+            # the pupil is far from the cornea, and a NaN pupil (accepted by Python's json)
+            writer.write(json.dumps({'id': 10, 'glint_1': [332, 164], 'glint_2': [322, 169],
+                                     'pupil': [623, 463]}).encode() + b'\n')
+            writer.write(json.dumps({'id': 11, 'glint_1': [332, 164], 'glint_2': [322, 169],
+                                     'pupil': [float('nan'), 163]}).encode() + b'\n')
+            writer.write(json.dumps({'id': float('nan'), 'glint_1': [332, 164], 'glint_2': [322, 169],
+                                     'pupil': [323, 163]}).encode() + b'\n')
+            await writer.drain()
+
+            lines = [await asyncio.wait_for(reader.readline(), 10) for _ in range(7)]
+            writer.close()
+            await server.close()
+            return lines
+
+        with tempfile.TemporaryDirectory() as directory:
+            lines = asyncio.run(run(os.path.join(directory, 'gaze.sock')))
+
+        # responses are valid JSON without NaN
+        responses = [json.loads(line, parse_constant=self.fail) for line in lines]
+
+        self.assertEqual([response['id'] for response in responses], [None, 7, 8, 9, 10, 11, None])
+        self.assertIn('error', responses[0])
+        self.assertIn('error', responses[1])
+        self.assertIn('error', responses[2])
+        np.testing.assert_array_almost_equal(responses[3]['point_of_interest'],
+                                             expected_points_of_interest(frames[5:6])[0])
+        self.assertEqual(responses[4], {'id': 10, 'error': 'pupil_ray_misses_cornea'})
+        self.assertEqual(responses[5], {'id': 11, 'error': 'missing_input'})
+        self.assertIn('error', responses[6])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=1)
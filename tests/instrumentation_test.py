@@ -0,0 +1,90 @@
+import unittest
+import numpy as np
+
+from src.calculate_point_of_interest import get_point_of_interest
+from src.instrumentation import PipelineStats
+from tests.integration_test import constants
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_instrumented_pipeline(self):
+
+        events = []
+        stats = PipelineStats(callback=events.append)
+
+        for shift in range(3):
+            point_of_interest = get_point_of_interest((332 + shift, 164), (322 + shift, 169), (323 + shift, 163),
+                                                      stats=stats, **constants)
+            expected_point_of_interest = get_point_of_interest((332 + shift, 164), (322 + shift, 169),
+                                                               (323 + shift, 163), **constants)
+            np.testing.assert_array_almost_equal(point_of_interest, expected_point_of_interest)
+
+        summary = stats.summary()
+
+        self.assertEqual(set(summary['stages']), {'cornea_center', 'pupil_transform_2D_to_3D', 'optic_axis',
+                                                  'visual_axis', 'screen_transform', 'point_of_interest',
+                                                  'end_to_end'})
+        for stage_summary in summary['stages'].values():
+            self.assertEqual(stage_summary['count'], 3)
+            self.assertGreater(stage_summary['p50'], 0)
+            self.assertLessEqual(stage_summary['p50'], stage_summary['p99'])
+
+        self.assertGreaterEqual(summary['stages']['end_to_end']['mean'], summary['stages']['cornea_center']['mean'])
+
+        solver_summary = summary['solvers']['minimize']
+        self.assertEqual(solver_summary['count'], 3)
+        self.assertGreater(solver_summary['iterations']['mean'], 0)
+        self.assertGreater(solver_summary['evaluations']['mean'], solver_summary['iterations']['mean'])
+        self.assertEqual(summary['failures'], {})
+
+        self.assertEqual(len([event for event in events if event['type'] == 'stage']), 3 * 7)
+        self.assertEqual(len([event for event in events if event['type'] == 'solver']), 3)
+
+    def test_solvers(self):
+
+        for solver in ('planes', 'levenberg_marquardt'):
+            stats = PipelineStats()
+            get_point_of_interest((332, 164), (322, 169), (323, 163), stats=stats,
+                                  **dict(constants, cornea_solver=solver))
+            solver_summary = stats.summary()['solvers'][solver]
+            self.assertEqual(solver_summary['count'], 1)
+            self.assertEqual(solver_summary['not_converged'], 0)
+            self.assertGreater(solver_summary['evaluations']['mean'], solver_summary['iterations']['mean'])
+
+    def test_failures(self):
+
+        stats = PipelineStats()
+
+        with self.assertRaises(TypeError):
+            get_point_of_interest(None, (322, 169), (323, 163), stats=stats, **constants)
+
+        summary = stats.summary()
+        self.assertEqual(summary['failures'], {'cornea_center': 1})
+        self.assertNotIn('end_to_end', summary['stages'])
+        self.assertEqual(stats.last_errors[0][0], 'cornea_center')
+
+        # NaN results are failures of the stage where they appear first
+        stats.reset()
+        point_of_interest = get_point_of_interest((332, 164), (322, 169), (623, 163), stats=stats, **constants)
+
+        self.assertTrue(np.all(np.isnan(point_of_interest)))
+        summary = stats.summary()
+        self.assertEqual(summary['failures'], {'optic_axis': 1})
+        self.assertNotIn('end_to_end', summary['stages'])
+
+    def test_window(self):
+
+        stats = PipelineStats(window=2)
+        for seconds in (1., 2., 3.):
+            stats.record_stage('stage', seconds)
+
+        summary = stats.summary(percentiles=(50,))
+        self.assertEqual(summary['stages']['stage'], {'count': 2, 'mean': 2.5, 'p50': 2.5})
+
+        stats.reset()
+        self.assertEqual(stats.summary()['stages'], {})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=1)
@@ -3,7 +3,8 @@ import numpy as np
 import math
 from collections import OrderedDict
 
-from src.calculate_point_of_interest import get_point_of_interest
+from src.calculate_point_of_interest import get_point_of_interest, get_points_of_interest, \
+    get_points_of_interest_multiple_lights, get_gaze_rays, calculate_point_of_interest
 
 # A note on coordinate systems.
 
@@ -37,78 +38,79 @@ constants = {
 }
 
 
+test_data = OrderedDict(
+    {
+        1: {
+            'glint1': (332, 164),
+            'glint2': (322, 169),
+            'glint3': (313, 165),
+            'pupil': (323, 163),
+            'point_on_screen': (490, 65)
+        },
+        2: {
+            'glint1': (333, 164),
+            'glint2': (323, 169),
+            'glint3': (314, 165),
+            'pupil': (324, 163),
+            'point_on_screen': (840, 65)
+        },
+        3: {
+            'glint1': (324.5, 164.4),
+            'glint2': (314.9, 168.4),
+            'glint3': (305.6, 164),
+            'pupil': (305.3, 159.5),
+            'point_on_screen': (1190, 65)
+        },
+        4: {
+            'glint1': (327.45, 168.75),
+            'glint2': (318.3, 172.4),
+            'glint3': (309.05, 169.2),
+            'pupil': (322.9, 173.3),
+            'point_on_screen': (490, 520)
+        },
+        5: {
+            'glint1': (322.711, 168.816),
+            'glint2': (313.447, 172.579),
+            'glint3': (304.579, 169.211),
+            'pupil': (310.421, 171.658),
+            'point_on_screen': (840, 520)
+        },
+        6: {
+            'glint1': (317.78, 168.707),
+            'glint2': (308.78, 172.561),
+            'glint3': (299.561, 169.122),
+            'pupil': (300.463, 173.024),
+            'point_on_screen': (1190, 520)
+        },
+        7: {
+            'glint1': (330.5, 175.5),
+            'glint2': (320.667, 179),
+            'glint3': (311, 176),
+            'pupil': (320, 185.5),
+            'point_on_screen': (490, 975)
+        },
+        8: {
+            'glint1': (321.722, 174.583),
+            'glint2': (312.75, 178.389),
+            'glint3': (303.389, 174.722),
+            'pupil': (310.278, 185.556),
+            'point_on_screen': (840, 975)
+        },
+        9: {
+            'glint1': (317.2, 174.933),
+            'glint2': (308.267, 178.567),
+            'glint3': (298.933, 174.933),
+            'pupil': (302.967, 186.1),
+            'point_on_screen': (1190, 975)
+        }
+    }
+)
+
+
 class TestIntegration(unittest.TestCase):
 
     def test_end_to_end_calculations(self):
 
-        test_data = OrderedDict(
-            {
-                1: {
-                    'glint1': (332, 164),
-                    'glint2': (322, 169),
-                    'glint3': (313, 165),
-                    'pupil': (323, 163),
-                    'point_on_screen': (490, 65)
-                },
-                2: {
-                    'glint1': (333, 164),
-                    'glint2': (323, 169),
-                    'glint3': (314, 165),
-                    'pupil': (324, 163),
-                    'point_on_screen': (840, 65)
-                },
-                3: {
-                    'glint1': (324.5, 164.4),
-                    'glint2': (314.9, 168.4),
-                    'glint3': (305.6, 164),
-                    'pupil': (305.3, 159.5),
-                    'point_on_screen': (1190, 65)
-                },
-                4: {
-                    'glint1': (327.45, 168.75),
-                    'glint2': (318.3, 172.4),
-                    'glint3': (309.05, 169.2),
-                    'pupil': (322.9, 173.3),
-                    'point_on_screen': (490, 520)
-                },
-                5: {
-                    'glint1': (322.711, 168.816),
-                    'glint2': (313.447, 172.579),
-                    'glint3': (304.579, 169.211),
-                    'pupil': (310.421, 171.658),
-                    'point_on_screen': (840, 520)
-                },
-                6: {
-                    'glint1': (317.78, 168.707),
-                    'glint2': (308.78, 172.561),
-                    'glint3': (299.561, 169.122),
-                    'pupil': (300.463, 173.024),
-                    'point_on_screen': (1190, 520)
-                },
-                7: {
-                    'glint1': (330.5, 175.5),
-                    'glint2': (320.667, 179),
-                    'glint3': (311, 176),
-                    'pupil': (320, 185.5),
-                    'point_on_screen': (490, 975)
-                },
-                8: {
-                    'glint1': (321.722, 174.583),
-                    'glint2': (312.75, 178.389),
-                    'glint3': (303.389, 174.722),
-                    'pupil': (310.278, 185.556),
-                    'point_on_screen': (840, 975)
-                },
-                9: {
-                    'glint1': (317.2, 174.933),
-                    'glint2': (308.267, 178.567),
-                    'glint3': (298.933, 174.933),
-                    'pupil': (302.967, 186.1),
-                    'point_on_screen': (1190, 975)
-                }
-            }
-        )
-
         output = []
         for point_name, point in test_data.items():
 
@@ -125,6 +127,52 @@ class TestIntegration(unittest.TestCase):
         print('{} {} {}'.format(output[3], output[4], output[5]))
         print('{} {} {}'.format(output[6], output[7], output[8]))
 
+    def test_batched_end_to_end_calculations(self):
+
+        glints_1 = np.array([point['glint1'] for point in test_data.values()])
+        glints_3 = np.array([point['glint3'] for point in test_data.values()])
+        pupils = np.array([point['pupil'] for point in test_data.values()])
+
+        points_of_interest = get_points_of_interest(glints_1, glints_3, pupils, **constants)
+
+        self.assertEqual(points_of_interest.shape, (len(test_data), 3))
+        for point, point_of_interest in zip(test_data.values(), points_of_interest):
+            expected_value = get_point_of_interest(point['glint1'], point['glint3'], point['pupil'], **constants)
+            np.testing.assert_allclose(point_of_interest, expected_value, atol=1e-3)
+
+    def test_gaze_rays(self):
+
+        glints_1 = np.array([point['glint1'] for point in test_data.values()], dtype=float)
+        glints_3 = np.array([point['glint3'] for point in test_data.values()], dtype=float)
+        pupils = np.array([point['pupil'] for point in test_data.values()], dtype=float)
+
+        centers, visual_axes = get_gaze_rays(glints_1, glints_3, pupils, **constants)
+        points_of_interest = get_points_of_interest(glints_1, glints_3, pupils, **constants)
+
+        for center, visual_axis, point_of_interest in zip(centers, visual_axes, points_of_interest):
+            self.assertAlmostEqual(np.linalg.norm(visual_axis), 1)
+            np.testing.assert_array_almost_equal(calculate_point_of_interest(center, visual_axis, constants['z_shift']),
+                                                 point_of_interest)
+
+    def test_planes_cornea_solver(self):
+
+        constants_planes = dict(constants, cornea_solver='planes')
+
+        for point in test_data.values():
+            point_of_interest = get_point_of_interest(point['glint1'], point['glint3'], point['pupil'], **constants_planes)
+            expected_value = get_point_of_interest(point['glint1'], point['glint3'], point['pupil'], **constants)
+            np.testing.assert_allclose(point_of_interest, expected_value, atol=1e-2)
+
+    def test_multiple_lights_end_to_end_calculations(self):
+
+        glints = np.array([(point['glint1'], point['glint3']) for point in test_data.values()])
+        pupils = np.array([point['pupil'] for point in test_data.values()])
+
+        points_of_interest = get_points_of_interest_multiple_lights(glints, pupils, **constants)
+
+        expected_value = get_points_of_interest(glints[:, 0], glints[:, 1], pupils, **constants)
+        np.testing.assert_array_almost_equal(points_of_interest, expected_value)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,101 @@
+import unittest
+import numpy as np
+
+from src import kernels
+from src.calculate_optic_axis import calculate_optic_axis_unit_vector, calculate_optic_axis_unit_vector_batch
+from src.calculate_cornea_center import solve_kq_levenberg_marquardt, solve_cornea_centers_wcs_batch
+from src.lens_distortion import interpolate_map
+from src.lookup_table import interpolate_grid
+
+# kernels are tested in the compiled form if numba is available, otherwise as plain Python
+
+camera_wcs = np.array([0, 0, 0])
+light_1_wcs = np.array([-23, 0, 0])
+light_2_wcs = np.array([23, 0, 0])
+glints_1_wcs = np.array([[-0.03482400000000001, -0.063, -1.2],
+                         [-0.03696, -0.063, -1.2],
+                         [-0.0288, -0.0576, -1.2]])
+glints_2_wcs = np.array([[-0.04310400000000001, -0.0648, -1.2],
+                         [-0.04524, -0.0648, -1.2],
+                         [-0.0372, -0.0594, -1.2]])
+pupils_wcs = np.array([[-0.037, -0.0614, -1.2],
+                       [-0.0393, -0.0614, -1.2],
+                       [-0.0304, -0.0553, -1.2]])
+
+
+class TestKernels(unittest.TestCase):
+
+    def test_optic_axis_unit_vector(self):
+
+        cornea_centers, _, _ = solve_cornea_centers_wcs_batch(glints_1_wcs, glints_2_wcs, camera_wcs,
+                                                              light_1_wcs, light_2_wcs, 0.78, (52, 52))
+
+        for pupil_wcs, cornea_wcs in zip(pupils_wcs, cornea_centers):
+            expected_value = calculate_optic_axis_unit_vector(pupil_wcs, camera_wcs, cornea_wcs, 0.78, 0.42, 1.3375, 1)
+            omega = kernels.optic_axis_unit_vector(pupil_wcs, camera_wcs, cornea_wcs, 0.78, 0.42, 1.3375, 1)
+            np.testing.assert_allclose(omega, expected_value, atol=1e-12)
+
+        R = np.array([0.78, 0.8, 0.76])
+        expected_value = calculate_optic_axis_unit_vector_batch(pupils_wcs, camera_wcs, cornea_centers, R, 0.42, 1.3375, 1)
+        omega = kernels.optic_axis_unit_vectors(pupils_wcs, camera_wcs, cornea_centers, R, 0.42, 1.3375, 1)
+        np.testing.assert_allclose(omega, expected_value, atol=1e-12)
+
+    def test_solve_kq_levenberg_marquardt(self):
+
+        known_data = (glints_1_wcs[0], glints_2_wcs[0], camera_wcs, light_1_wcs, light_2_wcs, 0.78)
+
+        expected_value = solve_kq_levenberg_marquardt(*known_data, (52, 52))
+        kq = kernels.solve_kq_levenberg_marquardt(*known_data, (52, 52))
+        np.testing.assert_allclose(kq, expected_value, atol=1e-8)
+
+        # the undamped step from this solution increases the cost and is rejected
+        expected_value = solve_kq_levenberg_marquardt(*known_data, (-29, -29), damping=0)
+        kq = kernels.solve_kq_levenberg_marquardt(*known_data, (-29, -29), damping=0)
+        np.testing.assert_allclose(kq, expected_value, atol=1e-8)
+
+        # the first step increases the cost and is rejected although it is smaller than the tolerance
+        expected_value = solve_kq_levenberg_marquardt(*known_data, (-29, -29), tolerance=80, damping=1e-5)
+        kq = kernels.solve_kq_levenberg_marquardt(*known_data, (-29, -29), tolerance=80, damping=1e-5)
+        np.testing.assert_allclose(kq, expected_value, atol=1e-8)
+
+    def test_solve_cornea_centers_wcs_batch(self):
+
+        known_data = (glints_1_wcs, glints_2_wcs, camera_wcs, light_1_wcs, light_2_wcs, 0.78, (52, 52))
+
+        expected_centers, expected_iterations, expected_converged = solve_cornea_centers_wcs_batch(*known_data)
+        centers, iterations, converged = kernels.solve_cornea_centers_wcs_batch(*known_data)
+
+        np.testing.assert_allclose(centers, expected_centers, atol=1e-10)
+        np.testing.assert_array_equal(iterations, expected_iterations)
+        np.testing.assert_array_equal(converged, expected_converged)
+
+        _, iterations, converged = kernels.solve_cornea_centers_wcs_batch(*known_data, max_iterations=1)
+        np.testing.assert_array_equal(iterations, [1, 1, 1])
+        np.testing.assert_array_equal(converged, [False, False, False])
+
+    def test_interpolate_map(self):
+
+        grid_values = np.random.RandomState(0).uniform(size=(4, 5, 2))
+        points = np.array([[0, 0], [3.7, 2.2], [8, 6], [8.5, 1], [-0.1, 1], [np.nan, 1]])
+
+        values = kernels.interpolate_map(points, grid_values, 2.)
+        np.testing.assert_allclose(values, interpolate_map(points, grid_values, 2.), atol=1e-12)
+        np.testing.assert_array_equal(values[0], grid_values[0, 0])
+        np.testing.assert_array_equal(values[2], grid_values[3, 4])
+        self.assertTrue(np.all(np.isnan(values[3:])))
+
+    def test_interpolate_grid(self):
+
+        axes = [np.array([0, 1, 3]), np.array([-1, 1]), np.array([0, 0.5, 1, 2])]
+        grid_values = np.random.RandomState(0).uniform(size=(3, 2, 4, 2))
+        points = np.array([[0, -1, 0], [3, 1, 2], [2.2, 0.3, 0.7], [1, 0, 1.5], [3.1, 0, 1], [np.nan, 0, 1]])
+
+        values = kernels.interpolate_grid(points, axes, grid_values)
+        np.testing.assert_allclose(values, interpolate_grid(points, axes, grid_values), atol=1e-12)
+        np.testing.assert_array_equal(values[0], grid_values[0, 0, 0])
+        np.testing.assert_array_equal(values[1], grid_values[2, 1, 3])
+        self.assertTrue(np.all(np.isnan(values[4:])))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=1)
@@ -0,0 +1,136 @@
+import unittest
+import numpy as np
+import time
+
+from src.camera_rig import CameraRig
+from src.calculate_point_of_interest import get_points_of_interest, get_point_of_interest
+from src.forward_simulator import simulate_random_frames
+from src.lens_distortion import distort_points, undistort_points_iterative, UndistortionMap
+from src.uncertainty import calculate_point_of_interest_jacobians
+from tests.integration_test import constants
+
+distortion_coefficients = (-0.3, 0.1, 0.001, -0.0005, 0.01)
+intrinsics = (1.2, 0.00048, 0.00048, 400, 300)
+
+
+class TestLensDistortion(unittest.TestCase):
+
+    def test_distort_points(self):
+
+        points = np.array([[400, 300], [323, 163], [0, 0], [799, 599]])
+
+        distorted_points = distort_points(points, distortion_coefficients, intrinsics)
+
+        # the principal point does not move, barrel distortion moves points towards it
+        np.testing.assert_array_almost_equal(distorted_points[0], [400, 300])
+        self.assertTrue(np.all(np.linalg.norm(distorted_points[1:] - (400, 300), axis=-1) <
+                               np.linalg.norm(points[1:] - (400, 300), axis=-1)))
+
+        np.testing.assert_array_almost_equal(undistort_points_iterative(distorted_points, distortion_coefficients,
+                                                                        intrinsics), points)
+
+        np.testing.assert_array_equal(distort_points(points, (0, 0, 0, 0, 0), intrinsics), points)
+
+    def test_undistortion_map(self):
+
+        undistortion_map = UndistortionMap.create(distortion_coefficients, intrinsics, (800, 600), step_px=2)
+        self.assertEqual(undistortion_map.undistorted_points.shape, (301, 401, 2))
+
+        points = np.random.RandomState(0).uniform((0, 0), (799, 599), size=(1000, 2))
+        expected_points = undistort_points_iterative(points, distortion_coefficients, intrinsics)
+        np.testing.assert_allclose(undistortion_map.undistort(points), expected_points, atol=1e-3)
+
+        # points outside of the sensor are undistorted iteratively, NaN stay NaN
+        points = np.array([[-20, 30], [900, 700], [np.nan, 5]])
+        undistorted_points = undistortion_map.undistort(points)
+        np.testing.assert_allclose(undistorted_points[:2],
+                                   undistort_points_iterative(points[:2], distortion_coefficients, intrinsics))
+        self.assertTrue(np.all(np.isnan(undistorted_points[2])))
+
+        # one point
+        np.testing.assert_allclose(undistortion_map.undistort(np.array([323, 163])),
+                                   undistort_points_iterative(np.array([323, 163]), distortion_coefficients,
+                                                              intrinsics), atol=1e-3)
+
+        with self.assertRaises(ValueError):
+            UndistortionMap.create(distortion_coefficients, intrinsics, (800, 600), step_px=0)
+
+    def test_rig(self):
+
+        rig = CameraRig.from_constants(constants)
+        self.assertIsNone(rig.undistortion_map)
+        points = np.array([[323, 163]])
+        self.assertIs(rig.undistort_points(points), points)
+
+        rig = CameraRig.from_constants(dict(constants, distortion_coefficients=distortion_coefficients[:4],
+                                            image_size=(640, 480)))
+        self.assertEqual(rig.distortion_coefficients, distortion_coefficients[:4] + (0.,))
+        self.assertEqual(rig.undistortion_map.undistorted_points.shape, (480, 640, 2))
+
+        # zero coefficients are an ideal pinhole
+        self.assertIsNone(CameraRig.from_constants(dict(constants, distortion_coefficients=(0, 0, 0, 0))).undistortion_map)
+
+        with self.assertRaises(ValueError):
+            CameraRig.from_constants(dict(constants, distortion_coefficients=(-0.3, 0.1)))
+
+    def test_pipeline(self):
+
+        rig = CameraRig.from_constants(dict(constants, distortion_coefficients=distortion_coefficients))
+        frames = simulate_random_frames(100, rig=rig)
+
+        points_of_interest = get_points_of_interest(frames.glints_ics[:, 0], frames.glints_ics[:, 1],
+                                                    frames.pupil_centers_ics, rig=rig)
+        np.testing.assert_allclose(points_of_interest[:, :2], frames.targets_scs[:, :2], atol=1e-3)
+
+        point_of_interest = get_point_of_interest(frames.glints_ics[0, 0], frames.glints_ics[0, 1],
+                                                  frames.pupil_centers_ics[0], rig=rig)
+        np.testing.assert_allclose(point_of_interest[:2], frames.targets_scs[0, :2], atol=1e-2)
+
+        # without the correction the error is much larger
+        points_of_interest = get_points_of_interest(frames.glints_ics[:, 0], frames.glints_ics[:, 1],
+                                                    frames.pupil_centers_ics, **constants)
+        self.assertGreater(np.max(np.abs(points_of_interest[:, :2] - frames.targets_scs[:, :2])), 0.05)
+
+    def test_constants_per_frame(self):
+
+        distorted_constants = dict(constants, distortion_coefficients=distortion_coefficients, image_size=(640, 480))
+        frames = simulate_random_frames(3, rig=CameraRig.from_constants(distorted_constants))
+
+        # the rig and its map are built once, not for every frame given with the constants
+        get_point_of_interest(frames.glints_ics[0, 0], frames.glints_ics[0, 1], frames.pupil_centers_ics[0],
+                              **distorted_constants)
+        start = time.perf_counter()
+        for index in range(1, 3):
+            point_of_interest = get_point_of_interest(frames.glints_ics[index, 0], frames.glints_ics[index, 1],
+                                                      frames.pupil_centers_ics[index], **distorted_constants)
+            np.testing.assert_allclose(point_of_interest[:2], frames.targets_scs[index, :2], atol=1e-2)
+        self.assertLess(time.perf_counter() - start, 0.1)
+
+        self.assertIs(UndistortionMap.create(distortion_coefficients, intrinsics, (640, 480)).undistorted_points,
+                      CameraRig.from_constants(distorted_constants).undistortion_map.undistorted_points)
+
+    def test_jacobians(self):
+
+        rig = CameraRig.from_constants(dict(constants, distortion_coefficients=distortion_coefficients))
+        frames = simulate_random_frames(3, rig=rig)
+        coordinates = np.concatenate([frames.glints_ics[:, 0], frames.glints_ics[:, 1], frames.pupil_centers_ics],
+                                     axis=-1)
+
+        def screen_points(coordinates):
+            return get_points_of_interest(coordinates[:, 0:2], coordinates[:, 2:4], coordinates[:, 4:6], rig=rig)[:, :2]
+
+        _, jacobians, _ = calculate_point_of_interest_jacobians(coordinates[:, 0:2], coordinates[:, 2:4],
+                                                                coordinates[:, 4:6], rig=rig)
+
+        # derivatives with respect to the distorted image coordinates
+        step = 0.01
+        for index in range(6):
+            shift = np.zeros(6)
+            shift[index] = step
+            np.testing.assert_allclose(jacobians[..., index],
+                                       (screen_points(coordinates + shift) - screen_points(coordinates - shift))/(2*step),
+                                       atol=1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=1)
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from src.lookup_table import GazeLookupTable, calculate_features, calculate_frames, interpolate_grid
+from src.camera_rig import CameraRig
+from src.forward_simulator import simulate_random_frames
+from src.calculate_point_of_interest import get_points_of_interest
+from tests.integration_test import constants
+
+
+def create_frames(frames_count, seed):
+    frames = simulate_random_frames(frames_count, head_box_cm=2, screen_area_cm=((-15, 15), (-20, 0)), seed=seed,
+                                    **constants)
+    return frames.glints_ics[:, 0], frames.glints_ics[:, 1], frames.pupil_centers_ics
+
+
+class TestLookupTable(unittest.TestCase):
+
+    def test_features(self):
+
+        glints_1_ics, glints_2_ics, pupil_centers_ics = create_frames(10, seed=0)
+
+        features = calculate_features(glints_1_ics, glints_2_ics, pupil_centers_ics)
+
+        self.assertEqual(features.shape, (10, 6))
+        for values, expected_values in zip(calculate_frames(features), (glints_1_ics, glints_2_ics, pupil_centers_ics)):
+            np.testing.assert_array_almost_equal(values, expected_values)
+
+    def test_interpolate_grid(self):
+
+        # multilinear functions are interpolated exactly
+        axes = [np.linspace(0, 1, 3), np.array([0, 2, 3]), np.linspace(-1, 1, 2)]
+        grid = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1)
+        grid_values = np.stack([grid[..., 0]*grid[..., 1]*grid[..., 2], grid[..., 0] - 2*grid[..., 2]], axis=-1)
+
+        points = np.random.RandomState(0).uniform((0, 0, -1), (1, 3, 1), size=(100, 3))
+        expected_values = np.stack([points[:, 0]*points[:, 1]*points[:, 2], points[:, 0] - 2*points[:, 2]], axis=-1)
+        np.testing.assert_array_almost_equal(interpolate_grid(points, axes, grid_values), expected_values)
+
+        self.assertTrue(np.all(np.isnan(interpolate_grid(np.array([[0, 3.5, 0]]), axes, grid_values))))
+
+    def test_lookup_table(self):
+
+        rig = CameraRig.from_constants(constants)
+        table = GazeLookupTable.from_frames(*create_frames(500, seed=0), grid_shape=(4, 4, 4, 2, 6, 6), rig=rig)
+
+        self.assertGreater(table.error_bound_cm, 0)
+        self.assertLess(table.error_bound_cm, 1)
+
+        frames = create_frames(500, seed=1)
+        points_of_interest = table.get_points_of_interest(*frames)
+        exact_points_of_interest = get_points_of_interest(*frames, rig=rig)
+
+        self.assertLess(table.number_of_fallbacks, len(points_of_interest))
+        np.testing.assert_array_almost_equal(points_of_interest[:, 2], rig.z_shift)
+        # the bound is measured on other frames, so a small excess is possible
+        self.assertLessEqual(np.max(np.linalg.norm(points_of_interest - exact_points_of_interest, axis=-1)),
+                             2 * table.error_bound_cm)
+
+    def test_fallback_outside_of_table(self):
+
+        rig = CameraRig.from_constants(constants)
+        table = GazeLookupTable.from_frames(*create_frames(100, seed=0), grid_shape=(2, 2, 2, 2, 2, 2), rig=rig)
+
+        # the integration test frame is far from the cornea centers of the table
+        glints_1_ics, glints_2_ics, pupil_centers_ics = np.array([[332., 164]]), np.array([[322., 169]]), \
+            np.array([[323., 163]])
+
+        self.assertTrue(np.all(np.isnan(table.interpolate(glints_1_ics, glints_2_ics, pupil_centers_ics))[:, :2]))
+
+        points_of_interest = table.get_points_of_interest(glints_1_ics, glints_2_ics, pupil_centers_ics)
+
+        self.assertEqual(table.number_of_fallbacks, 1)
+        np.testing.assert_array_almost_equal(points_of_interest,
+                                             get_points_of_interest(glints_1_ics, glints_2_ics, pupil_centers_ics,
+                                                                    rig=rig))
+
+    def test_save_and_load(self):
+
+        rig = CameraRig.from_constants(constants)
+        frames = create_frames(100, seed=0)
+        table = GazeLookupTable.from_frames(*frames, grid_shape=(3, 3, 3, 2, 3, 3), rig=rig)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'table.npz')
+            table.save(path)
+            loaded_table = GazeLookupTable.load(path, rig=rig)
+
+        self.assertEqual(loaded_table.error_bound_cm, table.error_bound_cm)
+        np.testing.assert_array_equal(loaded_table.get_points_of_interest(*frames), table.get_points_of_interest(*frames))
+
+    def test_wrong_bounds(self):
+
+        with self.assertRaises(ValueError):
+            GazeLookupTable.build(np.zeros(6), np.ones(6), grid_shape=(1, 2, 2, 2, 2, 2), **constants)
+        with self.assertRaises(ValueError):
+            GazeLookupTable.build(np.ones(6), np.ones(6), **constants)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import numpy as np
+import os
+import tempfile
+
+from src.calculate_point_of_interest import get_points_of_interest
+from src.frame_batch import FrameBatch
+from src.memmap_processing import open_frames, process_file
+from tests.integration_test import constants
+
+
+def create_frames(frames_count):
+    shifts = np.random.RandomState(0).uniform(-10, 10, size=(frames_count, 2))
+    return np.hstack([np.array([332, 164]) + shifts, np.array([313, 165]) + shifts, np.array([323, 163]) + shifts])
+
+
+class TestMemmapProcessing(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.frames = create_frames(100)
+        self.expected_points_of_interest = \
+            get_points_of_interest(self.frames[:, 0:2], self.frames[:, 2:4], self.frames[:, 4:6], **constants)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_npy_file(self):
+
+        self.frames[5] = np.nan
+        np.save(self.path('frames.npy'), self.frames)
+
+        points_of_interest = process_file(self.path('frames.npy'), self.path('output.npy'), chunk_size=16, **constants)
+
+        self.assertIsInstance(points_of_interest, np.memmap)
+        self.assertTrue(np.all(np.isnan(points_of_interest[5])))
+        valid = np.arange(100) != 5
+        np.testing.assert_array_almost_equal(points_of_interest[valid], self.expected_points_of_interest[valid])
+        np.testing.assert_array_equal(np.load(self.path('output.npy')), points_of_interest)
+
+    def test_raw_file(self):
+
+        self.frames.astype(np.float32).tofile(self.path('frames.bin'))
+
+        frames = open_frames(self.path('frames.bin'), raw_dtype=np.float32)
+        self.assertIsInstance(frames, np.memmap)
+        self.assertEqual(frames.shape, (100, 6))
+
+        points_of_interest = process_file(self.path('frames.bin'), self.path('output.npy'), chunk_size=30,
+                                          raw_dtype=np.float32, **constants)
+
+        expected_points_of_interest = get_points_of_interest(*np.split(self.frames.astype(np.float32), 3, axis=1),
+                                                             **constants)
+        np.testing.assert_array_almost_equal(points_of_interest, expected_points_of_interest)
+
+        with open(self.path('broken.bin'), 'wb') as broken_file:
+            broken_file.write(np.zeros(7).tobytes())
+        with self.assertRaises(ValueError):
+            open_frames(self.path('broken.bin'))
+
+    def test_frame_batch_file(self):
+
+        batch = FrameBatch.from_arrays(self.frames[:, 0:2], self.frames[:, 2:4], self.frames[:, 4:6])
+        batch.valid[3] = False
+        np.save(self.path('frames.npy'), batch.frames)
+
+        points_of_interest = process_file(self.path('frames.npy'), self.path('output.npy'), chunk_size=64, **constants)
+
+        self.assertTrue(np.all(np.isnan(points_of_interest[3])))
+        np.testing.assert_array_almost_equal(points_of_interest[4:], self.expected_points_of_interest[4:])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=1)
@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
-from src.rotation_matrix import calculate_rotation_matrix_extrinsic
+from src.rotation_matrix import calculate_rotation_matrix_extrinsic, memoize_rotation, \
+    rotation_cache_stats, clear_rotation_caches, _memoized_functions
 
 
 class TestRotateMatrix(unittest.TestCase):
@@ -49,6 +50,45 @@ class TestRotateMatrix(unittest.TestCase):
         rotation_matrix = calculate_rotation_matrix_extrinsic(alpha, beta, gamma)
         np.testing.assert_array_almost_equal(rotation_matrix, expected_value)
 
+    def test_rotation_cache(self):
+
+        clear_rotation_caches()
+        alpha, beta, gamma = np.radians((10, 20, 30))
+
+        first = calculate_rotation_matrix_extrinsic(alpha, beta, gamma)
+        second = calculate_rotation_matrix_extrinsic(alpha, beta, gamma)
+        self.assertIs(first, second)
+        self.assertFalse(first.flags.writeable)
+
+        stats = rotation_cache_stats()['src.rotation_matrix.calculate_rotation_matrix_extrinsic']
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['size'], 1)
+        self.assertAlmostEqual(stats['hit_rate'], 0.5)
+
+        clear_rotation_caches()
+        stats = rotation_cache_stats()['src.rotation_matrix.calculate_rotation_matrix_extrinsic']
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (0, 0, 0.0))
+
+    def test_memoize_rotation_maxsize(self):
+
+        @memoize_rotation(maxsize=2)
+        def rotation_about_z(angle):
+            return np.array([[np.cos(angle), -np.sin(angle), 0],
+                             [np.sin(angle),  np.cos(angle), 0],
+                             [0, 0, 1]])
+
+        name = '{}.{}'.format(rotation_about_z.__module__, rotation_about_z.__qualname__)
+        self.addCleanup(_memoized_functions.pop, name)
+
+        for angle in (0, 1, 2, 0):
+            rotation_about_z(angle)
+
+        stats = rotation_cache_stats()[name]
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['maxsize'], 2)
+        self.assertEqual(stats['misses'], 4)
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=1)
\ No newline at end of file
@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+import math
+
+from src.calculate_point_of_interest import get_points_of_interest
+from src.session_runner import Session, run_sessions
+from tests.integration_test import constants
+
+
+def create_session(session_id, number_of_frames, **subject_constants):
+    shift = np.linspace(-10, 10, number_of_frames)
+    glints_1 = np.stack([332 + shift, np.full(number_of_frames, 164.)], axis=-1)
+    glints_2 = np.stack([322 + shift, np.full(number_of_frames, 169.)], axis=-1)
+    pupils = np.stack([323 + shift, np.full(number_of_frames, 163.)], axis=-1)
+    return Session(session_id, dict(constants, **subject_constants), glints_1, glints_2, pupils)
+
+
+class TestSessionRunner(unittest.TestCase):
+
+    def test_run_sessions(self):
+
+        sessions = [create_session('subject-1', 20),
+                    create_session('subject-2', 5, alpha_right=math.radians(-4), R_cm=0.8),
+                    create_session('subject-3', 12, beta=math.radians(1))]
+
+        results = run_sessions(sessions, max_workers=2)
+
+        self.assertEqual([result.session_id for result in results], ['subject-1', 'subject-2', 'subject-3'])
+
+        for session, result in zip(sessions, results):
+            expected_points_of_interest = get_points_of_interest(session.glints_1_ics,
+                                                                 session.glints_2_ics,
+                                                                 session.pupil_centers_ics,
+                                                                 **session.constants)
+            np.testing.assert_array_almost_equal(result.points_of_interest, expected_points_of_interest)
+            self.assertEqual(result.number_of_frames, len(session.glints_1_ics))
+            self.assertGreater(result.frames_per_second, 0)
+
+        # sessions differ in their constants
+        self.assertFalse(np.allclose(results[0].points_of_interest[:5], results[1].points_of_interest))
+
+    def test_run_sessions_frame_by_frame(self):
+
+        sessions = [create_session('subject-1', 3)]
+
+        vectorized_results = run_sessions(sessions, max_workers=1)
+        results = run_sessions(sessions, max_workers=1, vectorized=False)
+
+        np.testing.assert_allclose(results[0].points_of_interest, vectorized_results[0].points_of_interest, atol=1e-2)
+
+    def test_invalid_constants(self):
+
+        with self.assertRaises(ValueError):
+            run_sessions([create_session('subject-1', 3, R_cm=-1)], max_workers=1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=1)
@@ -0,0 +1,129 @@
+import unittest
+import numpy as np
+
+from src.smoothing import KalmanFilter, OneEuroFilter, GazeRayFilter
+from src.camera_rig import CameraRig
+from src.calculate_point_of_interest import get_gaze_rays, get_points_of_interest
+from tests.integration_test import constants
+
+
+def create_fixations(frames_count=600, noise_std=0.3, seed=0):
+    """
+    Two fixations with a saccade in the middle, points of interest with noise.
+    """
+    points_of_interest = np.zeros((frames_count, 2))
+    points_of_interest[frames_count//2:] = [20, 5]
+    noise = np.random.RandomState(seed).normal(scale=noise_std, size=points_of_interest.shape)
+    return points_of_interest, points_of_interest + noise
+
+
+class TestSmoothing(unittest.TestCase):
+
+    def test_filters_reduce_noise(self):
+
+        points_of_interest, noisy_points_of_interest = create_fixations()
+        fixations = np.r_[50:290, 350:600]
+
+        def rms_error(values):
+            return np.sqrt(np.mean(np.square(values[fixations] - points_of_interest[fixations])))
+
+        for smoothing_filter in (KalmanFilter(), OneEuroFilter()):
+            filtered_points_of_interest = smoothing_filter.filter(noisy_points_of_interest)
+
+            self.assertEqual(filtered_points_of_interest.shape, noisy_points_of_interest.shape)
+            self.assertLess(rms_error(filtered_points_of_interest), 0.7 * rms_error(noisy_points_of_interest))
+            # the saccade is followed within a few frames
+            np.testing.assert_allclose(filtered_points_of_interest[320], [20, 5], atol=1)
+
+    def test_kalman_filter_follows_constant_velocity(self):
+
+        timestamps = np.arange(200) / 60.
+        positions = np.stack([10 * timestamps, -5 * timestamps, 3 + 0 * timestamps], axis=-1)
+
+        filtered_positions = KalmanFilter().filter(positions, timestamps)
+
+        np.testing.assert_allclose(filtered_positions[100:], positions[100:], atol=1e-3)
+
+    def test_update_and_filter_are_the_same(self):
+
+        _, noisy_points_of_interest = create_fixations(100)
+
+        for filter_class in (KalmanFilter, OneEuroFilter):
+            filtered_points_of_interest = filter_class().filter(noisy_points_of_interest)
+
+            smoothing_filter = filter_class()
+            updated_points_of_interest = [smoothing_filter.update(point) for point in noisy_points_of_interest[:50]]
+            # a batch continues from the state of the previous frames
+            updated_points_of_interest.extend(smoothing_filter.filter(noisy_points_of_interest[50:]))
+
+            np.testing.assert_array_almost_equal(updated_points_of_interest, filtered_points_of_interest)
+
+            smoothing_filter.reset()
+            np.testing.assert_array_almost_equal(smoothing_filter.filter(noisy_points_of_interest),
+                                                 filtered_points_of_interest)
+
+    def test_missing_frames(self):
+
+        timestamps = np.arange(10) / 60.
+        positions = np.stack([10 * timestamps, 2 + 0 * timestamps], axis=-1)
+        positions[6] = np.nan
+
+        kalman_filtered_positions = KalmanFilter(measurement_std=1e-3).filter(positions, timestamps)
+        one_euro_filtered_positions = OneEuroFilter().filter(positions, timestamps)
+
+        # Kalman filter predicts the missing frame, One Euro filter skips it
+        np.testing.assert_allclose(kalman_filtered_positions[6], [1, 2], atol=1e-2)
+        self.assertTrue(np.all(np.isnan(one_euro_filtered_positions[6])))
+        self.assertTrue(np.all(np.isfinite(one_euro_filtered_positions[7:])))
+
+    def test_timestamps_not_increasing(self):
+
+        # no time elapsed: One Euro filter keeps its state, Kalman filter corrects without prediction
+        one_euro_filter = OneEuroFilter()
+        one_euro_filter.update([1, 2], 0.)
+        np.testing.assert_array_equal(one_euro_filter.update([1.5, 2], 0.), [1, 2])
+        np.testing.assert_array_equal(one_euro_filter.update([1.5, 2], -1/60.), [1, 2])
+        self.assertTrue(np.all(np.isfinite(one_euro_filter.update([1.5, 2], 1/60.))))
+
+        timestamps = np.array([0, 1, 2, 2, 1, 3, 4]) / 60.
+        positions = np.stack([10 * timestamps, 2 + 0 * timestamps], axis=-1)
+        kalman_filter = KalmanFilter(measurement_std=1e-3)
+        filtered_positions = kalman_filter.filter(positions, timestamps)
+
+        self.assertTrue(np.all(np.isfinite(filtered_positions)))
+        self.assertEqual(kalman_filter.last_timestamp[0], 4/60.)
+        self.assertGreater(kalman_filter.covariance[0], 0)
+        self.assertGreater(kalman_filter.covariance[2], 0)
+        np.testing.assert_allclose(filtered_positions[-1], positions[-1], atol=1e-2)
+
+    def test_wrong_values(self):
+
+        smoothing_filter = KalmanFilter()
+        smoothing_filter.update([1, 2])
+
+        with self.assertRaises(ValueError):
+            smoothing_filter.update([1, 2, 3])
+        with self.assertRaises(ValueError):
+            OneEuroFilter(frame_interval=0)
+
+    def test_gaze_ray_filter(self):
+
+        rig = CameraRig.from_constants(constants)
+        glints_1_ics = np.tile([332., 164], (30, 1))
+        glints_2_ics = np.tile([313., 165], (30, 1))
+        pupil_centers_ics = np.tile([323., 163], (30, 1))
+
+        centers_scs, visual_axes_scs = get_gaze_rays(glints_1_ics, glints_2_ics, pupil_centers_ics, rig=rig)
+        gaze_ray_filter = GazeRayFilter(KalmanFilter(), OneEuroFilter(), rig.z_shift)
+
+        # gaze rays of a steady eye stay the same
+        np.testing.assert_array_almost_equal(gaze_ray_filter.filter(centers_scs, visual_axes_scs),
+                                             get_points_of_interest(glints_1_ics, glints_2_ics, pupil_centers_ics,
+                                                                    rig=rig))
+        np.testing.assert_array_almost_equal(gaze_ray_filter.update(centers_scs[0], visual_axes_scs[0]),
+                                             get_points_of_interest(glints_1_ics, glints_2_ics, pupil_centers_ics,
+                                                                    rig=rig)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import numpy as np
+import math
+from itertools import count
+
+from src.camera_rig import CameraRig
+from src.calculate_point_of_interest import get_points_of_interest
+from src.streaming import iterate_chunks, stream_points_of_interest, stream_frame_batches
+from tests.integration_test import constants
+
+
+def generate_frames(number_of_frames=None):
+    """
+    Generates frames with glints and pupil moving slowly over the image, infinitely if number_of_frames is None.
+    """
+    frames = count() if number_of_frames is None else range(number_of_frames)
+    for index in frames:
+        shift = 10 * math.sin(index / 50.)
+        yield (332 + shift, 164), (322 + shift, 169), (323 + shift, 163), index / 60.
+
+
+class TestStreaming(unittest.TestCase):
+
+    def test_iterate_chunks(self):
+
+        chunks = list(iterate_chunks(range(7), 3))
+        self.assertEqual(chunks, [[0, 1, 2], [3, 4, 5], [6]])
+
+        self.assertEqual(list(iterate_chunks([], 3)), [])
+
+        with self.assertRaises(ValueError):
+            list(iterate_chunks(range(7), 0))
+
+    def test_stream_points_of_interest(self):
+
+        frames = list(generate_frames(10))
+        chunks = list(stream_points_of_interest(iter(frames), chunk_size=4, **constants))
+
+        self.assertEqual([len(chunk.timestamps) for chunk in chunks], [4, 4, 2])
+        self.assertEqual([chunk.points_of_interest.shape for chunk in chunks], [(4, 3), (4, 3), (2, 3)])
+
+        glints_1, glints_2, pupils, timestamps = (np.array(values) for values in zip(*frames))
+        expected_points_of_interest = get_points_of_interest(glints_1, glints_2, pupils, **constants)
+
+        np.testing.assert_array_almost_equal(np.concatenate([chunk.timestamps for chunk in chunks]), timestamps)
+        np.testing.assert_array_almost_equal(np.concatenate([chunk.points_of_interest for chunk in chunks]),
+                                             expected_points_of_interest)
+
+    def test_stream_is_lazy(self):
+
+        # infinite source: the first chunk should be ready after reading chunk_size frames
+        rig = CameraRig.from_constants(constants)
+        stream = stream_points_of_interest(generate_frames(), chunk_size=8, rig=rig)
+
+        first_chunk = next(stream)
+        second_chunk = next(stream)
+
+        np.testing.assert_array_almost_equal(first_chunk.timestamps, np.arange(8) / 60.)
+        np.testing.assert_array_almost_equal(second_chunk.timestamps, np.arange(8, 16) / 60.)
+
+    def test_stream_frame_batches(self):
+
+        frames = list(generate_frames(5))
+        frames[2] = (None,) + frames[2][1:]
+
+        batches = list(stream_frame_batches(frames, chunk_size=3, **constants))
+
+        self.assertEqual([len(batch) for batch in batches], [3, 2])
+        np.testing.assert_array_equal(batches[0].valid, [True, True, False])
+        self.assertTrue(np.all(np.isnan(batches[0].points_of_interest[2])))
+        self.assertFalse(np.any(np.isnan(batches[1].points_of_interest)))
+
+        # points given as arrays, a NaN pupil is invalid as well
+        frames = [(np.array(glint_1), np.array(glint_2), np.array(pupil), timestamp)
+                  for glint_1, glint_2, pupil, timestamp in generate_frames(3)]
+        frames[1] = frames[1][:2] + (np.array([np.nan, np.nan]), frames[1][3])
+
+        batch, = stream_frame_batches(frames, chunk_size=3, **constants)
+        np.testing.assert_array_equal(batch.valid, [True, False, True])
+        np.testing.assert_array_almost_equal(batch.timestamps, np.arange(3) / 60.)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=1)
@@ -0,0 +1,98 @@
+import unittest
+import numpy as np
+
+from src.camera_rig import CameraRig
+from src.binocular import stack_eye_models
+from src.calculate_point_of_interest import get_points_of_interest
+from src.forward_simulator import simulate_random_frames
+from src.uncertainty import calculate_point_of_interest_jacobians, calculate_image_covariance, \
+    get_points_of_interest_covariances, get_point_of_interest_covariance
+from src.validity import VALID, MISSING_INPUT
+from tests.integration_test import constants
+
+
+def image_coordinates(rig, frames_count):
+    frames = simulate_random_frames(frames_count, rig=rig)
+    return np.concatenate([frames.glints_ics[:, 0], frames.glints_ics[:, 1], frames.pupil_centers_ics], axis=-1)
+
+
+def screen_points(coordinates, rig):
+    return get_points_of_interest(coordinates[:, 0:2], coordinates[:, 2:4], coordinates[:, 4:6], rig=rig)[:, :2]
+
+
+class TestUncertainty(unittest.TestCase):
+
+    def test_jacobians(self):
+
+        rig = CameraRig.from_constants(constants)
+        coordinates = image_coordinates(rig, 5)
+
+        points_of_interest, jacobians, reasons = \
+            calculate_point_of_interest_jacobians(coordinates[:, 0:2], coordinates[:, 2:4], coordinates[:, 4:6], rig=rig)
+
+        np.testing.assert_array_equal(reasons, VALID)
+        np.testing.assert_array_almost_equal(points_of_interest[:, :2], screen_points(coordinates, rig))
+
+        # central differences of the whole pipeline, which solves for the cornea center every time
+        step = 0.01
+        expected_jacobians = np.empty((5, 2, 6))
+        for index in range(6):
+            shift = np.zeros(6)
+            shift[index] = step
+            expected_jacobians[..., index] = \
+                (screen_points(coordinates + shift, rig) - screen_points(coordinates - shift, rig))/(2*step)
+
+        np.testing.assert_allclose(jacobians, expected_jacobians, atol=1e-4)
+
+    def test_monte_carlo(self):
+
+        rig = CameraRig.from_constants(constants)
+        coordinates = image_coordinates(rig, 1)[0]
+
+        point_of_interest, covariance = \
+            get_point_of_interest_covariance(coordinates[0:2], coordinates[2:4], coordinates[4:6],
+                                             glint_std_px=0.2, pupil_std_px=0.5, rig=rig)
+
+        samples = coordinates + np.random.RandomState(0).normal(size=(4000, 6)) * np.array([0.2] * 4 + [0.5] * 2)
+        expected_covariance = np.cov(screen_points(samples, rig).T)
+
+        np.testing.assert_array_almost_equal(point_of_interest[:2], screen_points(coordinates[np.newaxis], rig)[0])
+        np.testing.assert_allclose(covariance, expected_covariance, atol=0.1*np.trace(expected_covariance))
+
+    def test_covariances(self):
+
+        rig = CameraRig.from_constants(constants)
+        coordinates = image_coordinates(rig, 4)
+        coordinates[1, 4] = np.nan
+
+        points_of_interest, covariances = \
+            get_points_of_interest_covariances(coordinates[:, 0:2], coordinates[:, 2:4], coordinates[:, 4:6],
+                                               rig=rig)
+
+        self.assertEqual(covariances.shape, (4, 2, 2))
+        self.assertTrue(np.all(np.isnan(covariances[1])))
+        self.assertTrue(np.all(np.isnan(points_of_interest[1])))
+
+        valid = [0, 2, 3]
+        np.testing.assert_array_almost_equal(covariances[valid], np.swapaxes(covariances[valid], -1, -2))
+        self.assertTrue(np.all(np.linalg.eigvalsh(covariances[valid]) > 0))
+
+        # a given covariance of image coordinates, per frame
+        image_covariances = np.repeat(calculate_image_covariance(0.4, 1.)[np.newaxis], 4, axis=0)
+        _, scaled_covariances = \
+            get_points_of_interest_covariances(coordinates[:, 0:2], coordinates[:, 2:4], coordinates[:, 4:6],
+                                               image_covariances=image_covariances, rig=rig)
+        np.testing.assert_array_almost_equal(scaled_covariances[valid], 4*covariances[valid])
+
+        # parameters of the eye per frame
+        eye_rig = rig._replace(eye=stack_eye_models([rig.eye], [4]))
+        _, jacobians, reasons = calculate_point_of_interest_jacobians(coordinates[:, 0:2], coordinates[:, 2:4],
+                                                                      coordinates[:, 4:6], rig=eye_rig)
+        np.testing.assert_array_equal(reasons, [VALID, MISSING_INPUT, VALID, VALID])
+        _, expected_jacobians, _ = calculate_point_of_interest_jacobians(coordinates[:, 0:2], coordinates[:, 2:4],
+                                                                         coordinates[:, 4:6], rig=rig)
+        np.testing.assert_array_almost_equal(jacobians[valid], expected_jacobians[valid])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=1)
@@ -0,0 +1,112 @@
+import unittest
+import numpy as np
+import math
+
+from src.camera_rig import CameraRig
+from src.binocular import stack_eye_models
+from src.calculate_optic_axis import calculate_kr
+from src.calculate_point_of_interest import get_points_of_interest, get_points_of_interest_and_reasons, \
+    get_point_of_interest, get_points_of_interest_multiple_lights_and_reasons
+from src.forward_simulator import simulate_random_frames, project_to_image_batch
+from src.frame_batch import FrameBatch
+from src.validity import VALID, MISSING_INPUT, PUPIL_RAY_MISSES_CORNEA, PUPIL_NOT_REACHED, VISUAL_AXIS_MISSES_SCREEN, \
+    count_reasons
+from tests.integration_test import constants
+
+
+def damaged_frames(rig):
+    """
+    Simulated frames, where frame 0 misses glint 1, frame 1 misses the pupil,
+    pupil of frame 2 is far from the cornea and pupil of frame 3 is close to its edge
+    (the refracted ray is almost tangent to the cornea and does not reach the pupil).
+    """
+    frames = simulate_random_frames(6, rig=rig)
+    glints_1, glints_2, pupils = frames.glints_ics[:, 0].copy(), frames.glints_ics[:, 1].copy(), \
+        frames.pupil_centers_ics.copy()
+    glints_1[0] = np.nan
+    pupils[1] = np.nan
+    pupils[2] += 300
+    edge_direction = np.cross(frames.cornea_centers_wcs[3], [0, 1, 0])
+    edge_wcs = frames.cornea_centers_wcs[3] + 0.95*rig.eye.R_cm*edge_direction/np.linalg.norm(edge_direction)
+    pupils[3] = project_to_image_batch(edge_wcs, rig.camera_position_wcs, rig.intrinsics)
+    return frames, glints_1, glints_2, pupils
+
+
+class TestValidity(unittest.TestCase):
+
+    def test_reasons(self):
+
+        rig = CameraRig.from_constants(constants)
+        frames, glints_1, glints_2, pupils = damaged_frames(rig)
+
+        points_of_interest, reasons = get_points_of_interest_and_reasons(glints_1, glints_2, pupils, rig=rig)
+
+        np.testing.assert_array_equal(reasons, [MISSING_INPUT, MISSING_INPUT, PUPIL_RAY_MISSES_CORNEA,
+                                                PUPIL_NOT_REACHED, VALID, VALID])
+        self.assertTrue(np.all(np.isnan(points_of_interest[:4])))
+
+        # valid frames are calculated as without the invalid ones
+        np.testing.assert_array_almost_equal(points_of_interest[4:],
+                                             get_points_of_interest(glints_1[4:], glints_2[4:], pupils[4:], rig=rig))
+        np.testing.assert_array_almost_equal(points_of_interest[4:, :2], frames.targets_scs[4:, :2])
+
+        self.assertEqual(count_reasons(reasons), {'missing_input': 2, 'pupil_ray_misses_cornea': 1,
+                                                  'pupil_not_reached': 1, 'valid': 2})
+
+    def test_visual_axis_misses_screen(self):
+
+        # the screen is behind the eye
+        rig = CameraRig.from_constants(dict(constants, z_shift=100))
+        frames = simulate_random_frames(3, rig=CameraRig.from_constants(constants))
+
+        points_of_interest, reasons = get_points_of_interest_and_reasons(frames.glints_ics[:, 0],
+                                                                         frames.glints_ics[:, 1],
+                                                                         frames.pupil_centers_ics, rig=rig)
+
+        np.testing.assert_array_equal(reasons, VISUAL_AXIS_MISSES_SCREEN)
+        self.assertTrue(np.all(np.isnan(points_of_interest)))
+
+    def test_eye_per_frame(self):
+
+        rig = CameraRig.from_constants(constants)
+        frames, glints_1, glints_2, pupils = damaged_frames(rig)
+
+        # parameters of the eye per frame are selected together with the valid frames
+        eye_rig = rig._replace(eye=stack_eye_models([rig.eye], [len(pupils)]))
+        points_of_interest, reasons = get_points_of_interest_and_reasons(glints_1, glints_2, pupils, rig=eye_rig)
+
+        np.testing.assert_array_equal(reasons[4:], VALID)
+        np.testing.assert_array_almost_equal(points_of_interest[4:, :2], frames.targets_scs[4:, :2])
+
+    def test_no_exceptions(self):
+
+        rig = CameraRig.from_constants(constants)
+        _, glints_1, glints_2, pupils = damaged_frames(rig)
+
+        # negative discriminant of formula 3.29
+        self.assertTrue(math.isnan(calculate_kr(np.zeros(3), np.array([1., 1., -1.2]), np.array([0., 0., 52.]), 0.78)))
+
+        self.assertTrue(np.all(np.isnan(get_point_of_interest(glints_1[2], glints_2[2], pupils[2], rig=rig))))
+
+        batch = FrameBatch.from_arrays(glints_1, glints_2, pupils).process(rig)
+        np.testing.assert_array_equal(batch.reasons, [MISSING_INPUT, MISSING_INPUT, PUPIL_RAY_MISSES_CORNEA,
+                                                      PUPIL_NOT_REACHED, VALID, VALID])
+        np.testing.assert_array_equal(batch.valid, [False, False, False, False, True, True])
+
+    def test_multiple_lights(self):
+
+        rig = CameraRig.from_constants(dict(constants, light_3_wcs=np.array([0, -15, 0])))
+        frames, _, _, pupils = damaged_frames(rig)
+        glints = frames.glints_ics.copy()
+        glints[0, 2] = np.nan
+
+        points_of_interest, reasons = get_points_of_interest_multiple_lights_and_reasons(glints, pupils, rig=rig)
+
+        np.testing.assert_array_equal(reasons, [MISSING_INPUT, MISSING_INPUT, PUPIL_RAY_MISSES_CORNEA,
+                                                PUPIL_NOT_REACHED, VALID, VALID])
+        self.assertTrue(np.all(np.isnan(points_of_interest[:4])))
+        np.testing.assert_array_almost_equal(points_of_interest[4:, :2], frames.targets_scs[4:, :2])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=1)